@@ -8,7 +8,7 @@ from soa_service_base import SOAServiceBase
 from database_client import DatabaseClient
 
 class AuthService(SOAServiceBase):
-    def __init__(self, host: str = 'localhost', port: int = 0, proxy_url: str = "https://d1-database-proxy.maliagapacheco.workers.dev/query"):
+    def __init__(self, host: str = 'localhost', port: int = 0, proxy_url: Optional[str] = None):
         super().__init__(
             service_name="AUTH_",
             host=host,
@@ -532,7 +532,7 @@ def main():
             print("Puerto inválido, usando puerto automático")
     
     # Permitir especificar URL del proxy
-    proxy_url = "https://d1-database-proxy.maliagapacheco.workers.dev/query"
+    proxy_url = None
     if len(sys.argv) > 2:
         proxy_url = sys.argv[2]
     
@@ -541,7 +541,7 @@ def main():
     
     print(f"\n🔐 SERVICIO DE AUTENTICACIÓN JWT")
     print(f"===============================")
-    print(f"Base de datos: {proxy_url}")
+    print(f"Base de datos: {service.db.proxy_url}")
     print(f"Puerto: {service.port}")
     print(f"Métodos disponibles: {', '.join(service.get_available_methods())}")
     print(f"Usuario por defecto: admin@mail.udp.cl / admin123")
@@ -113,7 +113,7 @@ class CommentService(SOAServiceBase):
         """Obtiene información de un usuario por ID"""
         try:
             query = "SELECT id_usuario, email, rol FROM USUARIO WHERE id_usuario = ?"
-            result = self.db_client.execute_query(query, [user_id])
+            result = self.db_client.execute_query(query, [user_id], cache_ttl=30)
             
             if result.get('success') and result.get('results'):
                 user_data = result['results'][0]
@@ -148,7 +148,7 @@ class CommentService(SOAServiceBase):
         try:
             self.logger.info(f"Buscando post con ID: {id_post} (tipo: {type(id_post)})")
             query = "SELECT id_post, contenido FROM POST WHERE id_post = ?"
-            result = self.db_client.execute_query(query, [id_post])
+            result = self.db_client.execute_query(query, [id_post], cache_ttl=10)
             
             self.logger.info(f"Resultado consulta post: {result}")
             
@@ -260,6 +260,14 @@ class CommentService(SOAServiceBase):
                 autor_email = user_info['user']['email'] if user_info.get('success') else 'Desconocido'
                 
                 self.logger.info(f"💬 Comentario creado en post {id_post_int} por {autor_email} con ID {comment_id}")
+                # Las notificaciones a los suscriptores del post las crea NOTIF al recibir el evento
+                self.publish_event("comment.created", {
+                    "id_comentario": comment_id,
+                    "id_post": id_post_int,
+                    "post_contenido": post_check['post'].get('contenido'),
+                    "autor_id": autor_id,
+                    "autor_email": autor_email
+                })
                 return json.dumps({
                     "success": True, 
                     "message": "Comentario creado exitosamente",
@@ -656,6 +664,7 @@ class CommentService(SOAServiceBase):
             "database": "Cloudflare D1 (remota)",
             "table": "COMENTARIO",
             "authentication": "JWT Token required",
+            "db_cache": self.db_client.cache_stats(),
             "port": self.port,
             "host": self.host,
             "methods": list(self.methods.keys()) if hasattr(self, 'methods') else [],
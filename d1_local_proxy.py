@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Sustituto local del proxy HTTP de Cloudflare D1 para pruebas de carga. Atiende POST /query con el mismo contrato
+que espera DatabaseClient ({"query", "params"} o {"batch": [...]} de entrada, {"success", "data", "meta"} de
+salida) sobre un fichero SQLite, y permite inyectar latencia, errores y un límite de peticiones por segundo para
+reproducir en un portátil las colas de latencia de producción.
+
+    python d1_local_proxy.py --port 8787 --latency lognormal:20:250 --http-error-rate 0.01 --max-rps 200
+    DB_PROXY_URL=http://localhost:8787/query python forum_service.py
+
+GET /stats devuelve los contadores y los percentiles de latencia de todas las respuestas y de cada tipo de respuesta
+(ok, db_error, 503, 429, dropped).
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+from database_client import SQLiteBackend
+from soa_resilience import TokenBucket
+
+logger = logging.getLogger('D1LocalProxy')
+
+class LatencyModel:
+    """
+    Latencia artificial en milisegundos, descrita como "tipo:parámetros":
+    none, const:ms, uniform:min:max, normal:media:desviación o lognormal:p50:p99 (la cola larga típica de D1)
+    """
+
+    def __init__(self, spec: str = "none", rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+
+        kind, *args = spec.split(":")
+        try:
+            values = [float(arg) for arg in args]
+        except ValueError:
+            raise ValueError(f"Parámetros de latencia inválidos: {spec}")
+
+        expected = {"none": 0, "const": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(f"Latencia desconocida: {spec} (none, const:ms, uniform:min:max, "
+                             f"normal:media:desv, lognormal:p50:p99)")
+        if kind == "lognormal" and not 0 < values[0] <= values[1]:
+            raise ValueError(f"lognormal necesita 0 < p50 <= p99: {spec}")
+
+        self.kind = kind
+        self.values = values
+
+    def sample(self) -> float:
+        """Devuelve una latencia en segundos"""
+        if self.kind == "none":
+            return 0.0
+        if self.kind == "const":
+            ms = self.values[0]
+        elif self.kind == "uniform":
+            ms = self.rng.uniform(*self.values)
+        elif self.kind == "normal":
+            ms = self.rng.gauss(*self.values)
+        else:
+            # El p99 de una lognormal está 2.326 desviaciones por encima de la mediana
+            p50, p99 = self.values
+            ms = self.rng.lognormvariate(math.log(p50), math.log(p99 / p50) / 2.326)
+        return max(ms, 0.0) / 1000
+
+class LocalD1Proxy:
+    """Estado compartido del proxy: backend SQLite, inyección de fallos, límite de ritmo y métricas"""
+
+    LATENCY_STATUSES = ("ok", "db_error", "503", "429", "dropped")
+
+    def __init__(self, sqlite_path: str = "soa_local.db", latency: str = "none", http_error_rate: float = 0.0,
+                 db_error_rate: float = 0.0, drop_rate: float = 0.0, max_rps: float = 0.0, burst: float = 0.0,
+                 max_queue_wait: float = 1.0, max_concurrent: int = 0, seed: Optional[int] = None):
+        self.backend = SQLiteBackend(sqlite_path)
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self.rng)
+
+        self.http_error_rate = http_error_rate
+        self.db_error_rate = db_error_rate
+        self.drop_rate = drop_rate
+
+        # Las peticiones por encima de max_rps esperan su turno; si la espera supera max_queue_wait, 429
+        self.bucket = TokenBucket(max_rps, burst or max(max_rps, 1.0)) if max_rps > 0 else None
+        self.max_queue_wait = max_queue_wait
+        # D1 ejecuta las consultas de una base de datos de una en una; max_concurrent=1 lo reproduce
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+
+        self._lock = threading.Lock()
+        # Latencia de cada respuesta por tipo: un 429 rápido o un corte tras la espera también son cola que ve el cliente
+        self._latencies: "Dict[str, deque[float]]" = {status: deque(maxlen=10000) for status in self.LATENCY_STATUSES}
+        self.counters = {"requests": 0, "ok": 0, "db_errors": 0, "http_errors": 0, "dropped": 0, "throttled": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _record_latency(self, status: str, started: float):
+        with self._lock:
+            self._latencies[status].append(time.perf_counter() - started)
+
+    def _throttle(self) -> bool:
+        """Espera el turno que marca max_rps; devuelve False si habría que esperar demasiado"""
+        if self.bucket is None:
+            return True
+        with self._lock:
+            wait = self.bucket.take(time.monotonic())
+            if wait > self.max_queue_wait:
+                return False
+            if wait > 0:
+                # Se reserva el token aunque aún no exista: las siguientes peticiones calculan su espera detrás
+                self.bucket.tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def serve(self, payload: Dict[str, Any]) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Atiende una petición del contrato /query. Devuelve (estado HTTP, cuerpo); cuerpo None = cortar conexión"""
+        started = time.perf_counter()
+        self._count("requests")
+
+        if not self._throttle():
+            self._count("throttled")
+            self._record_latency("429", started)
+            return 429, {"success": False, "error": "Too many requests"}
+
+        time.sleep(self.latency.sample())
+
+        roll = self.rng.random()
+        if roll < self.drop_rate:
+            self._count("dropped")
+            self._record_latency("dropped", started)
+            return 0, None
+        roll -= self.drop_rate
+        if roll < self.http_error_rate:
+            self._count("http_errors")
+            self._record_latency("503", started)
+            return 503, {"success": False, "error": "Injected upstream error"}
+        roll -= self.http_error_rate
+        if roll < self.db_error_rate:
+            self._count("db_errors")
+            self._record_latency("db_error", started)
+            return 200, {"success": False, "error": "D1_ERROR: injected failure"}
+
+        if self._slots is not None:
+            with self._slots:
+                result = self.backend.handle(payload)
+        else:
+            result = self.backend.handle(payload)
+
+        self._count("ok" if result.get("success") else "db_errors")
+        self._record_latency("ok" if result.get("success") else "db_error", started)
+        return 200, result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_status = {status: sorted(latencies) for status, latencies in self._latencies.items()}
+            counters = dict(self.counters)
+
+        def summary(latencies: List[float]) -> Dict[str, Any]:
+            def percentile(p: float) -> Optional[float]:
+                if not latencies:
+                    return None
+                return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+            return {"count": len(latencies), "p50": percentile(0.50), "p90": percentile(0.90),
+                    "p99": percentile(0.99), "max": percentile(1.0)}
+
+        return {
+            "latency_model": self.latency.spec,
+            "counters": counters,
+            "latency_ms": summary(sorted(latency for latencies in by_status.values() for latency in latencies)),
+            "latency_ms_by_status": {status: summary(latencies) for status, latencies in by_status.items()},
+            "backend": self.backend.stats()
+        }
+
+def make_handler(proxy: LocalD1Proxy):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 para que las sesiones keep-alive de DatabaseClient reutilicen la conexión
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _reply(self, status: int, body: Dict[str, Any]):
+            data = json.dumps(body, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                self._reply(200, proxy.stats())
+            else:
+                self._reply(404, {"success": False, "error": "Not found"})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path.rstrip("/") != "/query":
+                self._reply(404, {"success": False, "error": "Not found"})
+                return
+            try:
+                payload = json.loads(body)
+                if not isinstance(payload, dict) or not ("query" in payload or isinstance(payload.get("batch"), list)):
+                    raise ValueError("se esperaba 'query' o 'batch'")
+            except ValueError as e:
+                self._reply(400, {"success": False, "error": f"Invalid request: {e}"})
+                return
+
+            status, result = proxy.serve(payload)
+            if result is None:
+                # Fallo de red simulado: se cierra la conexión sin responder
+                self.close_connection = True
+                return
+            self._reply(status, result)
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy D1 local sobre SQLite con latencia y fallos inyectados")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--db", default="soa_local.db", help="Fichero SQLite")
+    parser.add_argument("--latency", default="none",
+                        help="none, const:ms, uniform:min:max, normal:media:desv o lognormal:p50:p99")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="Fracción de respuestas 503")
+    parser.add_argument("--db-error-rate", type=float, default=0.0, help="Fracción de respuestas success=false")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fracción de conexiones cortadas sin respuesta")
+    parser.add_argument("--max-rps", type=float, default=0.0, help="Peticiones por segundo (0 = sin límite)")
+    parser.add_argument("--burst", type=float, default=0.0, help="Ráfaga admitida sobre max-rps")
+    parser.add_argument("--max-queue-wait", type=float, default=1.0, help="Espera máxima por turno antes de 429")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="Consultas simultáneas (0 = sin límite)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    proxy = LocalD1Proxy(sqlite_path=args.db, latency=args.latency, http_error_rate=args.http_error_rate,
+                         db_error_rate=args.db_error_rate, drop_rate=args.drop_rate, max_rps=args.max_rps,
+                         burst=args.burst, max_queue_wait=args.max_queue_wait, max_concurrent=args.max_concurrent,
+                         seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(proxy))
+    server.daemon_threads = True
+
+    print(f"🗄️ Proxy D1 local en http://{args.host}:{args.port}/query (BD: {args.db}, latencia: {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Deteniendo...")
+    finally:
+        server.server_close()
+        print(json.dumps(proxy.stats(), indent=2))
+        proxy.backend.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,528 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
 import requests
 import json
 import logging
-from typing import Dict, Any, List, Optional, Union
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
+class HTTPSessionPool:
+    """
+    Pool de sesiones HTTP keep-alive hacia el proxy de base de datos. Cada sesión mantiene una sola conexión
+    persistente, así que el pool acota las conexiones abiertas y evita repetir el handshake TCP+TLS en cada consulta.
+    """
+
+    def __init__(self, max_size: int = 8, max_idle_time: float = 60.0, acquire_timeout: float = 10.0):
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.acquire_timeout = acquire_timeout
+
+        # (sesión, último uso); se reutiliza la más reciente, cuya conexión tiene menos probabilidad de estar cerrada
+        self._idle: List[tuple] = []
+        self._in_use = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self.created = 0
+        self.reused = 0
+        self.reaped = 0
+        self.discarded = 0
+
+        # Un hijo de fork (prefork) hereda las conexiones del padre: usarlas a la vez corrompe el tráfico de ambos
+        self._pid = os.getpid()
+        if hasattr(os, 'register_at_fork'):
+            pool = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: pool() is not None and pool()._reset_after_fork())
+
+    def _reset_after_fork(self):
+        # Sin cerrar nada: los sockets siguen siendo del padre. El lock se rehace por si otro hilo lo tenía al hacer fork
+        self._condition = threading.Condition()
+        self._idle = []
+        self._in_use = 0
+        self._pid = os.getpid()
+
+    def acquire(self) -> requests.Session:
+        deadline = time.time() + self.acquire_timeout
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise requests.exceptions.ConnectionError("Pool HTTP cerrado")
+
+                self._reap_idle()
+                if self._idle:
+                    session, _ = self._idle.pop()
+                    self._in_use += 1
+                    self.reused += 1
+                    return session
+
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    self.created += 1
+                    break
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise requests.exceptions.ConnectionError(
+                        f"Pool HTTP agotado ({self.max_size} conexiones en uso)")
+                self._condition.wait(remaining)
+
+        return self._new_session()
+
+    def release(self, session: requests.Session, reusable: bool = True):
+        """Devuelve la sesión al pool; tras un error de red se cierra porque su conexión puede estar a medias"""
+        if self._pid != os.getpid():
+            return
+        with self._condition:
+            self._in_use -= 1
+            if reusable and not self._closed:
+                self._idle.append((session, time.time()))
+            else:
+                self.discarded += 1
+                session.close()
+            self._condition.notify()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Content-Type': 'application/json', 'Connection': 'keep-alive'})
+        return session
+
+    def _reap_idle(self):
+        # Las sesiones quietas demasiado tiempo se cierran antes de que el servidor corte su conexión
+        now = time.time()
+        alive = []
+        for session, last_used in self._idle:
+            if now - last_used > self.max_idle_time:
+                session.close()
+                self.reaped += 1
+            else:
+                alive.append((session, last_used))
+        self._idle = alive
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            for session, _ in self._idle:
+                session.close()
+            self._idle.clear()
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "reaped": self.reaped,
+                "discarded": self.discarded
+            }
+
+class SQLiteBackend:
+    """
+    Base de datos SQLite local que responde con el mismo contrato que el proxy de D1 ({"query", "params"} o
+    {"batch": [...]} de entrada, {"success", "data", "meta"} de salida). Cada hilo usa su propia conexión y el
+    fichero va en modo WAL, así que las lecturas no esperan a las escrituras de otros hilos o procesos.
+    """
+
+    def __init__(self, path: str = "soa_local.db", busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+        self._local = threading.local()
+        # (hilo, conexión) de cada hilo que ha consultado; las de hilos terminados se cierran al abrir otra
+        self._connections: List[tuple] = []
+        self._lock = threading.Lock()
+
+        self.queries = 0
+        self.batches = 0
+        self.errors = 0
+        self._pid = os.getpid()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            # Hijo de fork (prefork): SQLite no admite usar ni cerrar las conexiones heredadas, se abandonan
+            self._local = threading.local()
+            self._connections = []
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Sin transacción implícita: cada sentencia se confirma sola, igual que en D1
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._lock:
+                alive = []
+                for thread, other in self._connections:
+                    if thread.is_alive():
+                        alive.append((thread, other))
+                    else:
+                        other.close()
+                alive.append((threading.current_thread(), conn))
+                self._connections = alive
+        return conn
+
+    def handle(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Atiende una petición con el formato del proxy y devuelve su respuesta"""
+        if "batch" in payload:
+            return self.execute_batch(payload["batch"])
+        return self.execute(payload.get("query", ""), payload.get("params"))
+
+    def execute(self, sql: str, params: List[Any] = None) -> Dict[str, Any]:
+        with self._lock:
+            self.queries += 1
+        try:
+            return self._run(self._connection(), sql, params)
+        except sqlite3.Error as e:
+            with self._lock:
+                self.errors += 1
+            return {"success": False, "error": str(e)}
+
+    def execute_batch(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Ejecuta las sentencias en una sola transacción: o se aplican todas o ninguna"""
+        with self._lock:
+            self.batches += 1
+        conn = self._connection()
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for item in batch:
+                results.append(self._run(conn, item.get("query", ""), item.get("params")))
+            conn.execute("COMMIT")
+            return {"success": True, "results": results}
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            with self._lock:
+                self.errors += 1
+            results.append({"success": False, "error": str(e)})
+            return {"success": False, "error": str(e), "results": results}
+
+    @staticmethod
+    def _run(conn: sqlite3.Connection, sql: str, params: List[Any] = None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        cursor = conn.execute(sql, params or [])
+        rows = [dict(row) for row in cursor.fetchall()]
+        changes = max(cursor.rowcount, 0)
+        return {
+            "success": True,
+            "data": rows,
+            "meta": {
+                "duration": (time.perf_counter() - start) * 1000,
+                "changes": changes,
+                "last_row_id": cursor.lastrowid,
+                "rows_read": len(rows),
+                "rows_written": changes,
+                "changed_db": changes > 0
+            }
+        }
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for _, conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "path": self.path,
+                "connections": len(self._connections),
+                "queries": self.queries,
+                "batches": self.batches,
+                "errors": self.errors
+            }
+
+class QueryCache:
+    """
+    Caché LRU de lecturas del DatabaseClient, con clave SQL normalizado + parámetros y ttl elegido por cada consulta.
+    Cada escritura que pasa por el mismo cliente descarta las lecturas de las tablas que toca; las escrituras de
+    otros procesos no se ven, así que el ttl es lo que acota cuánto puede quedar obsoleto un resultado.
+    """
+
+    # Literales, identificadores entre comillas, paréntesis, comas y palabras: lo justo para seguir el anidamiento
+    _SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|`[^`]*`|\[[^\]]*\]|[(),]|\w+(?:\.\w+)?")
+    _MAIN_VERBS = {"SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE"}
+    # Cierran la lista de tablas de un FROM
+    _FROM_END = {"WHERE", "GROUP", "HAVING", "WINDOW", "ORDER", "LIMIT", "UNION", "EXCEPT", "INTERSECT"}
+    _WRITE_TABLE = re.compile(
+        r'^(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM|'
+        r'DROP\s+TABLE(?:\s+IF\s+EXISTS)?|ALTER\s+TABLE)\s+["`\[]?(\w+)', re.IGNORECASE)
+    # No modifican filas: no invalidan nada
+    _NO_WRITE = re.compile(r'^(?:CREATE\s+(?:TABLE|(?:UNIQUE\s+)?INDEX)|PRAGMA|EXPLAIN)\b', re.IGNORECASE)
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+
+        # Clave -> (caduca_en, resultado en JSON, tablas leídas, tamaño); el primero es el menos usado
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str, Tuple[str, ...], int]]" = OrderedDict()
+        self._keys_by_table: Dict[str, Set[Tuple[str, str]]] = {}
+        # Una escritura sube la generación de sus tablas; una lectura que empezó antes ya no puede guardar su resultado
+        self._generations: Dict[str, int] = {}
+        # Sube con las sentencias que no se saben analizar, que invalidan todas las tablas
+        self._epoch = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(sql: str) -> str:
+        return " ".join(sql.split()).rstrip(";")
+
+    @classmethod
+    def main_statement(cls, sql: str) -> str:
+        """Sentencia principal: en un WITH, lo que va desde el primer verbo fuera de los paréntesis de las CTE"""
+        statement = cls.normalize(sql)
+        if statement[:4].upper() != "WITH":
+            return statement
+        depth = 0
+        for match in cls._SQL_TOKEN.finditer(statement):
+            token = match.group(0)
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif depth == 0 and token.upper() in cls._MAIN_VERBS:
+                return statement[match.start():]
+        return statement
+
+    @classmethod
+    def is_read(cls, sql: str) -> bool:
+        return cls.main_statement(sql)[:6].upper() == "SELECT"
+
+    @classmethod
+    def read_tables(cls, sql: str) -> Tuple[str, ...]:
+        """Tablas que lee la consulta: la que sigue a cada FROM, JOIN o coma de la lista de un FROM, a cualquier nivel
+        de subconsulta. Sobra alguna (nombres de CTE o de funciones) antes que faltar una"""
+        tables = set()
+        depth = 0
+        # Niveles de paréntesis con un FROM abierto, y si el siguiente token es un nombre de tabla
+        open_from: Set[int] = set()
+        expect_table = False
+        for token in cls._SQL_TOKEN.findall(sql):
+            word = token.upper()
+            if token == "(":
+                depth += 1
+                expect_table = False
+            elif token == ")":
+                open_from.discard(depth)
+                depth -= 1
+                expect_table = False
+            elif expect_table:
+                if token[0] != "'":
+                    tables.add(token.strip('"`[]').rsplit(".", 1)[-1].upper())
+                expect_table = False
+            elif word in ("FROM", "JOIN"):
+                open_from.add(depth)
+                expect_table = True
+            elif token == ",":
+                expect_table = depth in open_from
+            elif word in cls._FROM_END:
+                open_from.discard(depth)
+        return tuple(sorted(tables))
+
+    @classmethod
+    def written_tables(cls, sql: str) -> Optional[Set[str]]:
+        """Tablas que modifica la sentencia; vacío si no modifica ninguna y None si no se sabe (se invalida todo)"""
+        statement = cls.main_statement(sql)
+        if cls.is_read(statement) or cls._NO_WRITE.match(statement):
+            return set()
+        match = cls._WRITE_TABLE.match(statement)
+        return {match.group(1).upper()} if match else None
+
+    def key_for(self, sql: str, params: List[Any] = None) -> Tuple[str, str]:
+        return self.normalize(sql), json.dumps(params or [], default=str)
+
+    def lookup(self, key: Tuple[str, str], tables: Tuple[str, ...]) -> Tuple[Optional[Dict[str, Any]], tuple]:
+        """Devuelve (resultado o None, generación a pasar a store si hay que consultar la base de datos)"""
+        now = time.time()
+        with self._lock:
+            generation = self._generation(tables)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    # Cada acierto recibe su propia copia: quien la modifique no altera lo cacheado
+                    return json.loads(entry[1]), generation
+                self._remove(key)
+            self.misses += 1
+            return None, generation
+
+    def store(self, key: Tuple[str, str], tables: Tuple[str, ...], result: Dict[str, Any], ttl: float,
+              generation: tuple):
+        if not result.get("success"):
+            return
+        try:
+            payload = json.dumps(result)
+        except (TypeError, ValueError):
+            return
+
+        size = len(payload) + len(key[0]) + len(key[1])
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation != self._generation(tables):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + ttl, payload, tables, size)
+            for table in tables:
+                self._keys_by_table.setdefault(table, set()).add(key)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, sql: str):
+        """Descarta las lecturas que deja obsoletas la sentencia sql"""
+        tables = self.written_tables(sql)
+        if tables is not None and not tables:
+            return
+
+        with self._lock:
+            if tables is None:
+                # Sentencia que no sabemos analizar: mejor vaciar la caché que servir datos obsoletos
+                self._epoch += 1
+                keys = list(self._entries)
+            else:
+                for table in tables:
+                    self._generations[table] = self._generations.get(table, 0) + 1
+                keys = [key for table in tables for key in self._keys_by_table.get(table, ())]
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+            self.invalidations += 1
+
+    def _generation(self, tables: Tuple[str, ...]) -> tuple:
+        return (self._epoch, *(self._generations.get(table, 0) for table in tables))
+
+    def _remove(self, key: Tuple[str, str]):
+        expires_at, payload, tables, size = self._entries.pop(key)
+        for table in tables:
+            self._keys_by_table[table].discard(key)
+        self._size -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions
+            }
+
 class DatabaseClient:
-    """Cliente para interactuar con la base de datos a través del proxy HTTP de Cloudflare D1"""
+    """
+    Cliente para interactuar con la base de datos a través del proxy HTTP de Cloudflare D1, o con un fichero
+    SQLite local si backend="sqlite" (o DB_BACKEND=sqlite) cuando toda la plataforma corre en una sola máquina
+    """
+    
+    DEFAULT_PROXY_URL = "https://d1-database-proxy.maliagapacheco.workers.dev/query"
+    # Respuestas a un batch que significan "no sé qué es esto" y no un fallo de la petición
+    BATCH_UNSUPPORTED_STATUS = (400, 404, 405, 501)
+    BATCH_RECHECK_INTERVAL = 300.0
     
-    def __init__(self, proxy_url: str = "https://d1-database-proxy.maliagapacheco.workers.dev/query"):
-        self.proxy_url = proxy_url
-        self.timeout = 30  # timeout en segundos
+    def __init__(self, proxy_url: Optional[str] = None,
+                 pool_size: Optional[int] = None, connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None, pool_idle_timeout: Optional[float] = None,
+                 backend: Optional[str] = None, sqlite_path: Optional[str] = None,
+                 cache_bytes: Optional[int] = None):
+        # DB_PROXY_URL permite apuntar todos los servicios a otro proxy (p. ej. d1_local_proxy.py)
+        self.proxy_url = proxy_url or os.getenv('DB_PROXY_URL', self.DEFAULT_PROXY_URL)
+        self.backend = (backend or os.getenv('DB_BACKEND', 'http')).lower()
+        if self.backend not in ('http', 'sqlite'):
+            raise ValueError(f"Backend de base de datos desconocido: {self.backend}")
         
-    def execute_query(self, sql: str, params: List[Any] = None) -> Dict[str, Any]:
+        self.sqlite: Optional[SQLiteBackend] = None
+        if self.backend == 'sqlite':
+            self.sqlite = SQLiteBackend(sqlite_path or os.getenv('DB_SQLITE_PATH', 'soa_local.db'))
+        
+        # Conectar debe fallar rápido; leer puede tardar lo que tarde la consulta más lenta
+        self.connect_timeout = connect_timeout or float(os.getenv('DB_CONNECT_TIMEOUT', 5.0))
+        self.read_timeout = read_timeout or float(os.getenv('DB_READ_TIMEOUT', 30.0))
+        self.timeout = self.read_timeout
+        
+        self.http_pool = HTTPSessionPool(
+            max_size=pool_size or int(os.getenv('DB_POOL_SIZE', 8)),
+            max_idle_time=pool_idle_timeout or float(os.getenv('DB_POOL_IDLE_TIMEOUT', 60.0)),
+            acquire_timeout=self.connect_timeout + self.read_timeout
+        )
+        
+        # None hasta el primer execute_batch; False si el proxy no entiende peticiones {"batch": [...]}
+        self.batch_supported: Optional[bool] = None
+        self._batch_unsupported_at = 0.0
+        
+        # Caché de lecturas desactivada salvo que se le dé presupuesto (cache_bytes o DB_CACHE_BYTES)
+        if cache_bytes is None:
+            cache_bytes = int(os.getenv('DB_CACHE_BYTES', 0))
+        self.cache: Optional[QueryCache] = QueryCache(cache_bytes) if cache_bytes > 0 else None
+        
+    def execute_query(self, sql: str, params: List[Any] = None, cache_ttl: Optional[float] = None) -> Dict[str, Any]:
         """
-        Ejecuta una consulta SQL a través del proxy HTTP
+        Ejecuta una consulta SQL a través del proxy HTTP (o del SQLite local)
         
         Args:
             sql: La consulta SQL a ejecutar
             params: Lista de parámetros para la consulta (opcional)
+            cache_ttl: Segundos que puede servirse de la caché el resultado de un SELECT (opcional)
             
         Returns:
             Dict con el resultado de la consulta
         """
+        if self.cache is None:
+            return self._execute(sql, params)
+        
+        if not QueryCache.is_read(sql):
+            try:
+                return self._execute(sql, params)
+            finally:
+                self.cache.invalidate(sql)
+        
+        if not cache_ttl:
+            return self._execute(sql, params)
+        
+        key, tables = self.cache.key_for(sql, params), QueryCache.read_tables(sql)
+        cached, generation = self.cache.lookup(key, tables)
+        if cached is not None:
+            return cached
+        result = self._execute(sql, params)
+        self.cache.store(key, tables, result, cache_ttl, generation)
+        return result
+    
+    def _execute(self, sql: str, params: List[Any] = None) -> Dict[str, Any]:
         try:
             # El proxy espera 'query' en lugar de 'sql'
             payload = {
@@ -32,31 +532,11 @@ class DatabaseClient:
             
             logger.debug(f"Ejecutando consulta: {sql} con parámetros: {params}")
             
-            response = requests.post(
-                self.proxy_url,
-                json=payload,
-                timeout=self.timeout,
-                headers={
-                    'Content-Type': 'application/json'
-                }
-            )
-            
-            response.raise_for_status()
-            result = response.json()
+            result = self._post(payload)
             
             logger.debug(f"Respuesta de BD: {result}")
             
-            # Normalizar la respuesta para que sea compatible con el resto del código
-            if result.get("success"):
-                # El proxy devuelve 'data' pero nuestro código espera 'results'
-                normalized_result = {
-                    "success": True,
-                    "results": result.get("data", []),
-                    "meta": result.get("meta", {})
-                }
-                return normalized_result
-            else:
-                return result
+            return self._normalize(result)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Error de red ejecutando consulta: {e}")
@@ -77,14 +557,131 @@ class DatabaseClient:
                 "error": f"Unexpected error: {str(e)}"
             }
     
-    def fetch_one(self, sql: str, params: List[Any] = None) -> Optional[Dict[str, Any]]:
+    @staticmethod
+    def _normalize(result: Dict[str, Any]) -> Dict[str, Any]:
+        # Normalizar la respuesta para que sea compatible con el resto del código
+        if result.get("success"):
+            # El proxy devuelve 'data' pero nuestro código espera 'results'
+            return {
+                "success": True,
+                "results": result.get("data", []),
+                "meta": result.get("meta", {})
+            }
+        return result
+    
+    def execute_batch(self, statements: List[Union[str, tuple]]) -> Dict[str, Any]:
+        """
+        Ejecuta varias sentencias en orden en una sola petición al proxy, que las aplica de forma atómica (D1 batch)
+        
+        Args:
+            statements: Lista de sentencias SQL o tuplas (sql, params)
+            
+        Returns:
+            Dict con success y results, una respuesta normalizada por sentencia. Si el proxy no admite batch se
+            ejecutan una a una hasta la primera que falle: ese camino NO es atómico y las sentencias anteriores al
+            fallo quedan aplicadas, así que las cascadas deben ordenarse para que un corte a mitad no deje huérfanos.
+        """
+        batch = []
+        for statement in statements:
+            sql, params = (statement, None) if isinstance(statement, str) else statement
+            batch.append({"query": sql, "params": params or []})
+        if not batch:
+            return {"success": True, "results": []}
+        
+        try:
+            return self._execute_batch(batch)
+        finally:
+            if self.cache is not None:
+                for item in batch:
+                    self.cache.invalidate(item["query"])
+    
+    def _execute_batch(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Un proxy que no admitía batch puede haberse actualizado: se vuelve a probar de vez en cuando
+        if self.batch_supported is False and time.time() - self._batch_unsupported_at > self.BATCH_RECHECK_INTERVAL:
+            self.batch_supported = None
+        
+        if self.batch_supported is not False:
+            try:
+                logger.debug(f"Ejecutando batch de {len(batch)} sentencias")
+                result = self._post({"batch": batch})
+                if isinstance(result.get("results"), list) and len(result["results"]) == len(batch):
+                    self.batch_supported = True
+                    results = [self._normalize(item) for item in result["results"]]
+                    response = {"success": bool(result.get("success")) and all(r.get("success") for r in results),
+                                "results": results}
+                    if not response["success"]:
+                        response["error"] = result.get("error") or next(
+                            (r.get("error") for r in results if not r.get("success")), "Batch error")
+                    return response
+                if self.batch_supported:
+                    return {"success": False, "results": [], "error": result.get("error", "Respuesta de batch inválida")}
+            except requests.exceptions.HTTPError as e:
+                # Un proxy sin soporte de batch la rechaza sin ejecutar nada (400, 404, 405, 501), o revienta con un
+                # 5xx al no encontrar "query": en la primera prueba también se toma como "no admite batch" y se
+                # recurre a sentencias sueltas. Con batch ya confirmado, 429 y 5xx son fallos pasajeros
+                status = e.response.status_code if e.response is not None else 500
+                unsupported = status in self.BATCH_UNSUPPORTED_STATUS or (self.batch_supported is None and status >= 500)
+                if self.batch_supported or not unsupported:
+                    logger.error(f"Error de red ejecutando batch: {e}")
+                    return {"success": False, "results": [], "error": f"Network error: {str(e)}"}
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error de red ejecutando batch: {e}")
+                return {"success": False, "results": [], "error": f"Network error: {str(e)}"}
+            except Exception as e:
+                logger.error(f"Error inesperado ejecutando batch: {e}")
+                return {"success": False, "results": [], "error": f"Unexpected error: {str(e)}"}
+            
+            logger.warning("El proxy no admite batch, las sentencias se ejecutarán una a una")
+            self.batch_supported = False
+            self._batch_unsupported_at = time.time()
+        
+        results = []
+        for item in batch:
+            result = self._execute(item["query"], item["params"])
+            results.append(result)
+            if not result.get("success"):
+                return {"success": False, "results": results, "error": result.get("error")}
+        return {"success": True, "results": results}
+    
+    def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self.sqlite is not None:
+            return self.sqlite.handle(payload)
+        
+        session = self.http_pool.acquire()
+        reusable = False
+        try:
+            response = session.post(self.proxy_url, json=payload,
+                                    timeout=(self.connect_timeout, self.read_timeout))
+            response.raise_for_status()
+            result = response.json()
+            reusable = True
+            return result
+        finally:
+            self.http_pool.release(session, reusable)
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Uso del pool HTTP (en uso, libres, creadas, reutilizadas) para dimensionarlo por servicio"""
+        if self.sqlite is not None:
+            return self.sqlite.stats()
+        return self.http_pool.stats()
+    
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Aciertos, fallos y tasa de aciertos de la caché de lecturas, o None si está desactivada"""
+        return self.cache.stats() if self.cache is not None else None
+    
+    def close(self):
+        self.http_pool.close()
+        if self.sqlite is not None:
+            self.sqlite.close()
+    
+    def fetch_one(self, sql: str, params: List[Any] = None, cache_ttl: Optional[float] = None) -> Optional[Dict[str, Any]]:
         """
         Ejecuta una consulta y devuelve un solo resultado
         
         Returns:
             Dict con una fila de resultado o None si no hay resultados
         """
-        result = self.execute_query(sql, params)
+        result = self.execute_query(sql, params, cache_ttl)
         
         if not result.get("success", False):
             logger.error(f"Error en consulta fetch_one: {result.get('error')}")
@@ -95,14 +692,14 @@ class DatabaseClient:
             return results[0]
         return None
     
-    def fetch_all(self, sql: str, params: List[Any] = None) -> List[Dict[str, Any]]:
+    def fetch_all(self, sql: str, params: List[Any] = None, cache_ttl: Optional[float] = None) -> List[Dict[str, Any]]:
         """
         Ejecuta una consulta y devuelve todos los resultados
         
         Returns:
             Lista de diccionarios con los resultados
         """
-        result = self.execute_query(sql, params)
+        result = self.execute_query(sql, params, cache_ttl)
         
         if not result.get("success", False):
             logger.error(f"Error en consulta fetch_all: {result.get('error')}")
@@ -152,21 +749,17 @@ class DatabaseClient:
                     is_active BOOLEAN DEFAULT 1
                 )
             '''
-            result = self.execute_query(sql)
-            if not result.get("success", False):
-                logger.error(f"Error creando tabla USUARIO: {result.get('error')}")
-                return False
-            
             # Índices
             indices = [
                 'CREATE INDEX IF NOT EXISTS idx_email ON USUARIO(email)',
                 'CREATE INDEX IF NOT EXISTS idx_rol ON USUARIO(rol)'
             ]
             
-            for idx_sql in indices:
-                result = self.execute_query(idx_sql)
-                if not result.get("success", False):
-                    logger.warning(f"Error creando índice: {result.get('error')}")
+            # Tabla e índices en una sola petición
+            result = self.execute_batch([sql] + indices)
+            if not result.get("success", False):
+                logger.error(f"Error creando tabla USUARIO o sus índices: {result.get('error')}")
+                return False
             
             logger.info("Tablas de autenticación inicializadas correctamente")
             return True
@@ -190,21 +783,17 @@ class DatabaseClient:
                     FOREIGN KEY (id_usuario) REFERENCES USUARIO(id_usuario)
                 )
             '''
-            result = self.execute_query(sql)
-            if not result.get("success", False):
-                logger.error(f"Error creando tabla PERFIL: {result.get('error')}")
-                return False
-            
             # Índices
             indices = [
                 'CREATE INDEX IF NOT EXISTS idx_id_usuario ON PERFIL(id_usuario)',
                 'CREATE INDEX IF NOT EXISTS idx_avatar ON PERFIL(avatar)'
             ]
             
-            for idx_sql in indices:
-                result = self.execute_query(idx_sql)
-                if not result.get("success", False):
-                    logger.warning(f"Error creando índice: {result.get('error')}")
+            # Tabla e índices en una sola petición
+            result = self.execute_batch([sql] + indices)
+            if not result.get("success", False):
+                logger.error(f"Error creando tabla PERFIL o sus índices: {result.get('error')}")
+                return False
             
             logger.info("Tablas de perfiles inicializadas correctamente")
             return True
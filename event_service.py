@@ -112,7 +112,7 @@ class EventService(SOAServiceBase):
         """Obtiene información de un usuario por ID"""
         try:
             query = "SELECT id_usuario, email, rol FROM USUARIO WHERE id_usuario = ?"
-            result = self.db_client.execute_query(query, [user_id])
+            result = self.db_client.execute_query(query, [user_id], cache_ttl=30)
             
             if result.get('success') and result.get('results'):
                 user_data = result['results'][0]
@@ -618,6 +618,7 @@ class EventService(SOAServiceBase):
             "database": "Cloudflare D1 (remota)",
             "table": "EVENTO",
             "authentication": "JWT Token required",
+            "db_cache": self.db_client.cache_stats(),
             "port": self.port,
             "host": self.host,
             "methods": list(self.methods.keys()) if hasattr(self, 'methods') else [],
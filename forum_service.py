@@ -122,7 +122,7 @@ class ForumService(SOAServiceBase):
         try:
             self.logger.info(f"Buscando usuario con ID: {user_id}")
             query = "SELECT id_usuario, email, rol FROM USUARIO WHERE id_usuario = ?"
-            result = self.db_client.execute_query(query, [user_id])
+            result = self.db_client.execute_query(query, [user_id], cache_ttl=30)
             
             self.logger.info(f"Resultado consulta usuario: {result}")
             
@@ -581,7 +581,6 @@ class ForumService(SOAServiceBase):
             WHERE tipo_contenido = 'post' 
             AND contenido_id IN (SELECT id_post FROM POST WHERE id_foro = ?)
             """
-            self.db_client.execute_query(delete_reports_sql_post, [id_foro])
 
             delete_reports_sql_comment = """
             DELETE FROM REPORTE 
@@ -591,33 +590,38 @@ class ForumService(SOAServiceBase):
                 WHERE id_post IN (SELECT id_post FROM POST WHERE id_foro = ?)
             )
             """
-            self.db_client.execute_query(delete_reports_sql_comment, [id_foro])
 
             # Eliminar comentarios de los posts de este foro
             cascade_comments_sql = """
             DELETE FROM COMENTARIO 
             WHERE id_post IN (SELECT id_post FROM POST WHERE id_foro = ?)
             """
-            self.db_client.execute_query(cascade_comments_sql, [id_foro])
 
-            # Eliminar posts del foro
-            cascade_posts_sql = "DELETE FROM POST WHERE id_foro = ?"
-            self.db_client.execute_query(cascade_posts_sql, [id_foro])
-
-            # Eliminar suscripciones de posts pertenecientes al foro
+            # Eliminar suscripciones de posts pertenecientes al foro (antes que los posts, que la subconsulta necesita)
             delete_sub_post_sql = """
             DELETE FROM SUSCRIPCION_POST 
             WHERE post_id IN (SELECT id_post FROM POST WHERE id_foro = ?)
             """
-            self.db_client.execute_query(delete_sub_post_sql, [id_foro])
+
+            # Eliminar posts del foro
+            cascade_posts_sql = "DELETE FROM POST WHERE id_foro = ?"
 
             # Eliminar suscripciones al foro
             delete_sub_forum_sql = "DELETE FROM SUSCRIPCION_FORO WHERE foro_id = ?"
-            self.db_client.execute_query(delete_sub_forum_sql, [id_foro])
 
             # Finalmente eliminar el foro
             delete_query = "DELETE FROM FORO WHERE id_foro = ?"
-            result = self.db_client.execute_query(delete_query, [id_foro])
+
+            # Todo el borrado en cascada viaja en una sola petición y se aplica de forma atómica
+            result = self.db_client.execute_batch([
+                (delete_reports_sql_post, [id_foro]),
+                (delete_reports_sql_comment, [id_foro]),
+                (cascade_comments_sql, [id_foro]),
+                (delete_sub_post_sql, [id_foro]),
+                (cascade_posts_sql, [id_foro]),
+                (delete_sub_forum_sql, [id_foro]),
+                (delete_query, [id_foro])
+            ])
             
             if result.get('success'):
                 self.logger.info(f"🗑️ Foro eliminado: {titulo} por {user_payload.get('email')}")
@@ -689,6 +693,7 @@ class ForumService(SOAServiceBase):
             "database": "Cloudflare D1 (remota)",
             "table": "FORO",
             "authentication": "JWT Token required",
+            "db_cache": self.db_client.cache_stats(),
             "port": self.port,
             "host": self.host,
             "methods": list(self.methods.keys()) if hasattr(self, 'methods') else [],
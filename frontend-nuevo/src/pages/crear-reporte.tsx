@@ -106,15 +106,7 @@ export function CrearReporte() {
           const json = JSON.parse(jsonString)
           
           if (json.success && json.report && json.report.id_reporte) {
-            // Crear notificación de reporte para moderadores
-            const token = localStorage.getItem("token")
-            const razonFinal = RAZONES_REPORTE.find(r => r.value === razonSeleccionada)?.label || razonSeleccionada
-            const notificationMessage = `NOTIFcreate_report_notification ${token} ${json.report.id_reporte} '${razonFinal}' '${tipoContenido}'`
-            console.log("📤 Enviando notificación de reporte:", notificationMessage)
-            if (socketRef.current && socketRef.current.readyState === WebSocket.OPEN) {
-              socketRef.current.send(notificationMessage)
-            }
-            
+            // Las notificaciones a los moderadores las genera el backend (evento report.created)
             toast.success("Reporte creado exitosamente")
             setContenidoId("")
             setTipoContenido("")
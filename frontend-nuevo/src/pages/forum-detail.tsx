@@ -204,24 +204,7 @@ export default function ForumDetail() {
     if (socketRef.current) {
       socketRef.current.onmessage = (event) => {
         if (event.data.includes("POSTSOK") && event.data.includes("creado exitosamente")) {
-          // Extraer el ID del post de la respuesta para crear notificación
-          try {
-            const postsOkIndex = event.data.indexOf("POSTSOK")
-            const jsonString = event.data.slice(postsOkIndex + "POSTSOK".length)
-            const response = JSON.parse(jsonString)
-            
-            if (response.success && response.post && response.post.id_post && forum) {
-              // Crear notificación para suscriptores del foro
-              const token = localStorage.getItem("token")
-              if (token) {
-                const notificationMessage = `NOTIFcreate_post_notification ${token} ${forumId} ${response.post.id_post} '${newPostContent.substring(0, 50)}...'`
-                socketRef.current?.send(notificationMessage)
-              }
-            }
-          } catch (err) {
-            console.error("Error procesando respuesta de post:", err)
-          }
-          
+          // Las notificaciones a los suscriptores del foro las genera el backend (evento post.created)
           setIsCreateDialogOpen(false)
           setNewPostContent("")
           setLoading(false)
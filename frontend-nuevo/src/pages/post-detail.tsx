@@ -291,27 +291,7 @@ export default function PostDetail() {
     if (socketRef.current) {
       socketRef.current.onmessage = (event) => {
         if (event.data.includes("COMMSOK") && event.data.includes("creado exitosamente")) {
-          // Extraer el ID del comentario de la respuesta para crear notificación
-          try {
-            const commsOkIndex = event.data.indexOf("COMMSOK")
-            const jsonString = event.data.slice(commsOkIndex + "COMMSOK".length)
-            const response = JSON.parse(jsonString)
-            
-            if (response.success && response.comment && response.comment.id_comentario && post) {
-              // Crear notificación para suscriptores del post
-              const token = localStorage.getItem("token")
-              if (token) {
-                const postTitle = post.contenido.length > 50 ? 
-                  post.contenido.substring(0, 50) + "..." : 
-                  post.contenido
-                const notificationMessage = `NOTIFcreate_comment_notification ${token} ${postId} ${response.comment.id_comentario} '${postTitle}'`
-                socketRef.current?.send(notificationMessage)
-              }
-            }
-          } catch (err) {
-            console.error("Error procesando respuesta de comentario:", err)
-          }
-          
+          // Las notificaciones a los suscriptores del post las genera el backend (evento comment.created)
           setIsCreateDialogOpen(false)
           setNewCommentContent("")
           setLoading(false)
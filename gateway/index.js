@@ -9,15 +9,17 @@ const wss = new WebSocketServer({ port: WS_PORT }, () => {
   console.log(`✅ Gateway WebSocket iniciado en ws://4.228.228.99:${WS_PORT}`);
 });
 
-wss.on("connection", (ws) => {
+wss.on("connection", (ws, req) => {
   console.log("🔌 Cliente WebSocket conectado");
+  // IP real del cliente: el bus la usa para los límites por cliente de las llamadas sin token (login, register)
+  const clientIp = req.socket.remoteAddress || "unknown";
 
   ws.on("message", (message) => {
     const raw = message.toString();
     console.log("➡️ Mensaje recibido del cliente:", raw);
 
     try {
-      const mensajeTCP = buildMessage(raw);
+      const mensajeTCP = buildMessage(withClientAttr(raw, clientIp));
 
       console.log("📨 Enviando al bus:", mensajeTCP);
       enviarAlBus(mensajeTCP, (respuesta) => {
@@ -39,9 +41,28 @@ wss.on("connection", (ws) => {
   });
 });
 
+function withClientAttr(raw, clientIp) {
+  // Se descarta cualquier c= que traiga el cliente: solo el gateway puede decir quién es
+  let attrs = [];
+  let body = raw;
+  if (raw.startsWith("~")) {
+    const end = raw.indexOf("~", 1);
+    if (end > 0) {
+      attrs = raw.slice(1, end).split(",").filter((pair) => pair && !pair.startsWith("c="));
+      body = raw.slice(end + 1);
+    }
+  }
+  attrs.push(`c=${clientIp.replace(/[~,=]/g, "")}`);
+  return `~${attrs.join(",")}~${body}`;
+}
+
 function buildMessage(raw) {
-  const longitud = (raw).length;
-  const longitudStr = longitud.toString().padStart(5, "0");
+  // El bus cuenta puntos de código (como len() en Python), no unidades UTF-16
+  const longitud = [...raw].length;
+  // Mensajes de más de 99999 caracteres usan la cabecera extendida X + 10 dígitos
+  const longitudStr = longitud > 99999
+    ? "X" + longitud.toString().padStart(10, "0")
+    : longitud.toString().padStart(5, "0");
   return longitudStr + raw;
 }
 
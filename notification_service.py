@@ -5,7 +5,7 @@ Permite gestionar notificaciones para usuarios del sistema
 """
 
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import json
 import jwt
 from datetime import datetime
@@ -34,6 +34,11 @@ class NotificationService(SOAServiceBase):
         # Inicializar base de datos
         self._init_database()
         
+        # Las notificaciones de contenido nuevo llegan como eventos del bus, fuera del camino de la petición
+        self.subscribe_event("post.created", self._on_post_created)
+        self.subscribe_event("comment.created", self._on_comment_created)
+        self.subscribe_event("report.created", self._on_report_created)
+        
         # Los métodos se registran automáticamente por la clase base
         # Todos los métodos que empiecen con 'service_' se registran automáticamente
         
@@ -122,6 +127,12 @@ class NotificationService(SOAServiceBase):
             )
             """
             
+            # Índice para comprobar si una referencia ya se notificó (los eventos se pueden entregar dos veces)
+            create_reference_index_sql = """
+            CREATE INDEX IF NOT EXISTS idx_notificacion_referencia
+            ON NOTIFICACION (referencia_tipo, referencia_id, tipo)
+            """
+            
             # Ejecutar creación de tablas
             tables = [
                 ("NOTIFICACION", create_notification_sql),
@@ -129,12 +140,12 @@ class NotificationService(SOAServiceBase):
                 ("SUSCRIPCION_POST", create_post_subscription_sql)
             ]
             
-            for table_name, sql in tables:
-                result = self.db_client.execute_query(sql)
-                if result.get('success'):
-                    self.logger.info(f"✅ Tabla {table_name} creada/verificada correctamente")
-                else:
-                    self.logger.error(f"❌ Error creando tabla {table_name}: {result.get('error')}")
+            result = self.db_client.execute_batch([sql for _, sql in tables] + [create_reference_index_sql])
+            table_names = ", ".join(table_name for table_name, _ in tables)
+            if result.get('success'):
+                self.logger.info(f"✅ Tablas {table_names} creadas/verificadas correctamente")
+            else:
+                self.logger.error(f"❌ Error creando tablas {table_names}: {result.get('error')}")
                 
         except Exception as e:
             self.logger.error(f"❌ Error inicializando base de datos: {e}")
@@ -155,7 +166,7 @@ class NotificationService(SOAServiceBase):
         """Obtiene información de un usuario por ID"""
         try:
             query = "SELECT id_usuario, email, rol FROM USUARIO WHERE id_usuario = ?"
-            result = self.db_client.execute_query(query, [user_id])
+            result = self.db_client.execute_query(query, [user_id], cache_ttl=30)
             
             if result.get('success') and result.get('results'):
                 user_data = result['results'][0]
@@ -999,64 +1010,84 @@ class NotificationService(SOAServiceBase):
                 return json.dumps({"success": False, "message": token_result.get('message')})
             
             user_payload = token_result['payload']
-            creador_id = user_payload.get('id_usuario')
-            creador_email = user_payload.get('email')
-            
-            # Obtener usuarios suscritos al foro (excepto el creador del post)
-            query = """
-            SELECT sf.usuario_id, u.email 
-            FROM SUSCRIPCION_FORO sf
-            LEFT JOIN USUARIO u ON sf.usuario_id = u.id_usuario
-            WHERE sf.foro_id = ? AND sf.activa = TRUE AND sf.usuario_id != ?
-            """
-            
-            result = self.db_client.execute_query(query, [foro_id, creador_id])
-            
-            if result.get('success'):
-                subscribers = result.get('results', [])
-                notifications_created = 0
-                
-                from datetime import datetime
-                now = datetime.now().isoformat()
-                
-                for subscriber_data in subscribers:
-                    if isinstance(subscriber_data, dict):
-                        usuario_id = subscriber_data.get('usuario_id')
-                    else:
-                        usuario_id = subscriber_data[0] if len(subscriber_data) > 0 else None
-                    
-                    if not usuario_id:
-                        continue
-                    
-                    # Crear notificación
-                    insert_query = """
-                    INSERT INTO NOTIFICACION (usuario_id, titulo, mensaje, tipo, referencia_id, referencia_tipo, fecha, creador_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """
-                    
-                    titulo = "📝 Nuevo post en foro suscrito"
-                    mensaje = f"{creador_email} publicó '{titulo_post}'"
-                    
-                    notif_result = self.db_client.execute_query(insert_query, [
-                        usuario_id, titulo, mensaje, 'foro', post_id, 'post', now, creador_id
-                    ])
-                    
-                    if notif_result.get('success'):
-                        notifications_created += 1
-                
-                self.logger.info(f"📧 {notifications_created} notificaciones creadas para nuevo post en foro {foro_id}")
-                return json.dumps({
-                    "success": True,
-                    "message": f"Se crearon {notifications_created} notificaciones",
-                    "notifications_created": notifications_created
-                })
-            else:
-                return json.dumps({"success": False, "message": f"Error obteniendo suscriptores: {result.get('error')}"})
+            return json.dumps(self._notify_post_subscribers(foro_id, post_id, titulo_post,
+                                                            user_payload.get('id_usuario'), user_payload.get('email')))
                 
         except Exception as e:
             self.logger.error(f"Error en create_post_notification: {e}")
             return json.dumps({"success": False, "message": f"Error interno: {str(e)}"})
 
+    def _notify_post_subscribers(self, foro_id: int, post_id: int, titulo_post: str,
+                                 creador_id: int, creador_email: str) -> Dict[str, Any]:
+        # Obtener usuarios suscritos al foro (excepto el creador del post)
+        query = """
+        SELECT sf.usuario_id, u.email 
+        FROM SUSCRIPCION_FORO sf
+        LEFT JOIN USUARIO u ON sf.usuario_id = u.id_usuario
+        WHERE sf.foro_id = ? AND sf.activa = TRUE AND sf.usuario_id != ?
+        """
+        
+        result = self.db_client.execute_query(query, [foro_id, creador_id])
+        
+        if not result.get('success'):
+            return {"success": False, "message": f"Error obteniendo suscriptores: {result.get('error')}"}
+        
+        notifications_created, notifications_failed = self._insert_notifications(
+            result.get('results', []), 'usuario_id', "📝 Nuevo post en foro suscrito",
+            f"{creador_email} publicó '{titulo_post}'", 'foro', post_id, 'post', creador_id)
+        
+        self.logger.info(f"📧 {notifications_created} notificaciones creadas para nuevo post en foro {foro_id}")
+        return {
+            "success": True,
+            "message": f"Se crearon {notifications_created} notificaciones",
+            "notifications_created": notifications_created,
+            "notifications_failed": notifications_failed
+        }
+
+    def _insert_notifications(self, recipients: list, id_field: str, titulo: str, mensaje: str, tipo: str,
+                              referencia_id: int, referencia_tipo: str, creador_id: int) -> Tuple[int, int]:
+        """
+        Inserta la misma notificación para cada destinatario que aún no la tenga; devuelve (creadas, fallidas).
+        Repetir la llamada para la misma referencia no duplica nada, así que un evento entregado dos veces es inofensivo
+        """
+        from datetime import datetime
+        now = datetime.now().isoformat()
+        
+        existing_result = self.db_client.execute_query(
+            "SELECT usuario_id FROM NOTIFICACION WHERE tipo = ? AND referencia_tipo = ? AND referencia_id = ?",
+            [tipo, referencia_tipo, referencia_id])
+        if not existing_result.get('success'):
+            return 0, len(recipients)
+        existing = {row.get('usuario_id') if isinstance(row, dict) else row[0]
+                    for row in existing_result.get('results') or []}
+        
+        insert_query = """
+        INSERT INTO NOTIFICACION (usuario_id, titulo, mensaje, tipo, referencia_id, referencia_tipo, fecha, creador_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        
+        notifications_created = 0
+        notifications_failed = 0
+        for recipient in recipients:
+            if isinstance(recipient, dict):
+                usuario_id = recipient.get(id_field)
+            else:
+                usuario_id = recipient[0] if len(recipient) > 0 else None
+            
+            if not usuario_id or usuario_id in existing:
+                continue
+            
+            notif_result = self.db_client.execute_query(insert_query, [
+                usuario_id, titulo, mensaje, tipo, referencia_id, referencia_tipo, now, creador_id
+            ])
+            
+            if notif_result.get('success'):
+                notifications_created += 1
+                existing.add(usuario_id)
+            else:
+                notifications_failed += 1
+        return notifications_created, notifications_failed
+
     def service_create_comment_notification(self, params_str: str) -> str:
         """Crea notificaciones para usuarios suscritos a un post cuando se agrega un comentario"""
         try:
@@ -1079,72 +1110,49 @@ class NotificationService(SOAServiceBase):
                 return json.dumps({"success": False, "message": token_result.get('message')})
             
             user_payload = token_result['payload']
-            creador_id = user_payload.get('id_usuario')
-            creador_email = user_payload.get('email')
-            
-            # Obtener usuarios suscritos al post (excepto el creador del comentario)
-            # También incluir al autor del post si no está suscrito explícitamente
-            query = """
-            SELECT DISTINCT u.id_usuario, u.email
-            FROM USUARIO u
-            WHERE u.id_usuario IN (
-                SELECT sp.usuario_id 
-                FROM SUSCRIPCION_POST sp 
-                WHERE sp.post_id = ? AND sp.activa = TRUE
-                UNION
-                SELECT p.autor_id 
-                FROM POST p 
-                WHERE p.id_post = ?
-            ) AND u.id_usuario != ?
-            """
-            
-            result = self.db_client.execute_query(query, [post_id, post_id, creador_id])
-            
-            if result.get('success'):
-                subscribers = result.get('results', [])
-                notifications_created = 0
-                
-                from datetime import datetime
-                now = datetime.now().isoformat()
-                
-                for subscriber_data in subscribers:
-                    if isinstance(subscriber_data, dict):
-                        usuario_id = subscriber_data.get('id_usuario')
-                    else:
-                        usuario_id = subscriber_data[0] if len(subscriber_data) > 0 else None
-                    
-                    if not usuario_id:
-                        continue
-                    
-                    # Crear notificación
-                    insert_query = """
-                    INSERT INTO NOTIFICACION (usuario_id, titulo, mensaje, tipo, referencia_id, referencia_tipo, fecha, creador_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """
-                    
-                    titulo = "💬 Nuevo comentario en post suscrito"
-                    mensaje = f"{creador_email} comentó en '{titulo_post}'"
-                    
-                    notif_result = self.db_client.execute_query(insert_query, [
-                        usuario_id, titulo, mensaje, 'post', comentario_id, 'comentario', now, creador_id
-                    ])
-                    
-                    if notif_result.get('success'):
-                        notifications_created += 1
-                
-                self.logger.info(f"💬 {notifications_created} notificaciones creadas para nuevo comentario en post {post_id}")
-                return json.dumps({
-                    "success": True,
-                    "message": f"Se crearon {notifications_created} notificaciones",
-                    "notifications_created": notifications_created
-                })
-            else:
-                return json.dumps({"success": False, "message": f"Error obteniendo suscriptores: {result.get('error')}"})
+            return json.dumps(self._notify_comment_subscribers(post_id, comentario_id, titulo_post,
+                                                               user_payload.get('id_usuario'),
+                                                               user_payload.get('email')))
                 
         except Exception as e:
             self.logger.error(f"Error en create_comment_notification: {e}")
             return json.dumps({"success": False, "message": f"Error interno: {str(e)}"})
 
+    def _notify_comment_subscribers(self, post_id: int, comentario_id: int, titulo_post: str,
+                                    creador_id: int, creador_email: str) -> Dict[str, Any]:
+        # Obtener usuarios suscritos al post (excepto el creador del comentario)
+        # También incluir al autor del post si no está suscrito explícitamente
+        query = """
+        SELECT DISTINCT u.id_usuario, u.email
+        FROM USUARIO u
+        WHERE u.id_usuario IN (
+            SELECT sp.usuario_id 
+            FROM SUSCRIPCION_POST sp 
+            WHERE sp.post_id = ? AND sp.activa = TRUE
+            UNION
+            SELECT p.autor_id 
+            FROM POST p 
+            WHERE p.id_post = ?
+        ) AND u.id_usuario != ?
+        """
+        
+        result = self.db_client.execute_query(query, [post_id, post_id, creador_id])
+        
+        if not result.get('success'):
+            return {"success": False, "message": f"Error obteniendo suscriptores: {result.get('error')}"}
+        
+        notifications_created, notifications_failed = self._insert_notifications(
+            result.get('results', []), 'id_usuario', "💬 Nuevo comentario en post suscrito",
+            f"{creador_email} comentó en '{titulo_post}'", 'post', comentario_id, 'comentario', creador_id)
+        
+        self.logger.info(f"💬 {notifications_created} notificaciones creadas para nuevo comentario en post {post_id}")
+        return {
+            "success": True,
+            "message": f"Se crearon {notifications_created} notificaciones",
+            "notifications_created": notifications_created,
+            "notifications_failed": notifications_failed
+        }
+
     def service_create_message_notification(self, params_str: str) -> str:
         """Crea una notificación para el destinatario de un mensaje"""
         try:
@@ -1305,58 +1313,35 @@ class NotificationService(SOAServiceBase):
                 return json.dumps({"success": False, "message": token_result.get('message')})
             
             user_payload = token_result['payload']
-            creador_id = user_payload.get('id_usuario')
-            creador_email = user_payload.get('email')
-            
-            # Obtener todos los moderadores
-            query = "SELECT id_usuario FROM USUARIO WHERE rol = 'moderador'"
-            result = self.db_client.execute_query(query, [])
-            
-            if result.get('success'):
-                moderadores = result.get('results', [])
-                notifications_created = 0
-                
-                from datetime import datetime
-                now = datetime.now().isoformat()
-                
-                for mod_data in moderadores:
-                    if isinstance(mod_data, dict):
-                        usuario_id = mod_data.get('id_usuario')
-                    else:
-                        usuario_id = mod_data[0] if len(mod_data) > 0 else None
-                    
-                    if not usuario_id:
-                        continue
-                    
-                    # Crear notificación
-                    insert_query = """
-                    INSERT INTO NOTIFICACION (usuario_id, titulo, mensaje, tipo, referencia_id, referencia_tipo, fecha, creador_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """
-                    
-                    titulo = "⚠️ Nuevo reporte recibido"
-                    mensaje = f"Reporte de {tipo_contenido} por {creador_email}: {razon[:100]}{'...' if len(razon) > 100 else ''}"
-                    
-                    notif_result = self.db_client.execute_query(insert_query, [
-                        usuario_id, titulo, mensaje, 'reporte', reporte_id, 'reporte', now, creador_id
-                    ])
-                    
-                    if notif_result.get('success'):
-                        notifications_created += 1
-                
-                self.logger.info(f"⚠️ {notifications_created} notificaciones creadas para nuevo reporte {reporte_id}")
-                return json.dumps({
-                    "success": True,
-                    "message": f"Se crearon {notifications_created} notificaciones para moderadores",
-                    "notifications_created": notifications_created
-                })
-            else:
-                return json.dumps({"success": False, "message": f"Error obteniendo moderadores: {result.get('error')}"})
+            return json.dumps(self._notify_moderators(reporte_id, razon, tipo_contenido,
+                                                      user_payload.get('id_usuario'), user_payload.get('email')))
                 
         except Exception as e:
             self.logger.error(f"Error en create_report_notification: {e}")
             return json.dumps({"success": False, "message": f"Error interno: {str(e)}"})
 
+    def _notify_moderators(self, reporte_id: int, razon: str, tipo_contenido: str,
+                           creador_id: int, creador_email: str) -> Dict[str, Any]:
+        # Obtener todos los moderadores
+        query = "SELECT id_usuario FROM USUARIO WHERE rol = 'moderador'"
+        result = self.db_client.execute_query(query, [])
+        
+        if not result.get('success'):
+            return {"success": False, "message": f"Error obteniendo moderadores: {result.get('error')}"}
+        
+        mensaje = f"Reporte de {tipo_contenido} por {creador_email}: {razon[:100]}{'...' if len(razon) > 100 else ''}"
+        notifications_created, notifications_failed = self._insert_notifications(
+            result.get('results', []), 'id_usuario', "⚠️ Nuevo reporte recibido", mensaje,
+            'reporte', reporte_id, 'reporte', creador_id)
+        
+        self.logger.info(f"⚠️ {notifications_created} notificaciones creadas para nuevo reporte {reporte_id}")
+        return {
+            "success": True,
+            "message": f"Se crearon {notifications_created} notificaciones para moderadores",
+            "notifications_created": notifications_created,
+            "notifications_failed": notifications_failed
+        }
+
     def service_assign_moderation_task_notification(self, params_str: str) -> str:
         """Crea notificación cuando se asigna una tarea de moderación"""
         try:
@@ -1444,6 +1429,68 @@ class NotificationService(SOAServiceBase):
             self.logger.error(f"Error en assign_moderation_task_notification: {e}")
             return json.dumps({"success": False, "message": f"Error interno: {str(e)}"})
 
+    # === EVENTOS DE DOMINIO ===
+    # Un evento puede llegar más de una vez; devolver False hace que el bus lo reintente más tarde. Los reintentos
+    # son seguros: _insert_notifications salta a quien ya tiene la notificación de esa referencia
+
+    @staticmethod
+    def _preview(texto: str) -> str:
+        return texto[:50] + ("..." if len(texto) > 50 else "")
+
+    def _load_event_row(self, query: str, entity_id: Any) -> Optional[Dict[str, Any]]:
+        """
+        Fila que describe el evento leída de la base de datos: del evento solo se usa el id, porque el contenido
+        lo escribió quien publicó. Devuelve {} si no existe (evento falso o ya borrado) y None si falló la consulta
+        """
+        try:
+            entity_id = int(entity_id)
+        except (TypeError, ValueError):
+            return {}
+        result = self.db_client.execute_query(query, [entity_id])
+        if not result.get('success'):
+            return None
+        rows = result.get('results') or []
+        return rows[0] if rows else {}
+
+    def _on_post_created(self, event: Dict[str, Any], event_id: str) -> bool:
+        post = self._load_event_row("""
+        SELECT p.id_post, p.id_foro, p.contenido, p.autor_id, u.email
+        FROM POST p LEFT JOIN USUARIO u ON p.autor_id = u.id_usuario
+        WHERE p.id_post = ?
+        """, event.get('id_post'))
+        if not post:
+            return post is not None
+        result = self._notify_post_subscribers(post['id_foro'], post['id_post'], self._preview(post['contenido'] or ''),
+                                               post['autor_id'], post.get('email') or '')
+        return result.get('success', False) and not result.get('notifications_failed')
+
+    def _on_comment_created(self, event: Dict[str, Any], event_id: str) -> bool:
+        comment = self._load_event_row("""
+        SELECT c.id_comentario, c.id_post, c.autor_id, p.contenido AS post_contenido, u.email
+        FROM COMENTARIO c
+        JOIN POST p ON c.id_post = p.id_post
+        LEFT JOIN USUARIO u ON c.autor_id = u.id_usuario
+        WHERE c.id_comentario = ?
+        """, event.get('id_comentario'))
+        if not comment:
+            return comment is not None
+        result = self._notify_comment_subscribers(comment['id_post'], comment['id_comentario'],
+                                                  self._preview(comment['post_contenido'] or ''),
+                                                  comment['autor_id'], comment.get('email') or '')
+        return result.get('success', False) and not result.get('notifications_failed')
+
+    def _on_report_created(self, event: Dict[str, Any], event_id: str) -> bool:
+        report = self._load_event_row("""
+        SELECT r.id_reporte, r.razon, r.tipo_contenido, r.reportado_por, u.email
+        FROM REPORTE r LEFT JOIN USUARIO u ON r.reportado_por = u.id_usuario
+        WHERE r.id_reporte = ?
+        """, event.get('id_reporte'))
+        if not report:
+            return report is not None
+        result = self._notify_moderators(report['id_reporte'], report['razon'] or '', report['tipo_contenido'] or '',
+                                         report['reportado_por'], report.get('email') or '')
+        return result.get('success', False) and not result.get('notifications_failed')
+
     def service_info(self, *args) -> str:
         """Método abstracto requerido por SOAServiceBase"""
         info_data = {
@@ -1453,6 +1500,7 @@ class NotificationService(SOAServiceBase):
             "database": "Cloudflare D1 (remota)",
             "tables": ["NOTIFICACION", "SUSCRIPCION_FORO", "SUSCRIPCION_POST"],
             "authentication": "JWT Token required",
+            "db_cache": self.db_client.cache_stats(),
             "port": self.port,
             "host": self.host,
             "methods": list(self.methods.keys()) if hasattr(self, 'methods') else [],
@@ -113,7 +113,7 @@ class PostService(SOAServiceBase):
         """Obtiene información de un usuario por ID"""
         try:
             query = "SELECT id_usuario, email, rol FROM USUARIO WHERE id_usuario = ?"
-            result = self.db_client.execute_query(query, [user_id])
+            result = self.db_client.execute_query(query, [user_id], cache_ttl=30)
             
             if result.get('success') and result.get('results'):
                 user_data = result['results'][0]
@@ -150,7 +150,7 @@ class PostService(SOAServiceBase):
         try:
             self.logger.info(f"Buscando foro con ID: {id_foro} (tipo: {type(id_foro)})")
             query = "SELECT id_foro, titulo FROM FORO WHERE id_foro = ?"
-            result = self.db_client.execute_query(query, [id_foro])
+            result = self.db_client.execute_query(query, [id_foro], cache_ttl=10)
             
             self.logger.info(f"Resultado consulta foro: {result}")
             
@@ -268,6 +268,14 @@ class PostService(SOAServiceBase):
                 autor_email = user_info['user']['email'] if user_info.get('success') else 'Desconocido'
                 
                 self.logger.info(f"💬 Post creado en foro {id_foro_int} por {autor_email} con ID {post_id}")
+                # Las notificaciones a los suscriptores del foro las crea NOTIF al recibir el evento
+                self.publish_event("post.created", {
+                    "id_post": post_id,
+                    "id_foro": id_foro_int,
+                    "contenido": contenido,
+                    "autor_id": autor_id,
+                    "autor_email": autor_email
+                })
                 return json.dumps({
                     "success": True, 
                     "message": "Post creado exitosamente",
@@ -663,6 +671,7 @@ class PostService(SOAServiceBase):
             "database": "Cloudflare D1 (remota)",
             "table": "POST",
             "authentication": "JWT Token required",
+            "db_cache": self.db_client.cache_stats(),
             "port": self.port,
             "host": self.host,
             "methods": list(self.methods.keys()) if hasattr(self, 'methods') else [],
@@ -15,7 +15,7 @@ from soa_service_base import SOAServiceBase
 from database_client import DatabaseClient
 
 class ProfileService(SOAServiceBase):
-    def __init__(self, host: str = 'localhost', port: int = 0, proxy_url: str = "https://d1-database-proxy.maliagapacheco.workers.dev/query"):
+    def __init__(self, host: str = 'localhost', port: int = 0, proxy_url: Optional[str] = None):
         super().__init__(
             service_name="PROFS",
             host=host,
@@ -33,7 +33,7 @@ class ProfileService(SOAServiceBase):
         # Inicializar base de datos
         self._init_database()
         
-        self.logger.info(f"Servicio de perfiles inicializado con BD remota: {proxy_url}")
+        self.logger.info(f"Servicio de perfiles inicializado con BD remota: {self.db.proxy_url}")
         self.logger.info("🔐 Servicio requiere autenticación JWT")
     
     def _init_database(self):
@@ -809,7 +809,7 @@ def main():
             print("Puerto inválido, usando puerto automático")
     
     # Permitir especificar URL del proxy
-    proxy_url = "https://d1-database-proxy.maliagapacheco.workers.dev/query"
+    proxy_url = None
     if len(sys.argv) > 2:
         proxy_url = sys.argv[2]
     
@@ -818,7 +818,7 @@ def main():
     
     print(f"\n👤 SERVICIO DE GESTIÓN DE PERFILES")
     print(f"===================================")
-    print(f"Base de datos: {proxy_url}")
+    print(f"Base de datos: {service.db.proxy_url}")
     print(f"Puerto: {service.port}")
     print(f"Métodos disponibles: {', '.join(service.get_available_methods())}")
     print(f"🔐 Todos los métodos requieren autenticación JWT")
@@ -239,6 +239,15 @@ class ReportService(SOAServiceBase):
                 reportador_email = user_info['user']['email'] if user_info.get('success') else 'Desconocido'
                 
                 self.logger.info(f"📋 Reporte creado: {tipo_contenido} {contenido_id} por {reportador_email}")
+                # Las notificaciones a los moderadores las crea NOTIF al recibir el evento
+                self.publish_event("report.created", {
+                    "id_reporte": reporte_id,
+                    "contenido_id": int(contenido_id),
+                    "tipo_contenido": tipo_contenido,
+                    "razon": razon,
+                    "reportado_por": reportado_por,
+                    "reportador_email": reportador_email
+                })
                 return json.dumps({
                     "success": True, 
                     "message": "Reporte creado exitosamente",
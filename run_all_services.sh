@@ -22,6 +22,20 @@ PYTHON=${PYTHON:-python3}
 LOG_DIR="logs"
 mkdir -p "$LOG_DIR"
 
+# Bus y servicios en la misma máquina: además de TCP se hablan por sockets Unix en este directorio
+export SOA_UDS_DIR=${SOA_UDS_DIR:-/tmp/soa_uds}
+mkdir -p "$SOA_UDS_DIR"
+
+# Procesos por servicio (prefork con SO_REUSEPORT); 1 = un solo proceso
+export SOA_SERVICE_PROCESSES=${SOA_SERVICE_PROCESSES:-1}
+
+# Base de datos: "http" = proxy de Cloudflare D1, "sqlite" = fichero local compartido por todos los servicios
+export DB_BACKEND=${DB_BACKEND:-http}
+export DB_SQLITE_PATH=${DB_SQLITE_PATH:-data/soa_local.db}
+
+# Caché de lecturas de DatabaseClient en bytes por proceso; 0 = desactivada
+export DB_CACHE_BYTES=${DB_CACHE_BYTES:-0}
+
 # Array con pares "comando|nombre_log"
 python_services=(
     "soa_server.py|soa_server"
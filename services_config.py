@@ -26,7 +26,40 @@ class ServicesConfig:
                 "host": "localhost",
                 "icon": "🏢",
                 "enabled": True,
-                "dependencies": []
+                "dependencies": [],
+                # Límites de concurrencia del bus hacia cada servicio ("NOMBRE") o método ("NOMBRE.metodo")
+                "bulkheads": {
+                    "NOTIF": {"max_concurrent": 8, "max_queue": 8, "max_wait": 0.5},
+                    "NOTIF.create_event_notification": {"max_concurrent": 4, "max_queue": 4, "max_wait": 0.2}
+                },
+                # Cubetas de tokens por cliente (sujeto del JWT, cliente reenviado por un proxy de confianza o
+                # dirección): rate por segundo y ráfaga burst
+                "rate_limits": {
+                    "AUTH_.login": {"rate": 2.0, "burst": 10},
+                    "AUTH_.register": {"rate": 0.5, "burst": 5}
+                },
+                # Hosts cuyo atributo c= (IP del cliente) se acepta; el gateway pone ahí la IP del WebSocket
+                "trusted_proxies": ["gateway"],
+                # Caché del bus para lecturas repetidas: ttl en segundos, shared = misma respuesta para cualquier
+                # token vigente (firma y exp verificadas en el bus con SOA_JWT_SECRET), invalidated_by = métodos que descartan lo cacheado ("método" del mismo servicio o "SERVICIO.método")
+                "response_cache": {
+                    "max_bytes": 8 * 1024 * 1024,
+                    "methods": {
+                        "FORUM.list_forums": {"ttl": 5, "shared": True,
+                                              "invalidated_by": ["create_forum", "update_forum", "delete_forum",
+                                                                 "admin_delete_forum"]},
+                        "FORUM.get_forum": {"ttl": 10, "shared": True,
+                                            "invalidated_by": ["update_forum", "delete_forum", "admin_delete_forum"]},
+                        "EVNTS.list_events": {"ttl": 5, "shared": True,
+                                              "invalidated_by": ["create_event", "update_event", "delete_event",
+                                                                 "admin_delete_event"]},
+                        "POSTS.get_post": {"ttl": 10, "shared": True,
+                                           "invalidated_by": ["update_post", "delete_post", "admin_delete_post",
+                                                              # El post lleva el título del foro y borrar el foro borra sus posts
+                                                              "FORUM.update_forum", "FORUM.delete_forum",
+                                                              "FORUM.admin_delete_forum"]}
+                    }
+                }
             },
             "auth": {
                 "name": "Authentication Service",
@@ -185,6 +218,25 @@ class ServicesConfig:
         """Obtiene configuración de un servicio específico"""
         return self.services.get(service_id, {})
     
+    def get_bulkheads(self) -> Dict[str, Dict[str, Any]]:
+        """Obtiene los límites de concurrencia que aplica el bus a cada servicio o método"""
+        return self.services.get('soa_server', {}).get('bulkheads', {})
+    
+    def get_rate_limits(self) -> Dict[str, Dict[str, float]]:
+        """Obtiene los límites de peticiones por cliente que aplica el bus a cada servicio o método"""
+        return self.services.get('soa_server', {}).get('rate_limits', {})
+    
+    def get_trusted_proxies(self) -> List[str]:
+        """Obtiene los proxies (el gateway) de los que el bus acepta la identidad reenviada del cliente"""
+        proxies = os.getenv('SOA_TRUSTED_PROXIES')
+        if proxies is not None:
+            return [proxy.strip() for proxy in proxies.split(',') if proxy.strip()]
+        return self.services.get('soa_server', {}).get('trusted_proxies', [])
+    
+    def get_response_cache(self) -> Dict[str, Any]:
+        """Obtiene la configuración de la caché de respuestas del bus"""
+        return self.services.get('soa_server', {}).get('response_cache', {})
+    
     def get_enabled_services(self) -> List[str]:
         """Obtiene lista de servicios habilitados"""
         return [sid for sid, config in self.services.items() 
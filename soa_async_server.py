@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import time
+from concurrent import futures
+from typing import Dict, Any, Optional, Union
+from soa_protocol import SOAProtocol
+from soa_server import SOAServer
+from soa_connection_pool import AsyncSOAConnectionPool, InProcessChannel
+from soa_resilience import AsyncBulkhead, BulkheadFullError, CircuitOpenError
+
+logger = logging.getLogger('SOA_AsyncServer')
+
+class AsyncSOAServer(SOAServer):
+    """Bus SOA sobre asyncio: mismo registro y mismo formato de frames, sin un hilo por conexión"""
+
+    def __init__(self, host: str = 'localhost', port: int = 8000, keep_alive_timeout: float = 60.0,
+                 pool_size: int = 64, pool_idle_timeout: float = 30.0, backlog: int = 1024, **kwargs):
+        # El resto de opciones (balanceo, heartbeats, timeouts, circuitos) son las mismas que en SOAServer
+        super().__init__(host=host, port=port, keep_alive_timeout=keep_alive_timeout,
+                         pool_size=pool_size, pool_idle_timeout=pool_idle_timeout, **kwargs)
+
+        self.backlog = backlog
+        self.connection_pool = AsyncSOAConnectionPool(max_size=pool_size, max_idle_time=pool_idle_timeout,
+                                                      connect_timeout=self.connect_timeout)
+
+        self._server = None
+        self._loop = None
+
+    def _create_executors(self, pipeline_workers: int, batch_workers: int):
+        # El pipeline y el fan-out de los batch se atienden como tareas del loop: no hacen falta hilos
+        return None, None
+
+    def start_server(self):
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            logger.error(f"Error iniciando servidor: {e}")
+        finally:
+            self.stop_server()
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(
+            self._handle_client_async, self.host, self.port, backlog=self.backlog
+        )
+        unix_server = None
+        if self.uds_path:
+            # listen_unix limpia el socket de una ejecución anterior y crea el directorio
+            self.uds_socket = SOAProtocol.listen_unix(self.uds_path, self.backlog)
+            unix_server = await asyncio.start_unix_server(self._handle_client_async, sock=self.uds_socket)
+        self.running = True
+
+        logger.info(f"Servidor SOA (asyncio) iniciado en {self.host}:{self.port}")
+        if unix_server is not None:
+            logger.info(f"Escuchando también en el socket Unix {self.uds_path}")
+        logger.info("Esperando conexiones...")
+
+        reaper = asyncio.ensure_future(self._reap_dead_services_async()) if self.heartbeat_interval > 0 else None
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if reaper is not None:
+                reaper.cancel()
+            if unix_server is not None:
+                unix_server.close()
+                self._close_unix_listener()
+            self.connection_pool.close_all()
+
+    def stop_server(self):
+        self.running = False
+        self._events_stop.set()
+        self.event_broker.close()
+        if self._server is not None and self._loop is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._server.close)
+            except RuntimeError:
+                pass
+        if self.response_cache is not None:
+            logger.info(f"Caché de respuestas: {self.response_cache.stats()}")
+        if self.event_broker.subscriptions:
+            logger.info(f"Eventos: {self.event_broker.stats()}")
+        logger.info("Servidor SOA detenido")
+
+    async def _reap_dead_services_async(self):
+        while self.running:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                self.evict_dead_instances()
+            except Exception as e:
+                logger.error(f"Error revisando heartbeats: {e}")
+
+    async def _handle_client_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # En un socket Unix el peer no tiene dirección
+        address = writer.get_extra_info('peername') or self.uds_path
+        logger.info(f"Nueva conexión desde {address}")
+
+        keep_alive = False
+        byte_mode = False
+        idle_timeout = None
+        in_flight = set()
+        try:
+            while True:
+                try:
+                    if byte_mode:
+                        read = SOAProtocol.read_frame_async(reader)
+                    else:
+                        read = SOAProtocol.read_message_async(reader)
+                    raw_message = await asyncio.wait_for(read, idle_timeout)
+                except asyncio.TimeoutError:
+                    logger.info(f"Conexión keep-alive con {address} inactiva, cerrando")
+                    break
+                if raw_message is None:
+                    break
+
+                action = None
+                try:
+                    logger.info(f"Mensaje raw recibido: {raw_message}")
+
+                    message = self._parse_client_frame(raw_message, byte_mode)
+                    logger.info(f"Mensaje parseado: {message}")
+                    action = message.get('action')
+                    rejection = self._admission_error(message, address)
+
+                    if action == 'keep_alive':
+                        keep_alive = True
+                        requested = message.get('timeout')
+                        idle_timeout = min(requested, self.keep_alive_timeout) if requested else self.keep_alive_timeout
+                        response_msg = SOAProtocol.create_response("srvr", True, f"keep-alive {idle_timeout}")
+                    elif action == 'byte_mode':
+                        response_msg = SOAProtocol.create_response("srvr", True, "byte-mode")
+                    elif rejection:
+                        response_msg = rejection
+                    elif keep_alive and message.get('request_id'):
+                        # Petición con id en una conexión keep-alive: se atiende en paralelo y se sigue leyendo
+                        task = asyncio.ensure_future(self._respond_pipelined_async(writer, message, byte_mode))
+                        in_flight.add(task)
+                        task.add_done_callback(in_flight.discard)
+                        continue
+                    else:
+                        response_msg = await self._build_response_message_async(message)
+
+                    logger.info(f"Enviando respuesta: {response_msg}")
+
+                except Exception as e:
+                    logger.error(f"Error procesando petición: {e}")
+                    response_msg = SOAProtocol.create_response("srvr", False, error_msg=f"Server error: {str(e)}")
+
+                writer.write(SOAProtocol.to_wire(response_msg, byte_mode))
+                await writer.drain()
+
+                if action == 'byte_mode':
+                    byte_mode = True
+
+                if not keep_alive and action not in ('keep_alive', 'byte_mode'):
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logger.info(f"Cliente {address} desconectado")
+        except Exception as e:
+            logger.error(f"Error manejando cliente {address}: {e}")
+        finally:
+            # El cliente puede cerrar su lado de escritura y seguir esperando respuestas pendientes
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+            writer.close()
+
+    async def _respond_pipelined_async(self, writer: asyncio.StreamWriter, message: Dict[str, Any], byte_mode: bool):
+        try:
+            response_msg = await self._build_response_message_async(message)
+        except Exception as e:
+            logger.error(f"Error procesando petición {message.get('request_id')}: {e}")
+            response_msg = SOAProtocol.create_response("srvr", False, error_msg=f"Server error: {str(e)}",
+                                                       request_id=message.get('request_id'))
+
+        logger.info(f"Enviando respuesta: {response_msg}")
+        try:
+            # write() no se intercala con otras escrituras del loop, así que el frame sale entero
+            writer.write(SOAProtocol.to_wire(response_msg, byte_mode))
+            await writer.drain()
+        except (ConnectionError, OSError) as e:
+            logger.info(f"No se pudo enviar la respuesta {message.get('request_id')}: {e}")
+
+    async def _build_response_message_async(self, message: Dict[str, Any]) -> str:
+        if message.get('action') == 'call_service':
+            response = await self.call_service_async(message)
+        elif message.get('action') == 'batch_call':
+            response = await self.batch_call_async(message)
+        else:
+            # Las operaciones de registro solo tocan memoria, pueden ejecutarse en el loop
+            response = self.process_request(message)
+        return self._format_response(message, response)
+
+    async def batch_call_async(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        calls = message.get('calls', [])
+        error = self._validate_batch(calls)
+        if error:
+            return error
+
+        if message.get('timeout_ms') is not None:
+            calls = [dict(call, timeout_ms=message['timeout_ms']) for call in calls]
+        results = await asyncio.gather(*(self.call_service_async(call) for call in calls))
+        return self._batch_result(calls, results)
+
+    async def call_service_async(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        cache_key, cached, generation = self._cache_lookup(message)
+        if cached is not None:
+            return cached
+
+        response = await self._call_service_async(message)
+        self._cache_update(message, cache_key, generation, response)
+        return response
+
+    async def _call_service_async(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        service_name = message.get('service_name')
+        bulkheads = []
+        try:
+            bulkheads, message = await self._enter_bulkheads_async(message)
+            error, call = self._prepare_call(message)
+            if error:
+                return error
+            instance, pool, service_request, budget = call
+
+            instance.begin()
+            started = time.monotonic()
+            success = False
+            try:
+                response_str = await self._forward_to_service_async(pool, service_request, budget)
+                success = True
+            finally:
+                instance.end(time.monotonic() - started, success)
+
+            return self._service_result(response_str, passthrough=message.get('frame') is not None)
+
+        except (CircuitOpenError, BulkheadFullError) as e:
+            return self._rejected_result(e)
+        except (asyncio.TimeoutError, TimeoutError) as e:
+            return self._timeout_result(service_name, e)
+        except Exception as e:
+            logger.error(f"Error llamando servicio {service_name}: {e}")
+            return {
+                "status": "error",
+                "message": f"Service call error: {str(e)}"
+            }
+        finally:
+            self._leave_bulkheads(bulkheads)
+
+    def _create_bulkhead(self, key: str, spec: Dict[str, Any]) -> AsyncBulkhead:
+        return AsyncBulkhead(key, **spec)
+
+    async def _enter_bulkheads_async(self, message: Dict[str, Any]):
+        service_name = message.get('service_name')
+        bulkheads = self._bulkheads_for(service_name, message.get('method'))
+        if not bulkheads:
+            return [], message
+
+        started = time.monotonic()
+        budget = self._call_budget(service_name, message.get('timeout_ms'))
+        acquired = []
+        try:
+            for bulkhead in bulkheads:
+                await bulkhead.acquire(budget - (time.monotonic() - started))
+                acquired.append(bulkhead)
+        except BaseException:
+            # También si la tarea se cancela mientras espera plaza
+            self._leave_bulkheads(acquired)
+            raise
+        return acquired, self._after_wait(message, budget, started)
+
+    def _deliver_event(self, service_name: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        # Los hilos de entrega usan el mismo camino asíncrono que las llamadas de los clientes
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return {"status": "error", "message": "Bus no iniciado"}
+        call = self._call_service_async(self._event_call(service_name, event))
+        future = asyncio.run_coroutine_threadsafe(call, loop)
+        # La llamada ya tiene su propio plazo; este límite solo evita que un loop atascado bloquee el hilo de entrega
+        limit = self._call_budget(service_name, None) + self.connect_timeout + 5.0
+        try:
+            return future.result(limit)
+        except futures.TimeoutError:
+            future.cancel()
+            return {"status": "error", "message": f"Entrega a {service_name} sin respuesta del loop en {limit:.1f}s"}
+
+    async def _forward_to_service_async(self, pool, service_request: Union[str, bytes],
+                                        timeout: Optional[float] = None) -> Union[str, bytes]:
+        if isinstance(pool, InProcessChannel):
+            return await pool.request_async(service_request, timeout)
+        return await pool.request(service_request, timeout)
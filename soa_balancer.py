@@ -0,0 +1,120 @@
+import itertools
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Type, Union
+
+class ServiceInstance:
+    """Una instancia registrada de un servicio, con la carga y latencia observadas por el bus"""
+
+    def __init__(self, service_name: str, host: str, port: int, description: str = "",
+                 methods: Optional[List[str]] = None, breaker=None, uds_path: Optional[str] = None,
+                 local=None):
+        self.service_name = service_name
+        self.host = host
+        self.port = port
+        self.description = description
+        self.methods = methods or []
+        # Circuito opcional (soa_resilience.CircuitBreaker); el bus le informa del resultado de cada llamada
+        self.breaker = breaker
+        # Socket Unix de la instancia; solo se anota si existe en la máquina del bus (instancia local)
+        self.uds_path = uds_path
+        # Canal en memoria (soa_connection_pool.InProcessChannel) si el servicio corre en el proceso del bus
+        self.local = local
+        self.instance_id = f"{host}:{port}"
+        self.registered_at = time.time()
+        self.last_heartbeat = self.registered_at
+
+        self.outstanding = 0
+        self.ewma_latency = 0.0
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pool_key(self) -> str:
+        return f"{self.service_name}@{self.instance_id}"
+
+    def begin(self):
+        with self._lock:
+            self.outstanding += 1
+
+    def end(self, latency: float, success: bool = True, alpha: float = 0.3, error_penalty: float = 1.0):
+        with self._lock:
+            self.outstanding -= 1
+            self.calls += 1
+            if not success:
+                self.errors += 1
+                # Un fallo rápido no puede abaratar la instancia: cuenta como una llamada de al menos error_penalty s
+                latency = max(latency, error_penalty)
+            # La primera muestra fija el valor inicial; después se suaviza exponencialmente
+            if self.ewma_latency == 0.0:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency = alpha * latency + (1 - alpha) * self.ewma_latency
+        
+        if self.breaker is not None:
+            if success:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def stats(self) -> Dict[str, Any]:
+        breaker = self.breaker.stats() if self.breaker is not None else None
+        with self._lock:
+            return {
+                "breaker": breaker,
+                "instance_id": self.instance_id,
+                "host": self.host,
+                "port": self.port,
+                "uds_path": self.uds_path,
+                "in_process": self.local is not None,
+                "last_heartbeat": self.last_heartbeat,
+                "outstanding": self.outstanding,
+                "ewma_latency_ms": round(self.ewma_latency * 1000, 2),
+                "calls": self.calls,
+                "errors": self.errors
+            }
+
+class RoundRobinBalancer:
+    name = "round_robin"
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, instances: List[ServiceInstance]) -> ServiceInstance:
+        return instances[next(self._counter) % len(instances)]
+
+class LeastOutstandingBalancer(RoundRobinBalancer):
+    name = "least_outstanding"
+
+    def choose(self, instances: List[ServiceInstance]) -> ServiceInstance:
+        # Se empieza en una posición rotatoria para repartir los empates
+        start = next(self._counter) % len(instances)
+        rotated = instances[start:] + instances[:start]
+        return min(rotated, key=lambda instance: instance.outstanding)
+
+class EWMALatencyBalancer(RoundRobinBalancer):
+    name = "ewma"
+
+    def choose(self, instances: List[ServiceInstance]) -> ServiceInstance:
+        # Latencia suavizada ponderada por la cola pendiente; las instancias sin muestras (0.0) se prueban primero
+        start = next(self._counter) % len(instances)
+        rotated = instances[start:] + instances[:start]
+        return min(rotated, key=lambda instance: instance.ewma_latency * (instance.outstanding + 1))
+
+BALANCERS: Dict[str, Type[RoundRobinBalancer]] = {
+    RoundRobinBalancer.name: RoundRobinBalancer,
+    LeastOutstandingBalancer.name: LeastOutstandingBalancer,
+    EWMALatencyBalancer.name: EWMALatencyBalancer
+}
+
+def create_balancer(strategy: Optional[Union[str, Type[RoundRobinBalancer]]] = None) -> RoundRobinBalancer:
+    """Crea un balanceador por nombre (SOA_LB_STRATEGY por defecto) o a partir de una clase propia con choose()"""
+    if strategy is None:
+        strategy = os.getenv('SOA_LB_STRATEGY', RoundRobinBalancer.name)
+    if isinstance(strategy, str):
+        if strategy not in BALANCERS:
+            raise ValueError(f"Estrategia de balanceo desconocida: {strategy} (opciones: {', '.join(BALANCERS)})")
+        strategy = BALANCERS[strategy]
+    return strategy()
@@ -0,0 +1,143 @@
+import json
+import jwt
+import shlex
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+class ResponseCache:
+    """
+    Caché LRU del bus para métodos de solo lectura. Cada regla ("FORUM.list_forums") fija su ttl en segundos, si la
+    respuesta es la misma para todos los usuarios (shared: el token no forma parte de la clave) y qué métodos la
+    dejan obsoleta (invalidated_by: "método" del mismo servicio o "SERVICIO.método" de otro). Las copias
+    compartidas solo se sirven a tokens cuya firma HS256 y caducidad comprueba el bus con el secreto de los
+    servicios; sin jwt_secret no se comparte nada.
+    """
+
+    def __init__(self, methods: Dict[str, Dict[str, Any]], max_bytes: int = 8 * 1024 * 1024,
+                 jwt_secret: Optional[str] = None):
+        self.rules = methods
+        self.max_bytes = max_bytes
+        self.jwt_secret = jwt_secret
+
+        # (servicio, método que escribe) -> reglas a invalidar cuando se le llama
+        self._invalidators: Dict[Tuple[str, str], List[str]] = {}
+        for rule, spec in methods.items():
+            service_name = rule.split(".", 1)[0]
+            for writer in spec.get("invalidated_by", []):
+                writer_service, _, method = writer.rpartition(".")
+                self._invalidators.setdefault((writer_service or service_name, method), []).append(rule)
+
+        # Clave -> (caduca_en, resultado, tamaño); el orden es el de uso, el primero es el menos reciente
+        self._entries: "OrderedDict[Tuple[str, ...], Tuple[float, str, int]]" = OrderedDict()
+        self._keys_by_rule: Dict[str, Set[Tuple[str, ...]]] = {rule: set() for rule in methods}
+        # Una escritura sube la generación de sus reglas; una lectura que empezó antes ya no puede guardar su resultado
+        self._generations: Dict[str, int] = {rule: 0 for rule in methods}
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self._counters = {rule: {"hits": 0, "misses": 0, "invalidations": 0} for rule in methods}
+        self.evictions = 0
+
+    def key_for(self, service_name: str, method: str, params: str) -> Optional[Tuple[str, ...]]:
+        """Clave de la llamada con los parámetros normalizados, o None si no se cachea"""
+        rule = f"{service_name}.{method}"
+        spec = self.rules.get(rule)
+        if spec is None:
+            return None
+
+        try:
+            args = shlex.split(params or "")
+        except ValueError:
+            args = (params or "").split()
+
+        if spec.get("shared"):
+            # La copia compartida solo se sirve con un token vigente; sin él responde el servicio con su error
+            if not args or not self._token_alive(args[0]):
+                return None
+            args = args[1:]
+        return (rule, *args)
+
+    def _token_alive(self, token: str) -> bool:
+        # Misma verificación que hacen los servicios, y además se exige exp: un token sin caducidad no comparte caché
+        if not self.jwt_secret:
+            return False
+        try:
+            jwt.decode(token, self.jwt_secret, algorithms=["HS256"], options={"require": ["exp"]})
+            return True
+        except jwt.InvalidTokenError:
+            return False
+
+    def lookup(self, key: Tuple[str, ...]) -> Tuple[Optional[str], int]:
+        """Devuelve (resultado o None, generación a pasar a store si hay que pedírselo al servicio)"""
+        rule = key[0]
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._counters[rule]["hits"] += 1
+                    return entry[1], self._generations[rule]
+                self._remove(key)
+            self._counters[rule]["misses"] += 1
+            return None, self._generations[rule]
+
+    def store(self, key: Tuple[str, ...], result: str, generation: int):
+        if not self._cacheable(result):
+            return
+
+        rule = key[0]
+        size = len(result) + sum(len(part) for part in key)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation != self._generations[rule]:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.rules[rule].get("ttl", 5.0), result, size)
+            self._keys_by_rule[rule].add(key)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, service_name: str, method: str):
+        """Descarta las respuestas que deja obsoletas una llamada a service_name.method"""
+        rules = self._invalidators.get((service_name, method))
+        if not rules:
+            return
+
+        with self._lock:
+            for rule in rules:
+                self._generations[rule] += 1
+                for key in list(self._keys_by_rule[rule]):
+                    self._remove(key)
+                self._counters[rule]["invalidations"] += 1
+
+    def _remove(self, key: Tuple[str, ...]):
+        expires_at, result, size = self._entries.pop(key)
+        self._keys_by_rule[key[0]].discard(key)
+        self._size -= size
+
+    @staticmethod
+    def _cacheable(result: str) -> bool:
+        # Los servicios devuelven sus errores como OK con {"success": false}; esos no se guardan
+        try:
+            payload = json.loads(result)
+        except ValueError:
+            return True
+        return not (isinstance(payload, dict) and payload.get("success") is False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "evictions": self.evictions,
+                "methods": {rule: dict(counters) for rule, counters in self._counters.items()}
+            }
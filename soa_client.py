@@ -1,37 +1,193 @@
 import socket
 import logging
+import threading
 import json
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, Optional, Tuple, Union
 from soa_protocol import SOAProtocol
+from soa_balancer import ServiceInstance, RoundRobinBalancer
+from soa_connection_pool import SOAConnectionPool, ServiceUnreachableError
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('SOA_Client')
 
 class SOAClient:
-    def __init__(self, soa_server_host: str = 'localhost', soa_server_port: int = 8000):
+    def __init__(self, soa_server_host: str = 'localhost', soa_server_port: int = 8000,
+                 keep_alive: bool = False, byte_mode: bool = False, direct: bool = False,
+                 discovery_ttl: float = 5.0, request_timeout: Optional[float] = None,
+                 uds_path: Optional[str] = None):
         self.soa_server_host = soa_server_host
         self.soa_server_port = soa_server_port
+        # Socket Unix del bus; se usa en lugar de TCP cuando existe en esta máquina
+        self.uds_path = uds_path or SOAProtocol.uds_path(f"soa_bus-{soa_server_port}")
         # Token JWT en memoria
         self.current_token = None
         self.current_user = None  # Info del usuario logueado
         self.logger = logger
+        
+        # Conexión persistente con el bus (solo en modo keep-alive)
+        self.keep_alive = keep_alive
+        # Frames con longitud en bytes UTF-8 (se negocia con el bus al abrir cada conexión)
+        self.byte_mode = byte_mode
+        self._sock = None
+        self._sock_lock = threading.Lock()
+        self._next_request_id = 0
+        
+        # Plazo de cada llamada en segundos; viaja en el frame (to=) hasta el servicio
+        self.request_timeout = request_timeout
+        
+        # Modo directo: el bus solo se usa para discovery y las llamadas van a las instancias de cada servicio
+        self.direct = direct
+        self.discovery_ttl = discovery_ttl
+        self._registry: Dict[str, Dict[str, Any]] = {}
+        self._registry_version: Optional[str] = None
+        self._registry_checked_at = 0.0
+        self._registry_lock = threading.Lock()
+        self._instances: Dict[str, List[ServiceInstance]] = {}
+        self._balancers: Dict[str, RoundRobinBalancer] = {}
+        self._direct_pool = SOAConnectionPool(max_size=4) if direct else None
+    
+    def _open_connection(self, keep_alive: Optional[bool] = None) -> socket.socket:
+        sock = SOAProtocol.connect(self.soa_server_host, self.soa_server_port, self.uds_path)
+        
+        if self.keep_alive if keep_alive is None else keep_alive:
+            SOAProtocol.send_message(sock, SOAProtocol.create_keepalive_request())
+            response = SOAProtocol.parse_response(SOAProtocol.recv_message(sock) or "")
+            if response.get('status') != 'success':
+                sock.close()
+                raise ConnectionError(f"El bus rechazó keep-alive: {response.get('message')}")
+        
+        if self.byte_mode:
+            SOAProtocol.send_message(sock, SOAProtocol.create_bytemode_request())
+            response = SOAProtocol.parse_response(SOAProtocol.recv_message(sock) or "")
+            if response.get('status') != 'success':
+                sock.close()
+                raise ConnectionError(f"El bus rechazó el modo bytes: {response.get('message')}")
+        
+        return sock
+    
+    def _recv_response(self, sock: socket.socket) -> Optional[Union[str, bytearray]]:
+        if self.byte_mode:
+            return SOAProtocol.recv_frame(sock)
+        return SOAProtocol.recv_message(sock)
+    
+    def _exchange(self, message: str) -> Union[str, bytearray]:
+        if not self.keep_alive:
+            sock = self._open_connection()
+            try:
+                SOAProtocol.send_message(sock, message, self.byte_mode)
+                return self._recv_response(sock) or ""
+            finally:
+                sock.close()
+        
+        with self._sock_lock:
+            while True:
+                reused = self._sock is not None
+                if not reused:
+                    self._sock = self._open_connection()
+                # Reintentable mientras el bus no pueda haber atendido la petición: frame sin enviar o cierre de
+                # la conexión antes del primer byte de respuesta
+                retryable = True
+                try:
+                    SOAProtocol.send_message(self._sock, message, self.byte_mode)
+                    retryable = False
+                    response_str = self._recv_response(self._sock)
+                    if response_str is None:
+                        retryable = True
+                        raise ConnectionError("El bus cerró la conexión")
+                    return response_str
+                except (ConnectionError, OSError):
+                    self._close_connection()
+                    # Solo se reintenta si la conexión reutilizada estaba caducada (cierre por inactividad); un
+                    # timeout o un corte a mitad de respuesta se devuelven al llamador para no duplicar la llamada
+                    if not reused or not retryable:
+                        raise
+    
+    def _close_connection(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+    
+    def close(self):
+        with self._sock_lock:
+            self._close_connection()
+        if self._direct_pool is not None:
+            self._direct_pool.close_all()
+    
+    def discover(self, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Devuelve el registro del bus (servicios, métodos e instancias), consultándolo como mucho cada discovery_ttl segundos"""
+        with self._registry_lock:
+            if not force and time.time() - self._registry_checked_at < self.discovery_ttl:
+                return self._registry
+            
+            response = self._send_request(SOAProtocol.create_discover_request(self._registry_version))
+            if response.get('status') != 'success':
+                raise ConnectionError(f"Discovery falló: {response.get('message')}")
+            
+            snapshot = json.loads(response.get('result') or "{}")
+            self._registry_checked_at = time.time()
+            if snapshot.get('changed'):
+                self._registry = snapshot.get('services', {})
+                self._registry_version = snapshot.get('version')
+                self._instances = {
+                    name: [ServiceInstance(name, item['host'], item['port'], uds_path=item.get('uds_path'))
+                           for item in info.get('instances', [])]
+                    for name, info in self._registry.items()
+                }
+                self.logger.info(f"Registro actualizado a la versión {self._registry_version}")
+            
+            return self._registry
+    
+    def _pick_instance(self, service_name: str) -> Optional[ServiceInstance]:
+        self.discover()
+        with self._registry_lock:
+            instances = self._instances.get(service_name)
+            if not instances:
+                return None
+            balancer = self._balancers.setdefault(service_name, RoundRobinBalancer())
+            return balancer.choose(instances)
+    
+    def _call_direct(self, service_name: str, message: str) -> Dict[str, Any]:
+        try:
+            instance = self._pick_instance(service_name)
+        except Exception as e:
+            self.logger.warning(f"Discovery no disponible ({e}), llamando a través del bus")
+            return self._send_request(message)
+        if instance is None:
+            # Servicio desconocido en el registro local: el bus dará la respuesta definitiva
+            return self._send_request(message)
+        
+        try:
+            pool = self._direct_pool.get_pool(instance.pool_key, instance.host, instance.port,
+                                              uds_path=instance.uds_path)
+            self.logger.info(f"Enviando directo a {instance.instance_id}: {message}")
+            response_str = pool.request(message, self.request_timeout)
+            self.logger.info(f"Recibido: {response_str}")
+            return SOAProtocol.parse_response(response_str)
+        except ServiceUnreachableError as e:
+            # La instancia cayó o se movió antes de recibir nada: se refresca el registro y esta llamada va por el bus
+            self.logger.warning(f"Instancia {instance.instance_id} no disponible ({e}), reintentando vía bus")
+            self._registry_checked_at = 0.0
+            return self._send_request(message)
+        except Exception as e:
+            # La petición pudo llegar a ejecutarse (timeout, conexión cortada a mitad): repetirla podría duplicarla
+            self.logger.error(f"Llamada directa a {instance.instance_id} falló: {e}")
+            self._registry_checked_at = 0.0
+            return {
+                "status": "error",
+                "message": f"Connection error: {str(e)}"
+            }
     
     def _send_request(self, message: str) -> Dict[str, Any]:
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((self.soa_server_host, self.soa_server_port))
-            
             self.logger.info(f"Enviando: {message}")
-            sock.send(message.encode('utf-8'))
-            
-            response_data = sock.recv(4096)
-            response_str = response_data.decode('utf-8')
+            response_str = self._exchange(message)
             self.logger.info(f"Recibido: {response_str}")
             
-            response = SOAProtocol.parse_response(response_str)
-            
-            sock.close()
-            return response
+            return SOAProtocol.parse_response(response_str)
             
         except Exception as e:
             self.logger.error(f"Error enviando petición: {e}")
@@ -40,7 +196,101 @@ class SOAClient:
                 "message": f"Connection error: {str(e)}"
             }
     
+    def _exchange_pipelined(self, messages: Dict[str, str]) -> Dict[str, Union[str, bytearray]]:
+        """Envía todos los frames seguidos por una conexión keep-alive y recoge las respuestas por id"""
+        if self.keep_alive:
+            self._sock_lock.acquire()
+            if self._sock is None:
+                try:
+                    self._sock = self._open_connection()
+                except Exception:
+                    self._sock_lock.release()
+                    raise
+            sock = self._sock
+        else:
+            sock = self._open_connection(keep_alive=True)
+        
+        responses = {}
+        try:
+            wire = bytearray()
+            for message in messages.values():
+                wire += SOAProtocol.to_wire(message, self.byte_mode)
+            sock.sendall(wire)
+            
+            pending = list(messages.keys())
+            while pending:
+                response_str = self._recv_response(sock)
+                if response_str is None:
+                    raise ConnectionError("El bus cerró la conexión")
+                
+                request_id = SOAProtocol.parse_response(response_str).get('request_id')
+                # Un error sin id (p. ej. frame ilegible) corresponde al más antiguo pendiente
+                if request_id not in pending:
+                    request_id = pending[0]
+                pending.remove(request_id)
+                responses[request_id] = response_str
+        except Exception:
+            if self.keep_alive:
+                self._close_connection()
+            raise
+        finally:
+            if self.keep_alive:
+                self._sock_lock.release()
+            else:
+                sock.close()
+        
+        return responses
+    
+    def call_many(self, calls: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        """
+        Ejecuta varias llamadas (servicio, método, parámetros) en pipeline por una sola conexión.
+        El bus las atiende en paralelo; las respuestas se devuelven en el mismo orden que las llamadas.
+        """
+        messages = {}
+        for service_name, method, params_str in calls:
+            self._next_request_id += 1
+            request_id = str(self._next_request_id)
+            messages[request_id] = self._build_request(service_name, method, params_str, request_id)
+        
+        try:
+            self.logger.info(f"Enviando {len(messages)} peticiones en pipeline")
+            responses = self._exchange_pipelined(messages)
+        except Exception as e:
+            self.logger.error(f"Error enviando peticiones en pipeline: {e}")
+            return [{"status": "error", "message": f"Connection error: {str(e)}"} for _ in calls]
+        
+        return [SOAProtocol.parse_response(responses[request_id]) for request_id in messages]
+    
     def call_service(self, service_name: str, method: str, params_str: str = "") -> Dict[str, Any]:
+        message = self._build_request(service_name, method, params_str)
+        if self.direct:
+            return self._call_direct(service_name, message)
+        return self._send_request(message)
+    
+    def call_batch(self, calls: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        """
+        Envía varias llamadas (servicio, método, parámetros) en un único frame de batch.
+        El bus las reparte en paralelo y devuelve un resultado por llamada, en el mismo orden.
+        """
+        batch = [(service_name, method, self._with_token(service_name, method, params_str))
+                 for service_name, method, params_str in calls]
+        response = self._send_request(SOAProtocol.create_batch_request(batch))
+        
+        if response.get('status') != 'success':
+            return [{"status": "error", "message": response.get('message')} for _ in calls]
+        
+        try:
+            return json.loads(response.get('result') or "[]")
+        except json.JSONDecodeError as e:
+            return [{"status": "error", "message": f"Respuesta de batch inválida: {e}"} for _ in calls]
+    
+    def _build_request(self, service_name: str, method: str, params_str: str = "",
+                       request_id: Optional[str] = None) -> str:
+        params_str = self._with_token(service_name, method, params_str)
+        timeout_ms = int(self.request_timeout * 1000) if self.request_timeout else None
+        return SOAProtocol.create_request(service_name, method, params_str, request_id, timeout_ms)
+    
+    def _with_token(self, service_name: str, method: str, params_str: str = "") -> str:
         # Lista de servicios que requieren autenticación
         auth_required_services = ["PROFS", "FORUM", "POSTS", "COMMS", "EVNTS", "MSGES", "REPOR", "NOTIF"]
         
@@ -63,14 +313,29 @@ class SOAClient:
                 # Si no hay token, advertir al usuario
                 self.logger.warning(f"⚠️  {service_name}.{method} requiere autenticación pero no hay token disponible")
         
-        message = SOAProtocol.create_request(service_name, method, params_str)
-        return self._send_request(message)
+        return params_str
     
     def list_services(self) -> None:
         print("\n" + "="*60)
         print("SERVICIOS SOA DISPONIBLES")
         print("="*60)
-        print("Descubrimiento de servicios deshabilitado.")
+        
+        try:
+            registry = self.discover(force=True)
+        except Exception as e:
+            registry = None
+            self.logger.warning(f"No se pudo consultar el registro del bus: {e}")
+        
+        if registry is not None:
+            if not registry:
+                print("No hay servicios registrados en el bus.")
+            for name, info in sorted(registry.items()):
+                instances = ", ".join(item['instance_id'] for item in info.get('instances', []))
+                print(f"  {name} - {info.get('description', '')}")
+                print(f"     Métodos: {', '.join(info.get('methods', []))}")
+                print(f"     Instancias: {instances}")
+            return
+        
         print("Servicios conocidos:")
         print("  🔐 auth - Servicio de autenticación JWT con SQLite")
         print("     Métodos: login, register, verify, refresh, users, delete_user, info")
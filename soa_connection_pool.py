@@ -0,0 +1,520 @@
+import asyncio
+import os
+import socket
+import select
+import threading
+import logging
+import time
+from typing import Dict, Any, List, Optional, Union
+from soa_protocol import SOAProtocol
+
+logger = logging.getLogger('SOA_ConnectionPool')
+
+def _connect_budget(connect_timeout: Optional[float], timeout: Optional[float]) -> Optional[float]:
+    # Abrir una conexión nunca puede consumir más que lo que queda del plazo de la petición
+    if timeout is None:
+        return connect_timeout
+    if connect_timeout is None:
+        return timeout
+    return min(connect_timeout, timeout)
+
+class ServiceUnreachableError(ConnectionError):
+    """No se pudo abrir la conexión con el servicio: la petición no llegó a enviarse"""
+
+class PooledConnection:
+    def __init__(self, sock: socket.socket, keep_alive: bool, byte_mode: bool = False):
+        self.sock = sock
+        self.keep_alive = keep_alive
+        self.byte_mode = byte_mode
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.reused = False
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+class ServiceConnectionPool:
+    """Pool de conexiones keep-alive hacia una instancia (host:port) de un servicio"""
+
+    def __init__(self, host: str, port: int, max_size: int = 8, max_idle_time: float = 30.0,
+                 acquire_timeout: float = 5.0, connect_timeout: Optional[float] = None, uds_path: Optional[str] = None):
+        self.host = host
+        self.port = port
+        # Socket Unix de la instancia si está en la misma máquina; se prefiere a TCP
+        self.uds_path = uds_path
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.acquire_timeout = acquire_timeout
+        self.connect_timeout = connect_timeout
+
+        self._idle: List[PooledConnection] = []
+        self._in_use = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        # None hasta la primera conexión; False si el servicio no soporta keep-alive
+        self.keep_alive_supported: Optional[bool] = None
+
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        wait = self.acquire_timeout if timeout is None else min(self.acquire_timeout, timeout)
+        deadline = time.time() + wait
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise ConnectionError(f"Pool hacia {self.host}:{self.port} cerrado")
+
+                self._evict_expired()
+
+                while self._idle:
+                    conn = self._idle.pop()
+                    if self._is_healthy(conn):
+                        conn.reused = True
+                        self._in_use += 1
+                        self.reused += 1
+                        return conn
+                    conn.close()
+                    self.evicted += 1
+
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    break
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"Pool hacia {self.host}:{self.port} agotado ({self.max_size} conexiones en uso)")
+                self._condition.wait(remaining)
+
+        # La conexión se abre fuera del lock para no bloquear al resto de hilos
+        try:
+            conn = self._connect(_connect_budget(self.connect_timeout, timeout))
+        except Exception as e:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise ServiceUnreachableError(f"No se pudo conectar con {self.host}:{self.port}: {e}") from e
+
+        with self._condition:
+            self.created += 1
+        return conn
+
+    def release(self, conn: PooledConnection, reusable: bool = True):
+        with self._condition:
+            self._in_use -= 1
+            if reusable and conn.keep_alive and not self._closed:
+                conn.last_used = time.time()
+                self._idle.append(conn)
+            else:
+                conn.close()
+            self._condition.notify()
+
+    def request(self, message: Union[str, bytearray], timeout: Optional[float] = None) -> Union[str, bytearray]:
+        """Envía un frame por una conexión del pool y devuelve la respuesta; timeout cubre espera, envío y lectura"""
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            if deadline is not None and deadline <= time.time():
+                raise socket.timeout("timed out")
+            conn = self.acquire(None if deadline is None else deadline - time.time())
+            # Reintentable mientras el servicio no pueda haber ejecutado la llamada: frame sin enviar o cierre
+            # de la conexión antes del primer byte de respuesta
+            retryable = True
+            try:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise socket.timeout("timed out")
+                conn.sock.settimeout(remaining)
+                SOAProtocol.send_message(conn.sock, message, conn.byte_mode)
+                retryable = False
+                if conn.byte_mode:
+                    response_str = SOAProtocol.recv_frame(conn.sock)
+                else:
+                    response_str = SOAProtocol.recv_message(conn.sock)
+                if response_str is None:
+                    retryable = True
+                    raise ConnectionError("El servicio cerró la conexión sin responder")
+            except socket.timeout:
+                self.release(conn, reusable=False)
+                raise
+            except (ConnectionError, OSError):
+                self.release(conn, reusable=False)
+                # Una conexión reutilizada puede haber caducado en el servicio: se reintenta con otra, pero solo si
+                # la llamada no pudo ejecutarse; un corte a mitad de respuesta no se reenvía
+                if conn.reused and retryable:
+                    continue
+                raise
+            except Exception:
+                self.release(conn, reusable=False)
+                raise
+            
+            self.release(conn)
+            return response_str
+    
+    def close(self):
+        with self._condition:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "address": f"{self.host}:{self.port}",
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted
+            }
+
+    def _connect(self, timeout: Optional[float] = None) -> PooledConnection:
+        # timeout acota la conexión y la negociación; cada petición fija luego su propio timeout
+        sock = SOAProtocol.connect(self.host, self.port, self.uds_path, timeout)
+
+        if self.keep_alive_supported is False:
+            return PooledConnection(sock, keep_alive=False)
+
+        try:
+            SOAProtocol.send_message(sock, SOAProtocol.create_keepalive_request())
+            response = SOAProtocol.parse_response(SOAProtocol.recv_message(sock) or "")
+        except Exception:
+            sock.close()
+            raise
+
+        if response.get('status') == 'success':
+            self.keep_alive_supported = True
+            return PooledConnection(sock, keep_alive=True, byte_mode=self._negotiate_byte_mode(sock))
+
+        # El servicio no entiende keep-alive y ya cerró el socket: se usa una conexión por llamada
+        logger.warning(f"{self.host}:{self.port} no soporta keep-alive, usando conexiones de un solo uso")
+        sock.close()
+        self.keep_alive_supported = False
+        return self._connect(timeout)
+
+    @staticmethod
+    def _negotiate_byte_mode(sock: socket.socket) -> bool:
+        # La conexión ya es keep-alive, así que un NK aquí no la cierra: simplemente se queda en modo texto
+        try:
+            SOAProtocol.send_message(sock, SOAProtocol.create_bytemode_request())
+            response = SOAProtocol.parse_response(SOAProtocol.recv_message(sock) or "")
+        except Exception:
+            sock.close()
+            raise
+        return response.get('status') == 'success'
+
+    def _evict_expired(self):
+        now = time.time()
+        alive = []
+        for conn in self._idle:
+            if now - conn.last_used > self.max_idle_time:
+                conn.close()
+                self.evicted += 1
+            else:
+                alive.append(conn)
+        self._idle = alive
+
+    @staticmethod
+    def _is_healthy(conn: PooledConnection) -> bool:
+        # Una conexión inactiva sana no tiene nada que leer; si es legible, el peer la cerró o envió basura
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+class SOAConnectionPool:
+    """Pools de conexiones del bus, uno por instancia registrada (clave servicio@host:puerto)"""
+
+    def __init__(self, max_size: int = 8, max_idle_time: float = 30.0, acquire_timeout: float = 5.0,
+                 connect_timeout: Optional[float] = None):
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.acquire_timeout = acquire_timeout
+        self.connect_timeout = connect_timeout
+
+        self._pools: Dict[str, ServiceConnectionPool] = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, service_name: str, host: str, port: int, connect_timeout: Optional[float] = None,
+                 uds_path: Optional[str] = None) -> ServiceConnectionPool:
+        with self._lock:
+            pool = self._pools.get(service_name)
+            if pool is not None and (pool.host, pool.port, pool.uds_path) == (host, port, uds_path):
+                return pool
+
+            # El servicio se re-registró en otra dirección: las conexiones viejas ya no sirven
+            if pool is not None:
+                logger.info(f"{service_name} cambió a {host}:{port}, descartando pool hacia {pool.host}:{pool.port}")
+                pool.close()
+
+            pool = ServiceConnectionPool(host, port, self.max_size, self.max_idle_time, self.acquire_timeout,
+                                         connect_timeout if connect_timeout is not None else self.connect_timeout,
+                                         uds_path)
+            self._pools[service_name] = pool
+            return pool
+
+    def remove(self, service_name: str):
+        with self._lock:
+            pool = self._pools.pop(service_name, None)
+        if pool is not None:
+            pool.close()
+
+    def close_all(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            pools = dict(self._pools)
+        return {name: pool.stats() for name, pool in pools.items()}
+
+class AsyncPooledConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 keep_alive: bool, byte_mode: bool = False):
+        self.reader = reader
+        self.writer = writer
+        self.keep_alive = keep_alive
+        self.byte_mode = byte_mode
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.reused = False
+
+    def close(self):
+        self.writer.close()
+
+class AsyncServiceConnectionPool:
+    """Versión asyncio de ServiceConnectionPool, para el bus asíncrono"""
+
+    def __init__(self, host: str, port: int, max_size: int = 64, max_idle_time: float = 30.0,
+                 acquire_timeout: float = 5.0, connect_timeout: Optional[float] = None, uds_path: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.uds_path = uds_path
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.acquire_timeout = acquire_timeout
+        self.connect_timeout = connect_timeout
+
+        self._idle: List[AsyncPooledConnection] = []
+        self._slots = asyncio.Semaphore(max_size)
+        self._in_use = 0
+        self._closed = False
+
+        self.keep_alive_supported: Optional[bool] = None
+
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    async def acquire(self, timeout: Optional[float] = None) -> AsyncPooledConnection:
+        if self._closed:
+            raise ConnectionError(f"Pool hacia {self.host}:{self.port} cerrado")
+
+        wait = self.acquire_timeout if timeout is None else min(self.acquire_timeout, timeout)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), wait)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Pool hacia {self.host}:{self.port} agotado ({self.max_size} conexiones en uso)")
+        self._in_use += 1
+
+        now = time.time()
+        while self._idle:
+            conn = self._idle.pop()
+            if now - conn.last_used <= self.max_idle_time and self._is_healthy(conn):
+                conn.reused = True
+                self.reused += 1
+                return conn
+            conn.close()
+            self.evicted += 1
+
+        try:
+            conn = await asyncio.wait_for(self._connect(), _connect_budget(self.connect_timeout, timeout))
+        except BaseException:
+            self._in_use -= 1
+            self._slots.release()
+            raise
+
+        self.created += 1
+        return conn
+
+    def release(self, conn: AsyncPooledConnection, reusable: bool = True):
+        if reusable and conn.keep_alive and not self._closed:
+            conn.last_used = time.time()
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self._in_use -= 1
+        self._slots.release()
+
+    async def request(self, message: Union[str, bytes], timeout: Optional[float] = None) -> Union[str, bytes]:
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            conn = await self.acquire(None if deadline is None else deadline - time.time())
+            # Reintentable mientras el servicio no pueda haber ejecutado la llamada: frame sin enviar o cierre
+            # de la conexión antes del primer byte de respuesta
+            retryable = True
+            try:
+                conn.writer.write(SOAProtocol.to_wire(message, conn.byte_mode))
+                await conn.writer.drain()
+                retryable = False
+                if conn.byte_mode:
+                    read = SOAProtocol.read_frame_async(conn.reader)
+                else:
+                    read = SOAProtocol.read_message_async(conn.reader)
+                remaining = None if deadline is None else max(0.0, deadline - time.time())
+                response_str = await asyncio.wait_for(read, remaining)
+                if response_str is None:
+                    retryable = True
+                    raise ConnectionError("El servicio cerró la conexión sin responder")
+            except asyncio.TimeoutError:
+                # La respuesta puede llegar más tarde y desincronizar la conexión: se descarta sin reintentar
+                self.release(conn, reusable=False)
+                raise
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                self.release(conn, reusable=False)
+                # Una conexión reutilizada puede haber caducado en el servicio: se reintenta con otra, pero solo si
+                # la llamada no pudo ejecutarse; un corte a mitad de respuesta no se reenvía
+                if conn.reused and retryable:
+                    continue
+                raise
+            except BaseException:
+                self.release(conn, reusable=False)
+                raise
+
+            self.release(conn)
+            return response_str
+
+    def close(self):
+        self._closed = True
+        for conn in self._idle:
+            conn.close()
+        self._idle.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "address": f"{self.host}:{self.port}",
+            "in_use": self._in_use,
+            "idle": len(self._idle),
+            "created": self.created,
+            "reused": self.reused,
+            "evicted": self.evicted
+        }
+
+    async def _open(self):
+        if self.uds_path and os.path.exists(self.uds_path):
+            try:
+                return await asyncio.open_unix_connection(self.uds_path)
+            except OSError:
+                # Socket huérfano de un proceso que ya terminó: se sigue por TCP
+                pass
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def _connect(self) -> AsyncPooledConnection:
+        reader, writer = await self._open()
+
+        if self.keep_alive_supported is False:
+            return AsyncPooledConnection(reader, writer, keep_alive=False)
+
+        try:
+            response = await self._control_exchange(reader, writer, SOAProtocol.create_keepalive_request())
+            if response.get('status') != 'success':
+                logger.warning(f"{self.host}:{self.port} no soporta keep-alive, usando conexiones de un solo uso")
+                writer.close()
+                self.keep_alive_supported = False
+                return await self._connect()
+
+            self.keep_alive_supported = True
+            response = await self._control_exchange(reader, writer, SOAProtocol.create_bytemode_request())
+            return AsyncPooledConnection(reader, writer, keep_alive=True,
+                                         byte_mode=response.get('status') == 'success')
+        except BaseException:
+            writer.close()
+            raise
+
+    @staticmethod
+    async def _control_exchange(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                request: str) -> Dict[str, Any]:
+        writer.write(SOAProtocol.to_wire(request))
+        await writer.drain()
+        return SOAProtocol.parse_response(await SOAProtocol.read_message_async(reader) or "")
+
+    @staticmethod
+    def _is_healthy(conn: AsyncPooledConnection) -> bool:
+        # EOF en una conexión inactiva indica que el servicio la cerró
+        return not (conn.writer.is_closing() or conn.reader.at_eof())
+
+class AsyncSOAConnectionPool:
+    """Pools asíncronos del bus, uno por instancia registrada"""
+
+    def __init__(self, max_size: int = 64, max_idle_time: float = 30.0, acquire_timeout: float = 5.0,
+                 connect_timeout: Optional[float] = None):
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.acquire_timeout = acquire_timeout
+        self.connect_timeout = connect_timeout
+
+        self._pools: Dict[str, AsyncServiceConnectionPool] = {}
+
+    def get_pool(self, service_name: str, host: str, port: int, connect_timeout: Optional[float] = None,
+                 uds_path: Optional[str] = None) -> AsyncServiceConnectionPool:
+        # Solo se usa desde el event loop, así que no necesita lock
+        pool = self._pools.get(service_name)
+        if pool is not None and (pool.host, pool.port, pool.uds_path) == (host, port, uds_path):
+            return pool
+
+        if pool is not None:
+            logger.info(f"{service_name} cambió a {host}:{port}, descartando pool hacia {pool.host}:{pool.port}")
+            pool.close()
+
+        pool = AsyncServiceConnectionPool(host, port, self.max_size, self.max_idle_time, self.acquire_timeout,
+                                          connect_timeout if connect_timeout is not None else self.connect_timeout,
+                                          uds_path)
+        self._pools[service_name] = pool
+        return pool
+
+    def remove(self, service_name: str):
+        pool = self._pools.pop(service_name, None)
+        if pool is not None:
+            pool.close()
+
+    def close_all(self):
+        for pool in self._pools.values():
+            pool.close()
+        self._pools.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: pool.stats() for name, pool in self._pools.items()}
+
+class InProcessChannel:
+    """
+    Transporte en memoria hacia un servicio cargado en el mismo proceso que el bus. Ofrece la misma interfaz que
+    los pools (request con frame de entrada y de salida) pero entrega el frame directamente al servicio.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.requests = 0
+
+    def request(self, message: Union[str, bytes, bytearray], timeout: Optional[float] = None) -> str:
+        # Se ejecuta en el hilo del llamante: el plazo llega al servicio en el to= del frame, no se puede cortar aquí
+        self.requests += 1
+        return self.service.handle_frame(message)
+
+    async def request_async(self, message: Union[str, bytes, bytearray], timeout: Optional[float] = None) -> str:
+        # Los métodos de los servicios son bloqueantes: corren en el executor para no detener el event loop
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(None, self.request, message, timeout), timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"transport": "in-process", "requests": self.requests}
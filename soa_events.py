@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+class EventSubscription:
+    """
+    Eventos pendientes de un servicio suscriptor. La cola está acotada: si se llena, el bus rechaza la publicación
+    en lugar de crecer sin límite. Un evento solo sale de la cola cuando el servicio confirma que lo procesó; el que
+    rechaza espera aparte hasta su próximo intento, sin bloquear a los que vienen detrás.
+    """
+
+    def __init__(self, service_name: str, topics: Iterable[str], max_pending: int = 1000, max_attempts: int = 10,
+                 retry_base: float = 0.5, retry_max: float = 30.0):
+        self.service_name = service_name
+        self.topics = set(topics)
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+
+        self._ready: "deque[Dict[str, Any]]" = deque()
+        # (cuándo reintentar, orden de llegada, evento) de los eventos que el servicio rechazó
+        self._delayed: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+        self.accepted = 0
+        self.delivered = 0
+        self.retries = 0
+        self.rejected = 0
+        self.dead = 0
+
+    def _pending(self) -> int:
+        return len(self._ready) + len(self._delayed) + self._in_flight
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        with self._cond:
+            if self._pending() >= self.max_pending:
+                self.rejected += 1
+                return False
+            # Cada suscriptor lleva su propia cuenta de intentos
+            self._ready.append(dict(event, attempts=0))
+            self.accepted += 1
+            self._cond.notify()
+            return True
+
+    def next_event(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Saca el siguiente evento a entregar (en curso hasta ack, nack o requeue), o None si no hay en timeout"""
+        with self._cond:
+            if not self._ready and not self._promote_due():
+                wait = timeout
+                if self._delayed:
+                    until_due = max(self._delayed[0][0] - time.monotonic(), 0.0)
+                    wait = until_due if wait is None else min(wait, until_due)
+                self._cond.wait(wait)
+                self._promote_due()
+            if not self._ready:
+                return None
+            self._in_flight += 1
+            return self._ready.popleft()
+
+    def _promote_due(self) -> bool:
+        # Los reintentos vencidos pasan al final de la cola de listos
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._ready.append(heapq.heappop(self._delayed)[2])
+        return bool(self._ready)
+
+    def ack(self, event: Dict[str, Any]):
+        with self._cond:
+            self._in_flight -= 1
+            self.delivered += 1
+
+    def nack(self, event: Dict[str, Any]) -> bool:
+        """El servicio rechazó el evento. Devuelve False si agotó sus intentos y se descartó"""
+        with self._cond:
+            self._in_flight -= 1
+            event["attempts"] += 1
+            self.retries += 1
+            if event["attempts"] >= self.max_attempts:
+                self.dead += 1
+                return False
+            delay = min(self.retry_base * 2 ** (event["attempts"] - 1), self.retry_max)
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._seq), event))
+            self._cond.notify()
+            return True
+
+    def requeue(self, event: Dict[str, Any]):
+        """No se llegó al servicio (caído o sin instancias): el evento vuelve al principio sin gastar un intento"""
+        with self._cond:
+            self._in_flight -= 1
+            self._ready.appendleft(event)
+            self._cond.notify()
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "topics": sorted(self.topics),
+                "pending": self._pending(),
+                "delayed": len(self._delayed),
+                "accepted": self.accepted,
+                "delivered": self.delivered,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "dead": self.dead
+            }
+
+class EventBroker:
+    """Suscripciones por servicio a temas de eventos de dominio ("post.created") y reparto de lo publicado"""
+
+    def __init__(self, max_pending: int = 1000, max_attempts: int = 10):
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.subscriptions: Dict[str, EventSubscription] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, service_name: str, topics: Iterable[str]) -> Tuple[EventSubscription, bool]:
+        """Suscribe el servicio a los temas. Devuelve (suscripción, True si es nueva)"""
+        with self._lock:
+            subscription = self.subscriptions.get(service_name)
+            if subscription is not None:
+                # Se acumulan los temas para no perder eventos mientras conviven versiones de un servicio
+                subscription.topics.update(topics)
+                return subscription, False
+            subscription = EventSubscription(service_name, topics, self.max_pending, self.max_attempts)
+            self.subscriptions[service_name] = subscription
+            return subscription, True
+
+    def publish(self, topic: str, payload: str,
+                is_active: Optional[Callable[[str], bool]] = None) -> Tuple[int, List[str]]:
+        """
+        Encola el evento en cada suscriptor del tema. Devuelve (encolados, suscriptores con la cola llena).
+        Los suscriptores sin instancias (is_active falso) no reciben lo publicado mientras no vuelvan
+        """
+        event = {"id": uuid.uuid4().hex[:12], "topic": topic, "payload": payload, "published_at": time.time()}
+        with self._lock:
+            targets = [subscription for subscription in self.subscriptions.values() if topic in subscription.topics]
+        if is_active is not None:
+            targets = [subscription for subscription in targets if is_active(subscription.service_name)]
+
+        queued, full = 0, []
+        for subscription in targets:
+            if subscription.offer(event):
+                queued += 1
+            else:
+                full.append(subscription.service_name)
+        return queued, full
+
+    def close(self):
+        with self._lock:
+            subscriptions = list(self.subscriptions.values())
+        for subscription in subscriptions:
+            subscription.wake()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            subscriptions = dict(self.subscriptions)
+        return {name: subscription.stats() for name, subscription in subscriptions.items()}
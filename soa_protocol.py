@@ -1,36 +1,90 @@
-from typing import Dict, Any, Tuple
+import asyncio
+import codecs
+import errno
+import json
+import os
+import socket
+from typing import Dict, Any, Tuple, Optional, Union
 
 class SOAProtocol:
     
+    # Frames de más de 99999 caracteres usan la cabecera extendida X + 10 dígitos
+    MAX_STANDARD_LENGTH = 99999
+    EXTENDED_MARKER = "X"
+    # Límite de seguridad al recibir, para no reservar memoria arbitraria por una cabecera corrupta
+    MAX_FRAME_LENGTH = 64 * 1024 * 1024
+    # Bloque opcional de atributos antes del nombre de servicio: ~id=7,to=1500~SSSSS...
+    ATTRS_MARKER = "~"
+    # Tamaño máximo del bloque de atributos (el registro lleva ahí la lista de métodos), igual en texto y en bytes
+    MAX_ATTRS_LENGTH = 4096
+    # Nombres reservados para frames de control del bus; el resto son llamadas a servicios
+    CONTROL_NAMES = ("rgstr", "unrgs", "dscvr", "hbeat", "pbkey", "kalve", "bmode", "batch", "pblsh", "event")
+    # Bytes que se miran para encontrar el método de una llamada sin decodificar los parámetros
+    MAX_METHOD_PEEK = 64
+    # Sockets Unix creados por este proceso: ruta -> (pid, dispositivo, inodo, ctime), para no borrar nunca el de otro
+    _unix_owned: Dict[str, Tuple[int, int, int, int]] = {}
+    
+    @staticmethod
+    def _header_size(message: str) -> int:
+        return 11 if message.startswith(SOAProtocol.EXTENDED_MARKER) else 5
+    
+    @staticmethod
+    def _format_length(content_length: int) -> str:
+        if content_length > SOAProtocol.MAX_STANDARD_LENGTH:
+            return f"{SOAProtocol.EXTENDED_MARKER}{content_length:010d}"
+        return f"{content_length:05d}"
+    
     @staticmethod
-    def encode_message(service_name: str, data: str, status: str = "") -> str:
+    def encode_message(service_name: str, data: str, status: str = "",
+                       attrs: Optional[Dict[str, Any]] = None) -> str:
         service_name = service_name[:5].ljust(5)
         content = service_name + status + data
-        content_length = len(content)
-        length_str = f"{content_length:05d}"
+        attrs_str = ",".join(f"{key}={value}" for key, value in (attrs or {}).items() if value is not None)
+        if attrs_str:
+            content = f"{SOAProtocol.ATTRS_MARKER}{attrs_str}{SOAProtocol.ATTRS_MARKER}{content}"
+        length_str = SOAProtocol._format_length(len(content))
         message = length_str + content
         
         return message
     
     @staticmethod
     def decode_message(message: str) -> Tuple[str, str, str, str]:
-        if len(message) < 10:
+        length_str, attrs, service_name, status, data = SOAProtocol._decode_message_attrs(message)
+        return length_str, service_name, status, data
+    
+    @staticmethod
+    def _parse_attrs(attrs_str: str) -> Dict[str, str]:
+        attrs = {}
+        for pair in attrs_str.split(","):
+            if "=" in pair:
+                key, value = pair.split("=", 1)
+                attrs[key] = value
+        return attrs
+    
+    @staticmethod
+    def _decode_message_attrs(message: str) -> Tuple[str, Dict[str, str], str, str, str]:
+        header_size = SOAProtocol._header_size(message)
+        if len(message) < header_size + 5:
             raise ValueError("Mensaje demasiado corto")
         
         
-        length_str = message[:5]
-        try:
-            length = int(length_str)
-        except ValueError:
-            raise ValueError(f"Longitud inválida: {length_str}")
+        length_str = message[:header_size]
+        length = SOAProtocol._parse_header_length(length_str)
         
         
-        content = message[5:]
+        content = message[header_size:]
         
         
         if len(content) != length:
             raise ValueError(f"Longitud esperada {length}, pero contenido tiene {len(content)} caracteres")
         
+        attrs = {}
+        if content.startswith(SOAProtocol.ATTRS_MARKER):
+            attrs_end = content.find(SOAProtocol.ATTRS_MARKER, 1, SOAProtocol.MAX_ATTRS_LENGTH + 2)
+            if attrs_end < 0:
+                raise ValueError("Bloque de atributos sin cerrar o demasiado largo")
+            attrs = SOAProtocol._parse_attrs(content[1:attrs_end])
+            content = content[attrs_end + 1:]
         
         service_name = content[:5].strip()
         remaining = content[5:]
@@ -41,19 +95,111 @@ class SOAProtocol:
             status = remaining[:2]
             data = remaining[2:]
         
+        return length_str, attrs, service_name, status, data
+    
+    @staticmethod
+    def decode_frame(frame: Union[bytes, bytearray, memoryview]) -> Tuple[str, str, str, str]:
+        """Decodifica un frame en modo bytes (longitud en bytes UTF-8) sin copiar el payload más de una vez"""
+        length_str, attrs, service_name, status, data = SOAProtocol._decode_frame_attrs(frame)
         return length_str, service_name, status, data
     
     @staticmethod
-    def create_request(service_name: str, method: str, params_str: str = "") -> str:
+    def _decode_frame_prefix(view: memoryview) -> Tuple[str, Dict[str, str], int]:
+        """Valida la cabecera de un frame en modo bytes y lee sus atributos. Devuelve (longitud, atributos, inicio del nombre)"""
+        header_size = 11 if view[:1] == SOAProtocol.EXTENDED_MARKER.encode('ascii') else 5
+        if len(view) < header_size + 5:
+            raise ValueError("Mensaje demasiado corto")
+        
+        length_str = str(view[:header_size], 'ascii')
+        length = SOAProtocol._parse_header_length(length_str)
+        
+        if len(view) - header_size != length:
+            raise ValueError(f"Longitud esperada {length}, pero contenido tiene {len(view) - header_size} bytes")
+        
+        name_start = header_size
+        attrs = {}
+        if view[name_start:name_start + 1] == SOAProtocol.ATTRS_MARKER.encode('ascii'):
+            attrs_end = bytes(view[name_start + 1:name_start + SOAProtocol.MAX_ATTRS_LENGTH + 2]).find(
+                SOAProtocol.ATTRS_MARKER.encode('ascii'))
+            if attrs_end < 0:
+                raise ValueError("Bloque de atributos sin cerrar o demasiado largo")
+            attrs = SOAProtocol._parse_attrs(str(view[name_start + 1:name_start + 1 + attrs_end], 'utf-8'))
+            name_start += attrs_end + 2
+        
+        return length_str, attrs, name_start
+    
+    @staticmethod
+    def _decode_frame_attrs(frame: Union[bytes, bytearray, memoryview]) -> Tuple[str, Dict[str, str], str, str, str]:
+        view = memoryview(frame)
+        length_str, attrs, name_start = SOAProtocol._decode_frame_prefix(view)
+        
+        service_name = str(view[name_start:name_start + 5], 'utf-8').strip()
+        data_start = name_start + 5
+        status = ""
+        
+        status_view = view[data_start:data_start + 2]
+        if status_view == b"OK" or status_view == b"NK":
+            status = str(status_view, 'ascii')
+            data_start += 2
+        
+        data = str(view[data_start:], 'utf-8')
+        return length_str, attrs, service_name, status, data
+    
+    @staticmethod
+    def peek_call(frame: Union[bytes, bytearray]) -> Optional[Dict[str, Any]]:
+        """
+        Lee de un frame en modo bytes solo lo necesario para enrutarlo (atributos, servicio y método), sin decodificar
+        los parámetros. Devuelve None si no es una llamada a un servicio o no se puede leer así.
+        """
+        try:
+            view = memoryview(frame)
+            length_str, attrs, name_start = SOAProtocol._decode_frame_prefix(view)
+            service_name = str(view[name_start:name_start + 5], 'utf-8').strip()
+        except ValueError:
+            return None
+        if service_name in SOAProtocol.CONTROL_NAMES:
+            return None
+        
+        data_start = name_start + 5
+        head = bytes(view[data_start:data_start + SOAProtocol.MAX_METHOD_PEEK])
+        space = head.find(b" ")
+        if space < 0 and len(view) - data_start > SOAProtocol.MAX_METHOD_PEEK:
+            return None
+        
+        call = {
+            "action": "call_service",
+            "service_name": service_name,
+            "method": head[:space if space >= 0 else len(head)].decode('utf-8', errors='replace'),
+            "frame": frame
+        }
+        if attrs.get("id"):
+            call["request_id"] = attrs["id"]
+        if attrs.get("to"):
+            if not attrs["to"].isdigit():
+                return None
+            call["timeout_ms"] = int(attrs["to"])
+        return call
+    
+    @staticmethod
+    def _decode_any(message: Union[str, bytes, bytearray, memoryview]) -> Tuple[str, Dict[str, str], str, str, str]:
+        if isinstance(message, str):
+            return SOAProtocol._decode_message_attrs(message)
+        return SOAProtocol._decode_frame_attrs(message)
+    
+    @staticmethod
+    def create_request(service_name: str, method: str, params_str: str = "",
+                       request_id: Optional[str] = None, timeout_ms: Optional[int] = None) -> str:
         if params_str:
             data_str = f"{method} {params_str}"
         else:
             data_str = method
         
-        return SOAProtocol.encode_message(service_name, data_str)
+        # to= es el presupuesto restante en milisegundos; es relativo para no depender de relojes sincronizados
+        return SOAProtocol.encode_message(service_name, data_str, attrs={"id": request_id, "to": timeout_ms})
     
     @staticmethod
-    def create_response(service_name: str, success: bool, result: Any = None, error_msg: str = "") -> str:
+    def create_response(service_name: str, success: bool, result: Any = None, error_msg: str = "",
+                        request_id: Optional[str] = None, publish_key: Optional[str] = None) -> str:
         status = "OK" if success else "NK"
         
         if success:
@@ -61,72 +207,445 @@ class SOAProtocol:
         else:
             data_str = error_msg
         
-        return SOAProtocol.encode_message(service_name, data_str, status)
+        # k= solo viaja en la respuesta a un registro: la clave con la que el servicio puede publicar eventos
+        return SOAProtocol.encode_message(service_name, data_str, status, attrs={"id": request_id, "k": publish_key})
+    
+    @staticmethod
+    def create_busy_response(service_name: str, retry_after: float, request_id: Optional[str] = None) -> str:
+        return SOAProtocol.create_response(service_name, False, error_msg=SOAProtocol.busy_message(retry_after),
+                                           request_id=request_id)
     
     @staticmethod
-    def create_register_request(service_name: str, host: str, port: int, description: str = "") -> str:
+    def busy_message(retry_after: float, reason: str = "Servicio ocupado, reintente más tarde") -> str:
+        return f"BUSY retry_after={retry_after} {reason}"
+    
+    @staticmethod
+    def parse_retry_after(error_msg: Optional[str]) -> Optional[float]:
+        """Devuelve el retry_after de una respuesta BUSY, o None si el error es de otro tipo"""
+        if not error_msg or not error_msg.startswith("BUSY retry_after="):
+            return None
+        try:
+            return float(error_msg.split(" ", 2)[1].split("=", 1)[1])
+        except (IndexError, ValueError):
+            return None
+    
+    @staticmethod
+    def create_register_request(service_name: str, host: str, port: int, description: str = "",
+                                methods: Optional[list] = None, uds_path: Optional[str] = None,
+                                topics: Optional[list] = None) -> str:
         data = f"{host}:{port}:{service_name}:{description}"
-        return SOAProtocol.encode_message("rgstr", data)
+        # Los métodos (m=a|b|c), el socket Unix (u=ruta) y los temas suscritos (s=x.y|z.w) viajan como atributos
+        # para no cambiar el formato de los datos
+        attrs = {"m": "|".join(methods) if methods else None, "u": uds_path,
+                 "s": "|".join(topics) if topics else None}
+        return SOAProtocol.encode_message("rgstr", data, attrs=attrs)
+    
+    @staticmethod
+    def create_publish_request(topic: str, payload: str, request_id: Optional[str] = None,
+                               publish_key: Optional[str] = None) -> str:
+        return SOAProtocol.encode_message("pblsh", f"{topic} {payload}", attrs={"id": request_id, "k": publish_key})
+    
+    @staticmethod
+    def create_event_request(topic: str, payload: str, event_id: Optional[str] = None) -> str:
+        # El id del evento permite al suscriptor reconocer una entrega repetida (la entrega es al menos una vez)
+        return SOAProtocol.encode_message("event", f"{topic} {payload}", attrs={"id": event_id})
+    
+    @staticmethod
+    def create_discover_request(known_version: Optional[str] = None) -> str:
+        return SOAProtocol.encode_message("dscvr", known_version or "")
     
     @staticmethod
-    def parse_request(message: str) -> Dict[str, Any]:
+    def create_unregister_request(service_name: str, instance_id: Optional[str] = None) -> str:
+        data = f"unregister:{service_name}"
+        if instance_id:
+            data += f":{instance_id}"
+        return SOAProtocol.encode_message("unrgs", data)
+    
+    @staticmethod
+    def create_heartbeat_request(service_name: str, host: str, port: int) -> str:
+        return SOAProtocol.encode_message("hbeat", f"{service_name}:{host}:{port}")
+    
+    @staticmethod
+    def create_publish_key_request(service_name: str, host: str, port: int) -> str:
+        return SOAProtocol.encode_message("pbkey", f"{service_name}:{host}:{port}")
+    
+    @staticmethod
+    def create_keepalive_request(timeout: Optional[float] = None) -> str:
+        data = str(timeout) if timeout else ""
+        return SOAProtocol.encode_message("kalve", data)
+    
+    @staticmethod
+    def create_bytemode_request() -> str:
+        return SOAProtocol.encode_message("bmode", "")
+    
+    @staticmethod
+    def uds_path(name: str) -> Optional[str]:
+        """Ruta del socket Unix de name dentro de SOA_UDS_DIR, o None si no se usan sockets Unix"""
+        uds_dir = os.getenv('SOA_UDS_DIR')
+        if not uds_dir or not hasattr(socket, 'AF_UNIX'):
+            return None
+        return os.path.join(uds_dir, f"{name.strip()}.sock")
+    
+    @staticmethod
+    def connect(host: str, port: int, uds_path: Optional[str] = None,
+                timeout: Optional[float] = None) -> socket.socket:
+        """Conecta por el socket Unix si existe en esta máquina (mismo host) y si no, o si falla, por TCP"""
+        if uds_path and os.path.exists(uds_path):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(uds_path)
+                return sock
+            except OSError:
+                # Socket huérfano de un proceso que ya terminó
+                sock.close()
+        
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
         try:
-            length, service_name, status, data = SOAProtocol.decode_message(message)
-            
-            
-            if service_name == "rgstr":
-                
-                parts = data.split(":", 3)
-                if len(parts) >= 3:
-                    return {
-                        "action": "register_service",
-                        "service_name": parts[2],
-                        "service_host": parts[0],
-                        "service_port": int(parts[1]),
-                        "description": parts[3] if len(parts) > 3 else ""
-                    }
-                else:
-                    raise ValueError("Formato de registro inválido")
-            elif service_name == "unrgs":
-                
-                if data.startswith("unregister:"):
-                    service_to_unregister = data[11:]  
-                    return {
-                        "action": "unregister_service",
-                        "service_name": service_to_unregister
-                    }
-                else:
-                    raise ValueError("Formato de desregistro inválido")
+            sock.connect((host, port))
+        except Exception:
+            sock.close()
+            raise
+        return sock
+    
+    @staticmethod
+    def listen_unix(uds_path: str, backlog: int) -> socket.socket:
+        if os.path.exists(uds_path):
+            # Si otro proceso atiende aún en la ruta no se le quita; un fichero huérfano de una ejecución anterior
+            # impediría el bind y se borra
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            probe.settimeout(1.0)
+            try:
+                probe.connect(uds_path)
+            except OSError:
+                try:
+                    os.unlink(uds_path)
+                except FileNotFoundError:
+                    pass
             else:
-                
-                
-                data_parts = data.split(" ", 1)
-                method = data_parts[0] if data_parts else ""
-                params_str = data_parts[1] if len(data_parts) > 1 else ""
-                
-                return {
-                    "action": "call_service",
-                    "service_name": service_name,
-                    "method": method,
-                    "params": params_str
-                }
+                raise OSError(errno.EADDRINUSE, f"Otro proceso escucha ya en {uds_path}")
+            finally:
+                probe.close()
+        os.makedirs(os.path.dirname(uds_path) or ".", exist_ok=True)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            listener.bind(uds_path)
+            listener.listen(backlog)
+        except OSError:
+            listener.close()
+            raise
+        stat = os.stat(uds_path)
+        SOAProtocol._unix_owned[uds_path] = (os.getpid(), stat.st_dev, stat.st_ino, stat.st_ctime_ns)
+        return listener
+    
+    @staticmethod
+    def unlink_unix(uds_path: str):
+        """Borra el socket Unix solo si lo creó este proceso y sigue siendo el mismo fichero"""
+        owner = SOAProtocol._unix_owned.get(uds_path)
+        # Los hijos de un fork heredan la tabla, pero el socket es del padre
+        if owner is None or owner[0] != os.getpid():
+            return
+        del SOAProtocol._unix_owned[uds_path]
+        try:
+            stat = os.stat(uds_path)
+            if (stat.st_dev, stat.st_ino, stat.st_ctime_ns) == owner[1:]:
+                os.unlink(uds_path)
+        except OSError:
+            pass
+    
+    @staticmethod
+    def _recv_into(sock: socket.socket, view: memoryview):
+        received = 0
+        size = len(view)
+        while received < size:
+            count = sock.recv_into(view[received:], size - received)
+            if not count:
+                raise ConnectionError("Conexión cerrada antes de recibir el mensaje completo")
+            received += count
+    
+    @staticmethod
+    def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+        buffer = bytearray(size)
+        SOAProtocol._recv_into(sock, memoryview(buffer))
+        return buffer
+    
+    @staticmethod
+    def _recv_header(sock: socket.socket) -> Optional[str]:
+        header = sock.recv(5)
+        if not header:
+            return None
+        if len(header) < 5:
+            header += SOAProtocol._recv_exact(sock, 5 - len(header))
+        if header[:1] == SOAProtocol.EXTENDED_MARKER.encode('ascii'):
+            header += SOAProtocol._recv_exact(sock, 6)
+        return header.decode('ascii', errors='replace')
+    
+    @staticmethod
+    def _parse_header_length(header: str) -> int:
+        digits = header[1:] if len(header) == 11 else header
+        try:
+            length = int(digits)
+        except ValueError:
+            raise ValueError(f"Longitud inválida: {header}")
+        if length < 0 or length > SOAProtocol.MAX_FRAME_LENGTH:
+            raise ValueError(f"Longitud fuera de rango: {length}")
+        return length
+    
+    @staticmethod
+    def recv_message(sock: socket.socket) -> Optional[str]:
+        """Lee exactamente un frame (cabecera normal o extendida) del socket. Devuelve None si el peer cerró la conexión."""
+        length_str = SOAProtocol._recv_header(sock)
+        if length_str is None:
+            return None
+        length = SOAProtocol._parse_header_length(length_str)
+        
+        # La longitud cuenta caracteres, y cada carácter UTF-8 ocupa al menos un byte,
+        # así que pedir (faltantes) bytes nunca consume parte del siguiente frame
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        parts = []
+        received = 0
+        while received < length:
+            text = decoder.decode(SOAProtocol._recv_exact(sock, length - received))
+            parts.append(text)
+            received += len(text)
+        
+        return length_str + ''.join(parts)
+    
+    @staticmethod
+    def recv_frame(sock: socket.socket) -> Optional[bytearray]:
+        """Lee un frame en modo bytes y lo devuelve sin decodificar. Devuelve None si el peer cerró la conexión."""
+        length_str = SOAProtocol._recv_header(sock)
+        if length_str is None:
+            return None
+        length = SOAProtocol._parse_header_length(length_str)
+        
+        header_size = len(length_str)
+        frame = bytearray(header_size + length)
+        frame[:header_size] = length_str.encode('ascii')
+        SOAProtocol._recv_into(sock, memoryview(frame)[header_size:])
+        return frame
+    
+    @staticmethod
+    def to_wire(message: Union[str, bytes, bytearray], byte_mode: bool = False) -> Union[bytes, bytearray]:
+        if not isinstance(message, str):
+            # Frame en modo bytes recibido de otro peer: se reenvía tal cual si este peer también habla en bytes
+            if byte_mode:
+                return message
+            message = str(message, 'utf-8')
+            payload = message[SOAProtocol._header_size(message):]
+            return (SOAProtocol._format_length(len(payload)) + payload).encode('utf-8')
+        
+        raw = message.encode('utf-8')
+        if not byte_mode:
+            return raw
+        
+        # La cabecera es ASCII, así que su tamaño en caracteres coincide con su tamaño en bytes
+        payload = memoryview(raw)[SOAProtocol._header_size(message):]
+        frame = bytearray(SOAProtocol._format_length(len(payload)).encode('ascii'))
+        frame += payload
+        return frame
+    
+    @staticmethod
+    def send_message(sock: socket.socket, message: Union[str, bytes, bytearray], byte_mode: bool = False):
+        sock.sendall(SOAProtocol.to_wire(message, byte_mode))
+    
+    @staticmethod
+    async def _read_header_async(reader: asyncio.StreamReader) -> Optional[str]:
+        try:
+            header = await reader.readexactly(5)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise ConnectionError("Conexión cerrada antes de recibir el mensaje completo")
+        if header[:1] == SOAProtocol.EXTENDED_MARKER.encode('ascii'):
+            header += await reader.readexactly(6)
+        return header.decode('ascii', errors='replace')
+    
+    @staticmethod
+    async def read_message_async(reader: asyncio.StreamReader) -> Optional[str]:
+        """Equivalente a recv_message para asyncio"""
+        length_str = await SOAProtocol._read_header_async(reader)
+        if length_str is None:
+            return None
+        length = SOAProtocol._parse_header_length(length_str)
+        
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        parts = []
+        received = 0
+        while received < length:
+            text = decoder.decode(await reader.readexactly(length - received))
+            parts.append(text)
+            received += len(text)
+        
+        return length_str + ''.join(parts)
+    
+    @staticmethod
+    async def read_frame_async(reader: asyncio.StreamReader) -> Optional[bytes]:
+        """Equivalente a recv_frame para asyncio"""
+        length_str = await SOAProtocol._read_header_async(reader)
+        if length_str is None:
+            return None
+        length = SOAProtocol._parse_header_length(length_str)
+        return length_str.encode('ascii') + await reader.readexactly(length)
+    
+    @staticmethod
+    def parse_request(message: Union[str, bytes, bytearray]) -> Dict[str, Any]:
+        try:
+            length, attrs, service_name, status, data = SOAProtocol._decode_any(message)
+            request = SOAProtocol._parse_request_fields(service_name, data)
+            
+            if attrs.get("id"):
+                request["request_id"] = attrs["id"]
+            if attrs.get("to"):
+                request["timeout_ms"] = int(attrs["to"])
+            if attrs.get("m") and request.get("action") == "register_service":
+                request["methods"] = attrs["m"].split("|")
+            if attrs.get("u") and request.get("action") == "register_service":
+                request["uds_path"] = attrs["u"]
+            if attrs.get("s") and request.get("action") == "register_service":
+                request["topics"] = attrs["s"].split("|")
+            if attrs.get("k") and request.get("action") == "publish":
+                request["publish_key"] = attrs["k"]
+            if attrs.get("c"):
+                # Cliente real detrás de un proxy; el bus solo lo tiene en cuenta si la conexión viene de uno de confianza
+                request["client"] = attrs["c"]
+            
+            return request
         
         except Exception as e:
             raise ValueError(f"Error parseando mensaje: {e}")
     
     @staticmethod
-    def parse_response(message: str) -> Dict[str, Any]:
+    def _parse_request_fields(service_name: str, data: str) -> Dict[str, Any]:
+        if service_name == "rgstr":
+            
+            parts = data.split(":", 3)
+            if len(parts) >= 3:
+                return {
+                    "action": "register_service",
+                    "service_name": parts[2],
+                    "service_host": parts[0],
+                    "service_port": int(parts[1]),
+                    "description": parts[3] if len(parts) > 3 else ""
+                }
+            else:
+                raise ValueError("Formato de registro inválido")
+        elif service_name == "unrgs":
+            
+            if data.startswith("unregister:"):
+                # unregister:NOMBRE[:host:puerto]; sin instancia se dan de baja todas las del servicio
+                parts = data[11:].split(":", 1)
+                return {
+                    "action": "unregister_service",
+                    "service_name": parts[0],
+                    "instance_id": parts[1] if len(parts) > 1 else None
+                }
+            else:
+                raise ValueError("Formato de desregistro inválido")
+        elif service_name == "dscvr":
+            
+            return {
+                "action": "discover",
+                "version": data or None
+            }
+        elif service_name in ("hbeat", "pbkey"):
+            
+            parts = data.split(":", 2)
+            if len(parts) == 3:
+                return {
+                    "action": "heartbeat" if service_name == "hbeat" else "publish_key",
+                    "service_name": parts[0],
+                    "instance_id": f"{parts[1]}:{parts[2]}"
+                }
+            else:
+                raise ValueError(f"Formato de {'heartbeat' if service_name == 'hbeat' else 'petición de clave'} inválido")
+        elif service_name == "kalve":
+            
+            return {
+                "action": "keep_alive",
+                "timeout": float(data) if data else None
+            }
+        elif service_name == "bmode":
+            
+            return {
+                "action": "byte_mode"
+            }
+        elif service_name in ("pblsh", "event"):
+            
+            parts = data.split(" ", 1)
+            if not parts[0]:
+                raise ValueError("Formato de evento inválido: falta el tema")
+            return {
+                "action": "publish" if service_name == "pblsh" else "event",
+                "topic": parts[0],
+                "payload": parts[1] if len(parts) > 1 else ""
+            }
+        elif service_name == "batch":
+            
+            calls = json.loads(data)
+            if not isinstance(calls, list):
+                raise ValueError("Formato de batch inválido: se esperaba una lista de llamadas")
+            return {
+                "action": "batch_call",
+                "calls": [SOAProtocol._normalize_batch_call(call) for call in calls]
+            }
+        else:
+            
+            
+            data_parts = data.split(" ", 1)
+            method = data_parts[0] if data_parts else ""
+            params_str = data_parts[1] if len(data_parts) > 1 else ""
+            
+            return {
+                "action": "call_service",
+                "service_name": service_name,
+                "method": method,
+                "params": params_str
+            }
+    
+    @staticmethod
+    def _normalize_batch_call(call: Any) -> Dict[str, Any]:
+        # Se aceptan tanto {"service", "method", "params"} como [service, method, params]
+        if isinstance(call, dict):
+            service_name, method, params = call.get("service"), call.get("method"), call.get("params", "")
+        elif isinstance(call, (list, tuple)) and len(call) in (2, 3):
+            service_name, method, params = call[0], call[1], call[2] if len(call) == 3 else ""
+        else:
+            raise ValueError(f"Llamada de batch inválida: {call}")
+        
+        return {
+            "action": "call_service",
+            "service_name": str(service_name or "").strip(),
+            "method": str(method or ""),
+            "params": str(params or "")
+        }
+    
+    @staticmethod
+    def create_batch_request(calls: list, request_id: Optional[str] = None) -> str:
+        payload = [{"service": service_name, "method": method, "params": params}
+                   for service_name, method, params in calls]
+        return SOAProtocol.encode_message("batch", json.dumps(payload, ensure_ascii=False), attrs={"id": request_id})
+    
+    @staticmethod
+    def parse_response(message: Union[str, bytes, bytearray]) -> Dict[str, Any]:
         try:
-            length, service_name, status, data = SOAProtocol.decode_message(message)
+            length, attrs, service_name, status, data = SOAProtocol._decode_any(message)
             
             success = status == "OK"
             
-            return {
+            response = {
                 "status": "success" if success else "error",
                 "service_name": service_name,
                 "result": data if success else None,
                 "message": data if not success else None
             }
+            if attrs.get("id"):
+                response["request_id"] = attrs["id"]
+            if attrs.get("k"):
+                response["publish_key"] = attrs["k"]
+            
+            return response
         
         except Exception as e:
             return {
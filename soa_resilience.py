@@ -0,0 +1,332 @@
+import asyncio
+import base64
+import json
+import socket
+import threading
+import time
+from typing import Dict, Any, Iterable, Optional, Set, Tuple
+
+class CircuitOpenError(Exception):
+    """Ninguna instancia del servicio admite llamadas: todos sus circuitos están abiertos"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class BulkheadFullError(Exception):
+    """El bulkhead de un servicio o método está lleno y su cola de espera también"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Circuito por instancia: tras failure_threshold fallos seguidos se abre y rechaza llamadas durante
+    reset_timeout segundos; después deja pasar half_open_max_calls sondas y se cierra si tienen éxito.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+        self.opened_count = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def available(self) -> bool:
+        """Indica si allow() podría aceptar una llamada, sin reservar una sonda"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN:
+                return self._state == self.OPEN or self._probes < self.half_open_max_calls
+            return False
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN:
+                if self._state == self.OPEN:
+                    self._state = self.HALF_OPEN
+                    self._probes = 0
+                if self._probes < self.half_open_max_calls:
+                    self._probes += 1
+                    return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.time() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            # Una sonda fallida reabre el circuito de inmediato
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened_count += 1
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self._probes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "failures": self._failures,
+                "opened": self.opened_count,
+                "rejected": self.rejected
+            }
+
+
+class Bulkhead:
+    """
+    Límite de llamadas concurrentes hacia un servicio (o un método de un servicio). Hasta max_queue llamadas
+    esperan como mucho max_wait segundos a que quede una plaza libre; el resto se rechaza en el acto.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int = 0, max_wait: float = 0.5):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._in_use = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+        self.rejected = 0
+
+    def acquire(self, timeout: Optional[float] = None):
+        wait = self.max_wait if timeout is None else min(self.max_wait, timeout)
+        deadline = time.time() + wait
+
+        with self._condition:
+            if self._in_use < self.max_concurrent:
+                self._in_use += 1
+                return
+
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise self._full_error()
+
+            self._waiting += 1
+            try:
+                while self._in_use >= self.max_concurrent:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise self._full_error()
+                    self._condition.wait(remaining)
+                self._in_use += 1
+            finally:
+                self._waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify()
+
+    def _full_error(self) -> BulkheadFullError:
+        return BulkheadFullError(f"Límite de concurrencia de {self.name} alcanzado, reintente más tarde",
+                                 self.max_wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "rejected": self.rejected
+            }
+
+class AsyncBulkhead(Bulkhead):
+    """Versión asyncio de Bulkhead, para el bus asíncrono (solo se usa desde el event loop)"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int = 0, max_wait: float = 0.5):
+        super().__init__(name, max_concurrent, max_queue, max_wait)
+        # El semáforo se crea dentro del loop: en Python 3.9 queda ligado al loop activo al construirlo
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self, timeout: Optional[float] = None):
+        wait = self.max_wait if timeout is None else min(self.max_wait, timeout)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+
+        if not self._slots.locked():
+            # Con plazas libres acquire() no cede el event loop, así que no hay carrera con otras tareas
+            await self._slots.acquire()
+            self._in_use += 1
+            return
+
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise self._full_error()
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(0.0, wait))
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise self._full_error()
+        finally:
+            self._waiting -= 1
+        self._in_use += 1
+
+    def release(self):
+        self._in_use -= 1
+        self._slots.release()
+
+
+class TokenBucket:
+    """Cubeta de tokens: admite ráfagas de hasta burst llamadas y se rellena a rate tokens por segundo"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Consume un token; devuelve 0 si lo había o los segundos que faltan para el siguiente"""
+        # now puede ser anterior a la creación de la cubeta si se tomó antes de esperar el lock
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated_at) * self.rate)
+        self.updated_at = max(now, self.updated_at)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated_at) * self.rate >= self.burst
+
+class RateLimiter:
+    """
+    Límites de llamadas por cliente. Cada regla ("NOMBRE.metodo", "NOMBRE" o "*") da a cada cliente su cubeta;
+    el cliente es el sujeto del JWT cuando la petición lleva token y la dirección de origen en caso contrario.
+    Detrás del gateway todos los clientes llegan desde su dirección: si la conexión viene de un proxy de confianza
+    (trusted_proxies: IPs o nombres de host) se usa el cliente que este reenvía en el atributo c=.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]], max_buckets: int = 10000,
+                 trusted_proxies: Iterable[str] = ()):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.trusted_proxies = list(trusted_proxies)
+
+        # Los nombres se resuelven al usarlos (el gateway puede arrancar después que el bus) y se refrescan cada minuto
+        self._trusted_ips: Set[str] = set()
+        self._trusted_resolved_at = 0.0
+
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+        self.rejected = 0
+
+    def check(self, service_name: str, method: str, params: str, address, forwarded: Optional[str] = None) -> float:
+        """Devuelve 0 si la llamada entra en su límite o los segundos que el cliente debe esperar"""
+        rule = self.rule_for(service_name, method)
+        if rule is None:
+            return 0.0
+
+        subject = self._token_subject(params)
+        peer = address[0] if isinstance(address, tuple) else address
+        if subject:
+            client = f"sub:{subject}"
+        elif forwarded and self._is_trusted(peer):
+            client = f"fwd:{forwarded}"
+        else:
+            client = f"addr:{peer}"
+        now = time.monotonic()
+
+        with self._lock:
+            bucket = self._buckets.get((rule, client))
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    self._prune(now)
+                spec = self.limits[rule]
+                bucket = self._buckets[(rule, client)] = TokenBucket(spec["rate"], spec.get("burst", spec["rate"]))
+            wait = bucket.take(now)
+            if wait:
+                self.rejected += 1
+            return wait
+
+    def _is_trusted(self, peer) -> bool:
+        # Un cliente directo podría poner su propio c= para estrenar cubeta en cada llamada: solo cuenta desde un proxy
+        if not self.trusted_proxies or not isinstance(peer, str):
+            return False
+        now = time.monotonic()
+        if now - self._trusted_resolved_at > 60.0:
+            resolved = set()
+            for proxy in self.trusted_proxies:
+                try:
+                    resolved.update(info[4][0] for info in socket.getaddrinfo(proxy, None))
+                except OSError:
+                    continue
+            self._trusted_ips = resolved
+            self._trusted_resolved_at = now
+        return peer in self._trusted_ips
+
+    def rule_for(self, service_name: str, method: str) -> Optional[str]:
+        for rule in (f"{service_name}.{method}", service_name, "*"):
+            if rule in self.limits:
+                return rule
+        return None
+
+    def _prune(self, now: float):
+        # Una cubeta llena equivale a una nueva: se descartan las de clientes que llevan tiempo sin llamar
+        for key in [key for key, bucket in self._buckets.items() if bucket.full(now)]:
+            del self._buckets[key]
+
+    @staticmethod
+    def _token_subject(params: str) -> Optional[str]:
+        # El token va delante de los parámetros. Solo se lee el payload para agrupar; la firma la valida AUTH_
+        claims = token_claims(params.split(" ", 1)[0] if params else "")
+        if claims is None:
+            return None
+        subject = claims.get("sub") or claims.get("id_usuario") or claims.get("email")
+        return str(subject) if subject is not None else None
+
+def token_claims(token: str) -> Optional[Dict[str, Any]]:
+    """Claims de un JWT sin verificar la firma, o None si token no tiene forma de JWT"""
+    if token.count(".") != 2:
+        return None
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except ValueError:
+        return None
+    return claims if isinstance(claims, dict) else None
@@ -1,107 +1,332 @@
+import os
 import socket
+import sys
 import threading
 import logging
 import time
-from typing import Dict, Any
+import json
+import hashlib
+import hmac
+import itertools
+import math
+import secrets
+import uuid
+from concurrent import futures
+from typing import Dict, Any, Optional, Tuple, Union
 from soa_protocol import SOAProtocol
+from soa_connection_pool import InProcessChannel, SOAConnectionPool
+from soa_balancer import ServiceInstance, create_balancer
+from soa_cache import ResponseCache
+from soa_events import EventBroker, EventSubscription
+from services_config import ServicesConfig
+from soa_resilience import Bulkhead, BulkheadFullError, CircuitBreaker, CircuitOpenError, RateLimiter
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('SOA_Server')
 
 class SOAServer:
-    def __init__(self, host: str = 'localhost', port: int = 8000):
+    def __init__(self, host: str = 'localhost', port: int = 8000, keep_alive_timeout: float = 60.0,
+                 pool_size: int = 8, pool_idle_timeout: float = 30.0, pipeline_workers: int = 64,
+                 batch_workers: int = 32, max_batch_size: int = 32, balancing_strategy=None,
+                 heartbeat_interval: Optional[float] = None, missed_heartbeats: int = 3,
+                 connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None,
+                 service_timeouts: Optional[Dict[str, Dict[str, float]]] = None,
+                 breaker_failures: int = 5, breaker_reset: float = 10.0,
+                 bulkheads: Optional[Dict[str, Dict[str, Any]]] = None,
+                 rate_limits: Optional[Dict[str, Dict[str, float]]] = None, passthrough: Optional[bool] = None,
+                 response_cache: Optional[Dict[str, Any]] = None, uds_path: Optional[str] = None,
+                 max_pending_events: int = 1000, event_max_attempts: int = 10,
+                 trusted_proxies: Optional[list] = None):
         self.host = host
         self.port = port
         self.socket = None
         self.running = False
         
-        self.services_registry: Dict[str, Dict[str, Any]] = {}
+        # Socket Unix adicional para clientes y servicios de la misma máquina (SOA_UDS_DIR/soa_bus-<puerto>.sock)
+        self.uds_path = uds_path or SOAProtocol.uds_path(f"soa_bus-{port}")
+        self.uds_socket = None
+        
+        # Tiempo máximo que una conexión keep-alive puede quedar inactiva
+        self.keep_alive_timeout = keep_alive_timeout
+        
+        # Nombre de servicio -> instancias registradas (por instance_id), cada servicio con su balanceador
+        self.services_registry: Dict[str, Dict[str, ServiceInstance]] = {}
+        self.balancers: Dict[str, Any] = {}
+        self.balancing_strategy = balancing_strategy
         self.registry_lock = threading.Lock()
         
+        # Sello de versión del registro para discovery: cambia en cada alta/baja y es único por arranque del bus
+        self._registry_epoch = uuid.uuid4().hex[:8]
+        self._registry_changes = 0
+        # Puertos ficticios para las instancias en proceso, que no escuchan en ninguno
+        self._local_ports = itertools.count(1)
+        
+        # Una instancia que no envía heartbeat en missed_heartbeats intervalos se da por caída (0 desactiva la expulsión)
+        if heartbeat_interval is None:
+            heartbeat_interval = float(os.getenv('SOA_HEARTBEAT_INTERVAL', 5.0))
+        self.heartbeat_interval = heartbeat_interval
+        self.missed_heartbeats = missed_heartbeats
+        
+        # Timeouts de conexión y de respuesta hacia los servicios, con valores propios por servicio
+        self.connect_timeout = connect_timeout or float(os.getenv('SOA_CONNECT_TIMEOUT', 2.0))
+        self.read_timeout = read_timeout or float(os.getenv('SOA_READ_TIMEOUT', 15.0))
+        self.service_timeouts = self._parse_service_timeouts(os.getenv('SOA_SERVICE_TIMEOUTS', ''))
+        self.service_timeouts.update(service_timeouts or {})
+        
+        # Cada instancia tiene su circuito: tras breaker_failures fallos seguidos se deja de llamar durante breaker_reset s
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        
+        # Límites de concurrencia por servicio ("NOTIF") o por método ("NOTIF.create_event_notification")
+        self.bulkheads = {key: self._create_bulkhead(key, spec) for key, spec in (bulkheads or {}).items()}
+        
+        # Cubetas de tokens por cliente y regla ("AUTH_.login", "AUTH_" o "*"); sin reglas no se limita nada
+        # Proxies (el gateway) cuyo atributo c= identifica al cliente real para los límites por cliente
+        if trusted_proxies is None:
+            trusted_proxies = [p for p in os.getenv('SOA_TRUSTED_PROXIES', '').split(',') if p.strip()]
+        self.rate_limiter = RateLimiter(rate_limits, trusted_proxies=trusted_proxies) if rate_limits else None
+        
+        # Passthrough: en conexiones en modo bytes las llamadas se enrutan por la cabecera y el frame original
+        # viaja sin decodificar hasta el servicio, igual que su respuesta de vuelta al cliente
+        if passthrough is None:
+            passthrough = os.getenv('SOA_PASSTHROUGH', '0').lower() in ('1', 'true', 'yes')
+        self.passthrough = passthrough
+        
+        # Caché de respuestas de métodos de lectura: {"max_bytes": ..., "methods": {"FORUM.list_forums": {...}}}
+        self.response_cache = None
+        if response_cache and response_cache.get('methods'):
+            # Secreto con el que los servicios firman los JWT; sin él las reglas shared no sirven copias compartidas
+            jwt_secret = response_cache.get('jwt_secret') or os.getenv('SOA_JWT_SECRET', 'your-secret-key-here')
+            self.response_cache = ResponseCache(response_cache['methods'],
+                                                response_cache.get('max_bytes', 8 * 1024 * 1024), jwt_secret)
+        
+        # Eventos de dominio: cola acotada por servicio suscriptor y un hilo que se los entrega en orden
+        self.event_broker = EventBroker(max_pending_events, event_max_attempts)
+        # Secreto de este arranque del bus con el que se derivan las claves de publicación de los servicios
+        self._publish_secret = secrets.token_bytes(32)
+        self._events_stop = threading.Event()
+        
+        # Conexiones reutilizables hacia los servicios registrados
+        self.connection_pool = SOAConnectionPool(max_size=pool_size, max_idle_time=pool_idle_timeout,
+                                                 connect_timeout=self.connect_timeout)
+        
+        self.max_batch_size = max_batch_size
+        self.pipeline_executor, self.batch_executor = self._create_executors(pipeline_workers, batch_workers)
+        
         logger.info(f"Servidor SOA inicializado en {host}:{port}")
         logger.info("Usando protocolo NNNNNSSSSSDATOS (SIN JSON)")
     
+    def _create_executors(self, pipeline_workers: int,
+                          batch_workers: int) -> Tuple[Optional[futures.Executor], Optional[futures.Executor]]:
+        # Hilos compartidos para atender peticiones en pipeline (frames con id de petición) y, aparte, para el fan-out
+        # de las llamadas de un batch, de modo que un batch en pipeline no se bloquee a sí mismo
+        return (futures.ThreadPoolExecutor(max_workers=pipeline_workers, thread_name_prefix='soa-pipeline'),
+                futures.ThreadPoolExecutor(max_workers=batch_workers, thread_name_prefix='soa-batch'))
+    
     def start_server(self):
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.socket.bind((self.host, self.port))
             self.socket.listen(5)
+            if self.uds_path:
+                self.uds_socket = SOAProtocol.listen_unix(self.uds_path, 128)
             self.running = True
             
+            if self.heartbeat_interval > 0:
+                threading.Thread(target=self._reap_dead_services, daemon=True).start()
+            
             logger.info(f"Servidor SOA iniciado en {self.host}:{self.port}")
+            if self.uds_socket is not None:
+                logger.info(f"Escuchando también en el socket Unix {self.uds_path}")
+                threading.Thread(target=self._accept_loop, args=(self.uds_socket,), daemon=True).start()
             logger.info("Esperando conexiones...")
             
-            while self.running:
-                try:
-                    client_socket, address = self.socket.accept()
-                    logger.info(f"Nueva conexión desde {address}")
-                    
-                    client_thread = threading.Thread(
-                        target=self._handle_client,
-                        args=(client_socket, address)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-                    
-                except socket.error as e:
-                    if self.running:
-                        logger.error(f"Error aceptando conexión: {e}")
+            self._accept_loop(self.socket)
                         
         except Exception as e:
             logger.error(f"Error iniciando servidor: {e}")
         finally:
             self.stop_server()
     
-    def _handle_client(self, client_socket: socket.socket, address):
-        try:
-            data = client_socket.recv(4096)
-            if not data:
-                return
-            
+    def _accept_loop(self, listener: socket.socket):
+        while self.running:
             try:
+                client_socket, address = listener.accept()
+                # En un socket Unix el peer no tiene dirección
+                address = address or self.uds_path
+                logger.info(f"Nueva conexión desde {address}")
                 
-                message_str = data.decode('utf-8')
-                logger.info(f"Mensaje raw recibido: {message_str}")
-                
-                
-                message = SOAProtocol.parse_request(message_str)
-                logger.info(f"Mensaje parseado: {message}")
-                
-                
-                response = self.process_request(message)
+                client_thread = threading.Thread(
+                    target=self._handle_client,
+                    args=(client_socket, address)
+                )
+                client_thread.daemon = True
+                client_thread.start()
                 
+            except socket.error as e:
+                if self.running:
+                    logger.error(f"Error aceptando conexión: {e}")
+    
+    def _handle_client(self, client_socket: socket.socket, address):
+        keep_alive = False
+        byte_mode = False
+        # Las respuestas de peticiones en pipeline pueden salir desde varios hilos a la vez
+        write_lock = threading.Lock()
+        in_flight = []
+        try:
+            while True:
+                try:
+                    if byte_mode:
+                        raw_message = SOAProtocol.recv_frame(client_socket)
+                    else:
+                        raw_message = SOAProtocol.recv_message(client_socket)
+                except socket.timeout:
+                    logger.info(f"Conexión keep-alive con {address} inactiva, cerrando")
+                    break
+                if raw_message is None:
+                    break
                 
-                if response.get('status') == 'success':
-                    if message.get('action') == 'call_service':
-                        
-                        service_name = message.get('service_name', 'unknw')
-                        result_str = str(response.get('result', ''))
-                        response_msg = SOAProtocol.create_response(service_name, True, result_str)
+                action = None
+                try:
+                    logger.info(f"Mensaje raw recibido: {raw_message}")
+                    
+                    
+                    message = self._parse_client_frame(raw_message, byte_mode)
+                    logger.info(f"Mensaje parseado: {message}")
+                    action = message.get('action')
+                    # Las llamadas que superan el límite del cliente se rechazan antes de ocupar un hilo o un servicio
+                    rejection = self._admission_error(message, address)
+                    
+                    if action == 'keep_alive':
+                        keep_alive = True
+                        requested = message.get('timeout')
+                        timeout = min(requested, self.keep_alive_timeout) if requested else self.keep_alive_timeout
+                        client_socket.settimeout(timeout)
+                        response_msg = SOAProtocol.create_response("srvr", True, f"keep-alive {timeout}")
+                    elif action == 'byte_mode':
+                        response_msg = SOAProtocol.create_response("srvr", True, "byte-mode")
+                    elif rejection:
+                        response_msg = rejection
+                    elif keep_alive and message.get('request_id'):
+                        # Petición con id en una conexión keep-alive: se atiende en paralelo y se sigue leyendo
+                        in_flight = [future for future in in_flight if not future.done()]
+                        in_flight.append(self.pipeline_executor.submit(
+                            self._respond_pipelined, client_socket, message, byte_mode, write_lock
+                        ))
+                        continue
                     else:
-                        
-                        response_msg = SOAProtocol.create_response("srvr", True, str(response.get('result', 'OK')))
-                else:
+                        response_msg = self._build_response_message(message)
+                    
+                    logger.info(f"Enviando respuesta: {response_msg}")
+                    with write_lock:
+                        SOAProtocol.send_message(client_socket, response_msg, byte_mode)
                     
-                    service_name = message.get('service_name', 'srvr')
-                    error_msg = response.get('message', 'Error desconocido')
-                    response_msg = SOAProtocol.create_response(service_name, False, error_msg=error_msg)
+                except Exception as e:
+                    logger.error(f"Error procesando petición: {e}")
+                    error_response = SOAProtocol.create_response("srvr", False, error_msg=f"Server error: {str(e)}")
+                    with write_lock:
+                        SOAProtocol.send_message(client_socket, error_response, byte_mode)
                 
-                logger.info(f"Enviando respuesta: {response_msg}")
-                client_socket.send(response_msg.encode('utf-8'))
+                # La confirmación de bmode viaja aún en modo texto; a partir de aquí todo va en bytes
+                if action == 'byte_mode':
+                    byte_mode = True
                 
-            except Exception as e:
-                logger.error(f"Error procesando petición: {e}")
-                error_response = SOAProtocol.create_response("srvr", False, error_msg=f"Server error: {str(e)}")
-                client_socket.send(error_response.encode('utf-8'))
+                # Los frames de control no consumen la única petición de una conexión sin keep-alive
+                if not keep_alive and action not in ('keep_alive', 'byte_mode'):
+                    break
                 
         except ConnectionResetError:
             logger.info(f"Cliente {address} desconectado")
         except Exception as e:
             logger.error(f"Error manejando cliente {address}: {e}")
         finally:
+            # El cliente puede cerrar su lado de escritura y seguir esperando respuestas pendientes
+            futures.wait(in_flight)
             client_socket.close()
     
+    def _parse_client_frame(self, raw_message: Union[str, bytearray], byte_mode: bool) -> Dict[str, Any]:
+        if self.passthrough and byte_mode:
+            call = SOAProtocol.peek_call(raw_message)
+            if call is not None and not self._needs_params(call['service_name'], call['method']):
+                return call
+        return SOAProtocol.parse_request(raw_message)
+    
+    def _needs_params(self, service_name: str, method: str) -> bool:
+        # El límite por cliente usa el token y la caché los parámetros: esas llamadas se parsean enteras
+        if self.rate_limiter is not None and self.rate_limiter.rule_for(service_name, method) is not None:
+            return True
+        return self.response_cache is not None and f"{service_name}.{method}" in self.response_cache.rules
+    
+    def _admission_error(self, message: Dict[str, Any], address) -> Optional[str]:
+        """Aplica los límites por cliente; devuelve la respuesta NK si la petición no se admite"""
+        if self.rate_limiter is None:
+            return None
+        
+        action = message.get('action')
+        if action == 'call_service':
+            calls = [message]
+        elif action == 'batch_call':
+            calls = message.get('calls', [])
+        else:
+            return None
+        
+        waits = [self.rate_limiter.check(call.get('service_name'), call.get('method'), call.get('params', ''), address,
+                                         message.get('client'))
+                 for call in calls]
+        retry_after = max(waits, default=0.0)
+        if not retry_after:
+            return None
+        
+        logger.warning(f"Límite de peticiones superado por {address} en {message.get('service_name', 'batch')}")
+        # Se redondea hacia arriba para que el cliente no reintente antes de que haya un token
+        return SOAProtocol.create_response(
+            message.get('service_name', 'srvr'), False,
+            error_msg=SOAProtocol.busy_message(math.ceil(retry_after * 10) / 10,
+                                               "Límite de peticiones superado, reintente más tarde"),
+            request_id=message.get('request_id')
+        )
+    
+    def _build_response_message(self, message: Dict[str, Any]) -> str:
+        return self._format_response(message, self.process_request(message))
+    
+    def _format_response(self, message: Dict[str, Any], response: Dict[str, Any]) -> Union[str, bytes, bytearray]:
+        # Respuesta en passthrough: se devuelve el frame del servicio sin tocarlo (ya lleva su id de petición)
+        if response.get('frame') is not None:
+            return response['frame']
+        
+        request_id = message.get('request_id')
+        
+        if response.get('status') == 'success':
+            if message.get('action') == 'call_service':
+                
+                service_name = message.get('service_name', 'unknw')
+                result_str = str(response.get('result', ''))
+                return SOAProtocol.create_response(service_name, True, result_str, request_id=request_id)
+            
+            return SOAProtocol.create_response("srvr", True, str(response.get('result', 'OK')), request_id=request_id,
+                                               publish_key=response.get('publish_key'))
+        
+        service_name = message.get('service_name', 'srvr')
+        error_msg = response.get('message', 'Error desconocido')
+        return SOAProtocol.create_response(service_name, False, error_msg=error_msg, request_id=request_id)
+    
+    def _respond_pipelined(self, client_socket: socket.socket, message: Dict[str, Any],
+                           byte_mode: bool, write_lock: threading.Lock):
+        try:
+            response_msg = self._build_response_message(message)
+        except Exception as e:
+            logger.error(f"Error procesando petición {message.get('request_id')}: {e}")
+            response_msg = SOAProtocol.create_response("srvr", False, error_msg=f"Server error: {str(e)}",
+                                                       request_id=message.get('request_id'))
+        
+        logger.info(f"Enviando respuesta: {response_msg}")
+        try:
+            with write_lock:
+                SOAProtocol.send_message(client_socket, response_msg, byte_mode)
+        except OSError as e:
+            logger.info(f"No se pudo enviar la respuesta {message.get('request_id')}: {e}")
+    
     def process_request(self, message: Dict[str, Any]) -> Dict[str, Any]:
         action = message.get('action')
         
@@ -109,8 +334,18 @@ class SOAServer:
             return self.register_service(message)
         elif action == 'unregister_service':
             return self.unregister_service(message)
+        elif action == 'heartbeat':
+            return self.heartbeat(message)
+        elif action == 'publish_key':
+            return self.issue_publish_key(message)
+        elif action == 'discover':
+            return self.discover(message)
         elif action == 'call_service':
             return self.call_service(message)
+        elif action == 'batch_call':
+            return self.batch_call(message)
+        elif action == 'publish':
+            return self.publish_event(message)
         else:
             return {
                 "status": "error",
@@ -123,6 +358,10 @@ class SOAServer:
             service_host = message.get('service_host')
             service_port = message.get('service_port')
             description = message.get('description', '')
+            methods = message.get('methods', [])
+            uds_path = message.get('uds_path')
+            local = message.get('local')
+            topics = message.get('topics', [])
             
             if not all([service_name, service_host, service_port]):
                 return {
@@ -130,18 +369,31 @@ class SOAServer:
                     "message": "Missing required fields: service_name, service_host, service_port"
                 }
             
+            # Si el socket Unix no existe aquí el servicio está en otra máquina (u otro contenedor): se usa TCP
+            if uds_path and not os.path.exists(uds_path):
+                uds_path = None
+            
+            breaker = CircuitBreaker(self.breaker_failures, self.breaker_reset)
+            instance = ServiceInstance(service_name, service_host, service_port, description, methods, breaker,
+                                       uds_path, local)
             with self.registry_lock:
-                self.services_registry[service_name] = {
-                    "host": service_host,
-                    "port": service_port,
-                    "description": description,
-                    "registered_at": time.time()
-                }
+                self._registry_changes += 1
+                instances = self.services_registry.setdefault(service_name, {})
+                # Re-registrar la misma dirección reemplaza la instancia en lugar de duplicarla
+                instances[instance.instance_id] = instance
+                if service_name not in self.balancers:
+                    self.balancers[service_name] = create_balancer(self.balancing_strategy)
+                count = len(instances)
             
-            logger.info(f"Servicio registrado: {service_name} en {service_host}:{service_port}")
+            if topics:
+                self._subscribe(service_name, topics)
+            
+            via = " en proceso" if local is not None else f" vía {uds_path}" if uds_path else ""
+            logger.info(f"Servicio registrado: {service_name} en {service_host}:{service_port}{via} ({count} instancias)")
             return {
                 "status": "success",
-                "result": f"Service {service_name} registered successfully"
+                "result": f"Service {service_name} registered successfully (instance {instance.instance_id})",
+                "publish_key": self._publish_key(service_name)
             }
             
         except Exception as e:
@@ -151,6 +403,114 @@ class SOAServer:
                 "message": f"Registration error: {str(e)}"
             }
     
+    def attach_local_service(self, service) -> Dict[str, Any]:
+        """Registra un SOAServiceBase cargado en este proceso; el bus le entrega los frames en memoria, sin sockets"""
+        result = self.register_service({
+            "service_name": service.service_name,
+            "service_host": "inproc",
+            "service_port": next(self._local_ports),
+            "description": service.description,
+            "methods": sorted(service.methods),
+            "topics": sorted(service.event_handlers),
+            "local": InProcessChannel(service)
+        })
+        if result.get('publish_key'):
+            service._publish_key = result['publish_key']
+        return result
+    
+    def _publish_key(self, service_name: str) -> str:
+        """Clave de publicación de un servicio: solo la conoce quien se registró en este bus (cambia al reiniciarlo)"""
+        digest = hmac.new(self._publish_secret, service_name.encode('utf-8'), hashlib.sha256).hexdigest()
+        return f"{service_name}:{digest[:32]}"
+    
+    def publish_event(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        topic = message.get('topic')
+        if not topic:
+            return {
+                "status": "error",
+                "message": "Missing topic"
+            }
+        
+        # Solo publican los servicios registrados: un cliente (o el gateway reenviando un WebSocket) no tiene clave
+        publish_key = message.get('publish_key') or ''
+        publisher = publish_key.split(':', 1)[0]
+        with self.registry_lock:
+            registered = bool(self.services_registry.get(publisher))
+        if not registered or not hmac.compare_digest(publish_key, self._publish_key(publisher)):
+            logger.warning(f"Evento {topic} rechazado: publicador no autorizado")
+            return {
+                "status": "error",
+                "message": "Unauthorized publisher"
+            }
+        
+        queued, full = self.event_broker.publish(topic, message.get('payload', ''), self._has_instances)
+        if full:
+            logger.warning(f"Evento {topic} no encolado para {', '.join(full)}: cola de eventos llena")
+            return {
+                "status": "error",
+                "message": SOAProtocol.busy_message(1.0, f"Cola de eventos llena para {', '.join(full)}")
+            }
+        return {
+            "status": "success",
+            "result": f"Event {topic} queued for {queued} subscribers"
+        }
+    
+    def _has_instances(self, service_name: str) -> bool:
+        with self.registry_lock:
+            return bool(self.services_registry.get(service_name))
+    
+    def _subscribe(self, service_name: str, topics: list):
+        subscription, created = self.event_broker.subscribe(service_name, topics)
+        if created:
+            threading.Thread(target=self._deliver_events, args=(subscription,), daemon=True,
+                             name=f"soa-events-{service_name}").start()
+        logger.info(f"{service_name} suscrito a {', '.join(sorted(subscription.topics))}")
+    
+    def _deliver_events(self, subscription: EventSubscription):
+        """Entrega los eventos de un suscriptor; cada uno se reintenta con su propia espera hasta que se confirma"""
+        backoff = 0.0
+        while not self._events_stop.is_set():
+            event = subscription.next_event(timeout=1.0)
+            if event is None:
+                continue
+            
+            try:
+                response = self._deliver_event(subscription.service_name, event)
+            except Exception as e:
+                response = {"status": "error", "message": str(e)}
+            
+            if response.get('frame') is None:
+                # Servicio caído, sin instancias o con el circuito abierto: el evento espera y se reintenta el servicio
+                subscription.requeue(event)
+                logger.warning(f"No se pudo entregar el evento {event['topic']} a {subscription.service_name}: "
+                               f"{response.get('message')}")
+                backoff = min(max(backoff * 2, 0.5), 30.0)
+                self._events_stop.wait(backoff)
+                continue
+            
+            backoff = 0.0
+            reply = SOAProtocol.parse_response(response['frame'])
+            if reply.get('status') == 'success':
+                subscription.ack(event)
+            elif subscription.nack(event):
+                logger.warning(f"{subscription.service_name} rechazó el evento {event['topic']} ({event['id']}): "
+                               f"{reply.get('message')}")
+            else:
+                logger.error(f"Evento {event['topic']} ({event['id']}) descartado tras {event['attempts']} "
+                             f"intentos en {subscription.service_name}: {reply.get('message')}")
+    
+    def _event_call(self, service_name: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        # Se envía como llamada en passthrough para pasar por los mismos circuitos, bulkheads y plazos
+        return {
+            "action": "call_service",
+            "service_name": service_name,
+            "method": event['topic'],
+            "frame": SOAProtocol.create_event_request(event['topic'], event['payload'], event['id'])
+        }
+    
+    def _deliver_event(self, service_name: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        return self._call_service(self._event_call(service_name, event))
+    
     def unregister_service(self, message: Dict[str, Any]) -> Dict[str, Any]:
         try:
             service_name = message.get('service_name')
@@ -161,19 +521,23 @@ class SOAServer:
                     "message": "Missing service_name"
                 }
             
-            with self.registry_lock:
-                if service_name in self.services_registry:
-                    del self.services_registry[service_name]
-                    logger.info(f"Servicio desregistrado: {service_name}")
-                    return {
-                        "status": "success",
-                        "result": f"Service {service_name} unregistered successfully"
-                    }
-                else:
-                    return {
-                        "status": "error",
-                        "message": f"Service {service_name} not found"
-                    }
+            instance_id = message.get('instance_id')
+            # Formato antiguo sin instancia: se dan de baja todas
+            removed = self._remove_instances(service_name, [instance_id] if instance_id else None)
+            
+            if not removed:
+                target = f"{service_name} ({instance_id})" if instance_id else service_name
+                return {
+                    "status": "error",
+                    "message": f"Service {target} not found"
+                }
+            
+            for instance in removed:
+                logger.info(f"Servicio desregistrado: {service_name} en {instance.instance_id}")
+            return {
+                "status": "success",
+                "result": f"Service {service_name} unregistered successfully"
+            }
                     
         except Exception as e:
             logger.error(f"Error desregistrando servicio: {e}")
@@ -182,74 +546,418 @@ class SOAServer:
                 "message": f"Unregistration error: {str(e)}"
             }
     
-    def call_service(self, message: Dict[str, Any]) -> Dict[str, Any]:
-        try:
-            service_name = message.get('service_name')
-            method = message.get('method')
-            params = message.get('params', '')
-            
-            if not all([service_name, method]):
+    def heartbeat(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        service_name = message.get('service_name')
+        instance_id = message.get('instance_id')
+        
+        with self.registry_lock:
+            instance = self.services_registry.get(service_name, {}).get(instance_id)
+            if instance is not None:
+                instance.last_heartbeat = time.time()
+        
+        if instance is None:
+            # El bus no conoce la instancia (reinicio o expulsión previa): el servicio debe volver a registrarse
+            return {
+                "status": "error",
+                "message": f"Instance {service_name} ({instance_id}) not registered"
+            }
+        return {
+            "status": "success",
+            "result": "alive"
+        }
+    
+    def issue_publish_key(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Devuelve la clave de publicación a una instancia ya registrada sin tocar su entrada en el registro"""
+        service_name = message.get('service_name')
+        instance_id = message.get('instance_id')
+        
+        with self.registry_lock:
+            registered = instance_id in self.services_registry.get(service_name, {})
+        
+        if not registered:
+            return {
+                "status": "error",
+                "message": f"Instance {service_name} ({instance_id}) not registered"
+            }
+        return {
+            "status": "success",
+            "result": "publish-key",
+            "publish_key": self._publish_key(service_name)
+        }
+    
+    @property
+    def registry_version(self) -> str:
+        return f"{self._registry_epoch}-{self._registry_changes}"
+    
+    def discover(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        with self.registry_lock:
+            version = self.registry_version
+            # El cliente ya tiene esta versión: no hace falta reenviar el registro completo
+            if message.get('version') == version:
                 return {
-                    "status": "error",
-                    "message": "Missing required fields: service_name, method"
+                    "status": "success",
+                    "result": json.dumps({"version": version, "changed": False})
                 }
             
+            services = {}
+            for service_name, instances in self.services_registry.items():
+                methods = set()
+                for instance in instances.values():
+                    methods.update(instance.methods)
+                services[service_name] = {
+                    "description": next(iter(instances.values())).description,
+                    "methods": sorted(methods),
+                    "instances": [{"instance_id": instance.instance_id, "host": instance.host, "port": instance.port,
+                                   "uds_path": instance.uds_path}
+                                  for instance in instances.values()]
+                }
+        
+        return {
+            "status": "success",
+            "result": json.dumps({"version": version, "changed": True, "services": services}, ensure_ascii=False)
+        }
+    
+    def evict_dead_instances(self) -> int:
+        deadline = time.time() - self.heartbeat_interval * self.missed_heartbeats
+        with self.registry_lock:
+            # Las instancias en proceso no envían heartbeat: viven lo mismo que el bus
+            dead = {service_name: [instance_id for instance_id, instance in instances.items()
+                                   if instance.local is None and instance.last_heartbeat < deadline]
+                    for service_name, instances in self.services_registry.items()}
+        
+        evicted = 0
+        for service_name, instance_ids in dead.items():
+            for instance in self._remove_instances(service_name, instance_ids) if instance_ids else []:
+                logger.warning(f"Instancia {service_name} en {instance.instance_id} sin heartbeat, expulsada del registro")
+                evicted += 1
+        return evicted
+    
+    def _reap_dead_services(self):
+        while self.running:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self.evict_dead_instances()
+            except Exception as e:
+                logger.error(f"Error revisando heartbeats: {e}")
+    
+    def _remove_instances(self, service_name: str, instance_ids: Optional[list] = None) -> list:
+        with self.registry_lock:
+            instances = self.services_registry.get(service_name, {})
+            if instance_ids is None:
+                removed = list(instances.values())
+                instances.clear()
+            else:
+                removed = [instances.pop(instance_id) for instance_id in instance_ids if instance_id in instances]
             
-            with self.registry_lock:
-                if service_name not in self.services_registry:
-                    return {
-                        "status": "error",
-                        "message": f"Service {service_name} not found"
-                    }
-                
-                service_info = self.services_registry[service_name]
-            
-            
-            service_host = service_info['host']
-            service_port = service_info['port']
-            
-            service_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            service_socket.connect((service_host, service_port))
-            
-            
-            service_request = SOAProtocol.create_request(service_name, method, params)
-            service_socket.send(service_request.encode('utf-8'))
-            
-            
-            response_data = service_socket.recv(4096)
-            response_str = response_data.decode('utf-8')
-            
-            service_socket.close()
-            
+            if not instances:
+                self.services_registry.pop(service_name, None)
+                self.balancers.pop(service_name, None)
+            if removed:
+                self._registry_changes += 1
+        
+        for instance in removed:
+            self.connection_pool.remove(instance.pool_key)
+        return removed
+    
+    def call_service(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        cache_key, cached, generation = self._cache_lookup(message)
+        if cached is not None:
+            return cached
+        
+        response = self._call_service(message)
+        self._cache_update(message, cache_key, generation, response)
+        return response
+    
+    def _cache_lookup(self, message: Dict[str, Any]):
+        """Devuelve (clave, respuesta cacheada o None, generación) de una llamada"""
+        if self.response_cache is None:
+            return None, None, 0
+        key = self.response_cache.key_for(message.get('service_name'), message.get('method'), message.get('params', ''))
+        if key is None:
+            return None, None, 0
+        result, generation = self.response_cache.lookup(key)
+        return key, ({"status": "success", "result": result} if result is not None else None), generation
+    
+    def _cache_update(self, message: Dict[str, Any], key, generation: int, response: Dict[str, Any]):
+        if self.response_cache is None:
+            return
+        if key is not None and response.get('status') == 'success':
+            self.response_cache.store(key, response['result'], generation)
+        # Se invalida aunque la escritura falle o expire: el servicio pudo aplicarla igualmente
+        self.response_cache.invalidate(message.get('service_name'), message.get('method'))
+    
+    def _call_service(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        service_name = message.get('service_name')
+        bulkheads = []
+        try:
+            bulkheads, message = self._enter_bulkheads(message)
+            error, call = self._prepare_call(message)
+            if error:
+                return error
+            instance, pool, service_request, budget = call
             
-            service_response = SOAProtocol.parse_response(response_str)
+            instance.begin()
+            started = time.monotonic()
+            success = False
+            try:
+                response_str = self._forward_to_service(pool, service_request, budget)
+                success = True
+            finally:
+                instance.end(time.monotonic() - started, success)
             
-            if service_response.get('status') == 'success':
-                return {
-                    "status": "success",
-                    "result": service_response.get('result', '')
-                }
-            else:
-                return {
-                    "status": "error",
-                    "message": service_response.get('message', 'Service error')
-                }
-                
+            return self._service_result(response_str, passthrough=message.get('frame') is not None)
+        
+        except (CircuitOpenError, BulkheadFullError) as e:
+            return self._rejected_result(e)
+        except (socket.timeout, TimeoutError) as e:
+            return self._timeout_result(service_name, e)
         except Exception as e:
             logger.error(f"Error llamando servicio {service_name}: {e}")
             return {
                 "status": "error",
                 "message": f"Service call error: {str(e)}"
             }
+        finally:
+            self._leave_bulkheads(bulkheads)
+    
+    def _create_bulkhead(self, key: str, spec: Dict[str, Any]) -> Bulkhead:
+        return Bulkhead(key, **spec)
+    
+    def _bulkheads_for(self, service_name: str, method: str):
+        # Primero el del método, más estrecho, para no ocupar una plaza del servicio si se va a rechazar igualmente
+        candidates = (self.bulkheads.get(f"{service_name}.{method}"), self.bulkheads.get(service_name))
+        return [bulkhead for bulkhead in candidates if bulkhead is not None]
+    
+    def _enter_bulkheads(self, message: Dict[str, Any]):
+        """Ocupa las plazas de la llamada; devuelve los bulkheads a liberar y el mensaje con el plazo restante"""
+        service_name = message.get('service_name')
+        bulkheads = self._bulkheads_for(service_name, message.get('method'))
+        if not bulkheads:
+            return [], message
+        
+        started = time.monotonic()
+        budget = self._call_budget(service_name, message.get('timeout_ms'))
+        acquired = []
+        try:
+            for bulkhead in bulkheads:
+                bulkhead.acquire(budget - (time.monotonic() - started))
+                acquired.append(bulkhead)
+        except BulkheadFullError:
+            self._leave_bulkheads(acquired)
+            raise
+        return acquired, self._after_wait(message, budget, started)
+    
+    @staticmethod
+    def _after_wait(message: Dict[str, Any], budget: float, started: float) -> Dict[str, Any]:
+        # El tiempo esperado por una plaza se descuenta del plazo que recibe el servicio
+        remaining = budget - (time.monotonic() - started)
+        return dict(message, timeout_ms=int(remaining * 1000))
+    
+    @staticmethod
+    def _leave_bulkheads(bulkheads):
+        for bulkhead in bulkheads:
+            bulkhead.release()
+    
+    def _prepare_call(self, message: Dict[str, Any]):
+        """Resuelve la instancia, el pool y el presupuesto de tiempo de una llamada. Devuelve (error, llamada)"""
+        service_name = message.get('service_name')
+        method = message.get('method')
+        params = message.get('params', '')
+        
+        if not all([service_name, method]):
+            return {
+                "status": "error",
+                "message": "Missing required fields: service_name, method"
+            }, None
+        
+        # El plazo se comprueba antes de elegir instancia para no gastar la sonda de un circuito semiabierto
+        budget = self._call_budget(service_name, message.get('timeout_ms'))
+        if budget <= 0:
+            return {
+                "status": "error",
+                "message": f"DEADLINE Deadline exceeded before calling {service_name}"
+            }, None
+        
+        instance = self._lookup_service(service_name)
+        if instance is None:
+            return {
+                "status": "error",
+                "message": f"Service {service_name} not found"
+            }, None
+        
+        # El servicio recibe el presupuesto restante para poder abandonar la petición si ya no llega a tiempo;
+        # en passthrough se reenvía el frame del cliente, con el to= que este haya puesto
+        service_request = message.get('frame')
+        if service_request is None:
+            service_request = SOAProtocol.create_request(service_name, method, params, timeout_ms=int(budget * 1000))
+        if instance.local is not None:
+            return None, (instance, instance.local, service_request, budget)
+        connect_timeout, _ = self._timeouts_for(service_name)
+        pool = self.connection_pool.get_pool(instance.pool_key, instance.host, instance.port, connect_timeout,
+                                             instance.uds_path)
+        return None, (instance, pool, service_request, budget)
+    
+    def _timeouts_for(self, service_name: str):
+        override = self.service_timeouts.get(service_name, {})
+        return override.get('connect', self.connect_timeout), override.get('read', self.read_timeout)
+    
+    def _call_budget(self, service_name: str, timeout_ms: Optional[int]) -> float:
+        _, read_timeout = self._timeouts_for(service_name)
+        if timeout_ms is None:
+            return read_timeout
+        return min(read_timeout, timeout_ms / 1000.0)
+    
+    @staticmethod
+    def _parse_service_timeouts(spec: str) -> Dict[str, Dict[str, float]]:
+        # "NOTIF=0.5/2,AUTH_=5": NOMBRE=lectura o NOMBRE=conexión/lectura, en segundos
+        timeouts = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            service_name, value = item.split("=", 1)
+            if "/" in value:
+                connect, read = value.split("/", 1)
+                timeouts[service_name] = {"connect": float(connect), "read": float(read)}
+            else:
+                timeouts[service_name] = {"read": float(value)}
+        return timeouts
+    
+    def _timeout_result(self, service_name: str, error: Exception) -> Dict[str, Any]:
+        logger.warning(f"Timeout llamando servicio {service_name}: {error}")
+        return {
+            "status": "error",
+            "message": f"TIMEOUT Service {service_name} did not respond in time"
+        }
+    
+    def _rejected_result(self, error: Union[CircuitOpenError, BulkheadFullError]) -> Dict[str, Any]:
+        # Mismo formato que BUSY para que los clientes que ya respetan retry_after esperen lo indicado
+        return {
+            "status": "error",
+            "message": SOAProtocol.busy_message(round(error.retry_after, 1), str(error))
+        }
+    
+    def batch_call(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        calls = message.get('calls', [])
+        error = self._validate_batch(calls)
+        if error:
+            return error
+        
+        # El plazo del batch aplica a cada llamada
+        if message.get('timeout_ms') is not None:
+            calls = [dict(call, timeout_ms=message['timeout_ms']) for call in calls]
+        
+        # Las llamadas se ejecutan en paralelo; map conserva el orden original en los resultados
+        results = list(self.batch_executor.map(self.call_service, calls))
+        return self._batch_result(calls, results)
+    
+    def _validate_batch(self, calls) -> Optional[Dict[str, Any]]:
+        if not calls:
+            return {
+                "status": "error",
+                "message": "Empty batch"
+            }
+        if len(calls) > self.max_batch_size:
+            return {
+                "status": "error",
+                "message": f"Batch too large: {len(calls)} calls (max {self.max_batch_size})"
+            }
+        return None
+    
+    def _batch_result(self, calls, results) -> Dict[str, Any]:
+        items = []
+        for call, result in zip(calls, results):
+            item = {
+                "service": call.get('service_name'),
+                "method": call.get('method'),
+                "status": result.get('status')
+            }
+            if result.get('status') == 'success':
+                item["result"] = result.get('result')
+            else:
+                item["message"] = result.get('message')
+            items.append(item)
+        
+        return {
+            "status": "success",
+            "result": json.dumps(items, ensure_ascii=False)
+        }
+    
+    def _lookup_service(self, service_name: str) -> Optional[ServiceInstance]:
+        with self.registry_lock:
+            instances = list(self.services_registry.get(service_name, {}).values())
+            if not instances:
+                return None
+            candidates = [instance for instance in instances if instance.breaker.available()]
+            if candidates:
+                instance = self.balancers[service_name].choose(candidates)
+        
+        # allow() reserva la sonda si el circuito está semiabierto; otra petición pudo llevársela antes
+        if not candidates or not instance.breaker.allow():
+            retry_after = min(instance.breaker.retry_after() for instance in instances)
+            raise CircuitOpenError(f"Circuito abierto para {service_name}, reintente más tarde", retry_after)
+        return instance
+    
+    def _service_result(self, response_str: Union[str, bytes, bytearray], passthrough: bool = False) -> Dict[str, Any]:
+        if passthrough:
+            return {"status": "success", "frame": response_str}
+        
+        service_response = SOAProtocol.parse_response(response_str)
+        
+        if service_response.get('status') == 'success':
+            return {
+                "status": "success",
+                "result": service_response.get('result', '')
+            }
+        else:
+            return {
+                "status": "error",
+                "message": service_response.get('message', 'Service error')
+            }
+    
+    def _close_unix_listener(self):
+        if self.uds_socket is None:
+            return
+        self.uds_socket.close()
+        self.uds_socket = None
+        SOAProtocol.unlink_unix(self.uds_path)
+    
+    def _forward_to_service(self, pool, service_request: Union[str, bytearray], timeout: Optional[float] = None) -> Union[str, bytearray]:
+        return pool.request(service_request, timeout)
     
     def stop_server(self):
         self.running = False
+        self._events_stop.set()
+        self.event_broker.close()
         if self.socket:
             self.socket.close()
+        self._close_unix_listener()
+        self.connection_pool.close_all()
+        for executor in (self.pipeline_executor, self.batch_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        if self.response_cache is not None:
+            logger.info(f"Caché de respuestas: {self.response_cache.stats()}")
+        if self.event_broker.subscriptions:
+            logger.info(f"Eventos: {self.event_broker.stats()}")
         logger.info("Servidor SOA detenido")
 
+def create_server(host: str = 'localhost', port: int = 8000, threaded: Optional[bool] = None) -> SOAServer:
+    # Por defecto se usa el bus asyncio; SOA_BUS_MODE=threaded vuelve al servidor de un hilo por conexión
+    if threaded is None:
+        threaded = os.getenv('SOA_BUS_MODE', 'async').lower() == 'threaded'
+    
+    config = ServicesConfig()
+    limits = {"bulkheads": config.get_bulkheads(), "rate_limits": config.get_rate_limits(),
+              "response_cache": config.get_response_cache(), "trusted_proxies": config.get_trusted_proxies()}
+    
+    if threaded:
+        logger.info("Usando servidor SOA con hilos")
+        return SOAServer(host=host, port=port, **limits)
+    
+    from soa_async_server import AsyncSOAServer
+    return AsyncSOAServer(host=host, port=port, **limits)
+
 def main():
-    server = SOAServer(host='localhost', port=8000)
+    threaded = True if '--threaded' in sys.argv else None
+    server = create_server(host='localhost', port=8000, threaded=threaded)
     
     try:
         server.start_server()
@@ -1,11 +1,17 @@
+import json
 import os
+import queue
+import selectors
+import signal
 import socket
 import threading
 import logging
 import time
-from typing import Dict, Any, Callable, Optional
+from collections import OrderedDict, deque
+from typing import Dict, Any, Callable, Optional, Union
 from abc import ABC, abstractmethod
 from soa_protocol import SOAProtocol
+from soa_connection_pool import ServiceConnectionPool
 
 
 logging.basicConfig(
@@ -13,10 +19,32 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+class ServiceConnection:
+    """Estado de una conexión de cliente entre peticiones (modo keep-alive / bytes negociados)"""
+    
+    def __init__(self, sock: socket.socket, address):
+        self.sock = sock
+        self.address = address
+        self.keep_alive = False
+        self.byte_mode = False
+        self.last_activity = time.time()
+        # Momento en que llegó la petición pendiente; el plazo (to=) se cuenta desde aquí, incluida la espera en cola
+        self.ready_at = self.last_activity
+    
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
 class SOAServiceBase(ABC):
     def __init__(self, service_name: str, host: str = 'localhost', port: int = 0, 
                  description: str = "", soa_server_host: str = 'localhost', 
-                 soa_server_port: int = 8000):
+                 soa_server_port: int = 8000, keep_alive_timeout: float = 60.0,
+                 workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 backlog: Optional[int] = None, retry_after: float = 1.0,
+                 heartbeat_interval: Optional[float] = None, processes: Optional[int] = None,
+                 drain_timeout: float = 10.0):
         self.service_name = service_name
         
         # Auto-detect Docker environment and use container hostname
@@ -40,9 +68,63 @@ class SOAServiceBase(ABC):
         self.socket = None
         self.running = False
         
+        # Con SOA_UDS_DIR el servicio escucha también en un socket Unix, que el bus usa si está en la misma máquina
+        self.uds_socket = None
+        self.uds_path: Optional[str] = None
+        
+        # Tiempo máximo que una conexión keep-alive puede quedar inactiva
+        self.keep_alive_timeout = keep_alive_timeout
+        
+        # Pool de workers acotado: las peticiones que no caben en la cola se rechazan con NK "busy"
+        self.workers = workers or int(os.getenv('SOA_SERVICE_WORKERS', 16))
+        self.queue_size = queue_size or int(os.getenv('SOA_SERVICE_QUEUE_SIZE', 64))
+        self.backlog = backlog or int(os.getenv('SOA_SERVICE_BACKLOG', 128))
+        self.retry_after = retry_after
+        
+        # Prefork: N procesos hijos comparten el puerto con SO_REUSEPORT; el padre registra, vigila y reinicia
+        self.processes = processes or int(os.getenv('SOA_SERVICE_PROCESSES', 1))
+        self.drain_timeout = drain_timeout
+        self._children: Dict[int, int] = {}
+        
+        self._request_queue: Optional[queue.Queue] = None
+        self._reject_queue: Optional[queue.Queue] = None
+        self._worker_threads = []
+        self._selector = None
+        self._wakeup_reader = None
+        self._wakeup_writer = None
+        self._pending_connections = deque()
+        self._accept_selector = None
+        self._poller_thread: Optional[threading.Thread] = None
+        
+        # Heartbeats periódicos al bus; si el bus no reconoce la instancia (p. ej. tras reiniciarse) se vuelve a registrar
+        if heartbeat_interval is None:
+            heartbeat_interval = float(os.getenv('SOA_HEARTBEAT_INTERVAL', 5.0))
+        self.heartbeat_interval = heartbeat_interval
+        self._heartbeat_stop = threading.Event()
+        
+        # Plazo de la petición en curso en cada worker (None si el llamante no envió to=)
+        self._request_context = threading.local()
+        
+        self._stats_lock = threading.Lock()
+        self.active_requests = 0
+        self.expired_requests = 0
+        self.rejected_requests = 0
+        self.completed_requests = 0
+        
         
         self.methods: Dict[str, Callable] = {}
         
+        # Tema -> manejador(payload, id_evento) de los eventos de dominio a los que se suscribe el servicio
+        self.event_handlers: Dict[str, Callable] = {}
+        # Ids de eventos ya procesados: el bus entrega al menos una vez y puede repetir una entrega
+        self._handled_events: "OrderedDict[str, bool]" = OrderedDict()
+        # Clave de publicación que entrega el bus al registrarse; sin ella el bus rechaza los eventos
+        self._publish_key: Optional[str] = None
+        self._events_lock = threading.Lock()
+        # Conexiones keep-alive con el bus para registro, heartbeats y eventos; se crean al primer uso
+        self._bus_pool: Optional[ServiceConnectionPool] = None
+        self._bus_pool_lock = threading.Lock()
+        
         
         self._register_methods()
     
@@ -81,25 +163,54 @@ class SOAServiceBase(ABC):
                 self.methods[method_name] = getattr(self, attr_name)
                 self.logger.info(f"Método registrado: {method_name}")
     
+    def subscribe_event(self, topic: str, handler: Callable[[Dict[str, Any], str], Optional[bool]]):
+        """Suscribe el servicio a un tema. Debe llamarse antes de start_service: la suscripción viaja en el registro"""
+        self.event_handlers[topic] = handler
+    
+    def publish_event(self, topic: str, payload: Dict[str, Any]) -> bool:
+        """Publica un evento de dominio en el bus, que lo reparte a los suscriptores sin esperar a que lo procesen"""
+        body = json.dumps(payload, ensure_ascii=False, default=str)
+        for attempt in range(2):
+            # Un bus reiniciado cambia las claves: se pide la nueva sin volver a registrar la instancia
+            if self._publish_key is None or attempt:
+                self._fetch_publish_key()
+            try:
+                message = SOAProtocol.create_publish_request(topic, body, publish_key=self._publish_key)
+                response = self._send_to_soa_server(message)
+            except Exception as e:
+                self.logger.error(f"Error publicando evento {topic}: {e}")
+                return False
+            
+            if response.get('status') == 'success':
+                return True
+            if response.get('message') != "Unauthorized publisher":
+                break
+        
+        self.logger.warning(f"El bus no aceptó el evento {topic}: {response.get('message')}")
+        return False
+    
     def start_service(self):
+        if self.processes > 1:
+            if hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT'):
+                return self._start_prefork()
+            self.logger.warning("Prefork no disponible en esta plataforma (sin fork o SO_REUSEPORT), usando un solo proceso")
+        
         try:
             
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            
-            # In Docker, bind to 0.0.0.0 to accept connections from other containers
-            bind_host = '0.0.0.0' if self._is_running_in_docker() else self.host
-            self.socket.bind((bind_host, self.port))
+            self.socket = self._open_listener()
+            bind_host = self.socket.getsockname()[0]
             
             
             if self.port == 0:
                 self.port = self.socket.getsockname()[1]
             
-            self.socket.listen(5)
+            self.socket.listen(self.backlog)
+            self._listen_unix()
             self.running = True
+            self._start_workers()
             
             self.logger.info(f"Servicio '{self.service_name}' iniciado en {bind_host}:{self.port} (registrado como {self.host}:{self.port})")
-            self.logger.info("Usando protocolo NNNNNSSSSSDATOS")
+            self.logger.info(f"Usando protocolo NNNNNSSSSSDATOS ({self.workers} workers, cola de {self.queue_size}, backlog {self.backlog})")
             
             
             if self._register_with_soa_server():
@@ -107,82 +218,582 @@ class SOAServiceBase(ABC):
             else:
                 self.logger.warning("No se pudo registrar en el servidor SOA, pero el servicio continúa ejecutándose")
             
+            if self.heartbeat_interval > 0:
+                self._heartbeat_stop.clear()
+                threading.Thread(target=self._heartbeat_loop, daemon=True).start()
             
+            
+            self._accept_loop(self.socket, self.uds_socket)
+                        
+        except Exception as e:
+            self.logger.error(f"Error iniciando servicio: {e}")
+        finally:
+            self.stop_service()
+    
+    def _accept_loop(self, *listeners: Optional[socket.socket]):
+        """Acepta conexiones de todos los listeners; el que se quita del selector deja de aceptar"""
+        self._accept_selector = selectors.DefaultSelector()
+        for listener in listeners:
+            if listener is None:
+                continue
+            try:
+                # No bloqueante: con prefork otro proceso puede llevarse la conexión entre select() y accept()
+                listener.setblocking(False)
+                self._accept_selector.register(listener, selectors.EVENT_READ)
+            except (OSError, ValueError):
+                # La señal de parada llegó mientras arrancaba y el listener ya está cerrado
+                continue
+        
+        try:
             while self.running:
-                try:
-                    client_socket, address = self.socket.accept()
-                    self.logger.info(f"Nueva conexión desde {address}")
-                    
+                for key, _ in self._accept_selector.select(timeout=1.0):
+                    if not self.running:
+                        break
+                    try:
+                        client_socket, address = key.fileobj.accept()
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    except socket.error as e:
+                        if self.running:
+                            self.logger.error(f"Error aceptando conexión: {e}")
+                        continue
                     
-                    client_thread = threading.Thread(
-                        target=self._handle_client,
-                        args=(client_socket, address)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
+                    client_socket.setblocking(True)
+                    # En un socket Unix el peer no tiene dirección
+                    address = address or self.uds_path
+                    self.logger.info(f"Nueva conexión desde {address}")
                     
-                except socket.error as e:
-                    if self.running:
-                        self.logger.error(f"Error aceptando conexión: {e}")
-                        
+                    # Aunque la parada llegue ahora, la conexión ya es de este proceso: la atiende el drenaje
+                    self._pending_connections.append(ServiceConnection(client_socket, address))
+                    self._wake_poller()
+        finally:
+            self._accept_selector.close()
+    
+    def _stop_accepting(self):
+        # Los listeners dejan de vigilarse antes de cerrar nada: el socket Unix compartido sigue abierto para el
+        # resto de procesos, pero este ya no toma conexiones que no va a atender
+        selector = self._accept_selector
+        # get_map() devuelve None si el bucle de aceptación ya terminó y cerró el selector
+        mapping = selector.get_map() if selector is not None else None
+        if mapping is None:
+            return
+        for key in list(mapping.values()):
+            try:
+                selector.unregister(key.fileobj)
+            except (KeyError, ValueError, OSError):
+                pass
+    
+    def _open_listener(self, reuse_port: bool = False) -> socket.socket:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        
+        # In Docker, bind to 0.0.0.0 to accept connections from other containers
+        bind_host = '0.0.0.0' if self._is_running_in_docker() else self.host
+        listener.bind((bind_host, self.port))
+        return listener
+    
+    def _start_prefork(self):
+        """Proceso padre del modo prefork: no atiende peticiones, solo registra el servicio y supervisa a los hijos"""
+        try:
+            # Socket enlazado pero sin listen(): reserva el puerto (y lo resuelve si es 0) sin recibir conexiones
+            self.socket = self._open_listener(reuse_port=True)
+            if self.port == 0:
+                self.port = self.socket.getsockname()[1]
+            # El socket Unix no admite SO_REUSEPORT: los hijos heredan este y aceptan de la misma cola
+            self._listen_unix()
+            self.running = True
+            
+            # Se registra antes de crear los hijos para que hereden la clave de publicación del bus
+            if self._register_with_soa_server():
+                self.logger.info(f"Servicio registrado exitosamente en el servidor SOA")
+            else:
+                self.logger.warning("No se pudo registrar en el servidor SOA, pero el servicio continúa ejecutándose")
+            
+            for slot in range(self.processes):
+                self._spawn_child(slot)
+            
+            if threading.current_thread() is threading.main_thread():
+                signal.signal(signal.SIGTERM, self._handle_stop_signal)
+                signal.signal(signal.SIGINT, self._handle_stop_signal)
+            
+            self.logger.info(f"Servicio '{self.service_name}' en modo prefork: {self.processes} procesos en el puerto {self.port}")
+            
+            if self.heartbeat_interval > 0:
+                self._heartbeat_stop.clear()
+                threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+            
+            self._supervise_children()
+        
         except Exception as e:
             self.logger.error(f"Error iniciando servicio: {e}")
         finally:
             self.stop_service()
     
-    def _handle_client(self, client_socket: socket.socket, address):
+    def _handle_stop_signal(self, signum, frame):
+        self.running = False
+    
+    def _spawn_child(self, slot: int):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = slot
+            return
+        
+        # Proceso hijo: nunca vuelve al código del padre
+        exit_code = 0
         try:
-            data = client_socket.recv(4096)
-            if not data:
-                return
+            self._run_child(slot)
+        except BaseException as e:
+            self.logger.error(f"Proceso {slot} del servicio terminó con error: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    
+    def _run_child(self, slot: int):
+        self._children = {}
+        # Las conexiones con el bus heredadas del padre son suyas: el hijo abre las propias
+        self._bus_pool = None
+        self._bus_pool_lock = threading.Lock()
+        # Ctrl+C llega a todo el grupo de procesos; el hijo espera el SIGTERM del padre para drenar
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, self._handle_child_stop)
+        
+        # El socket del padre (enlazado, sin listen) solo reserva el puerto; el hijo abre el suyo
+        self.socket.close()
+        self.socket = self._open_listener(reuse_port=True)
+        self.socket.listen(self.backlog)
+        self.running = True
+        self._start_workers()
+        self.logger.info(f"Proceso {slot} (pid {os.getpid()}) atendiendo en el puerto {self.port}")
+        
+        self._accept_loop(self.socket, self.uds_socket)
+        
+        # Drenaje: los workers terminan lo que ya está en cola antes de leer la señal de parada
+        self._stop_workers()
+        deadline = time.time() + self.drain_timeout
+        for worker in self._worker_threads:
+            worker.join(max(0.0, deadline - time.time()))
+    
+    def _handle_child_stop(self, signum, frame):
+        # El hijo deja de aceptar en sus listeners y cierra el TCP propio; el resto de procesos sigue recibiendo
+        self.running = False
+        self._stop_accepting()
+        self.socket.close()
+    
+    def _supervise_children(self):
+        # waitpid bloqueante se reintenta tras cada señal (PEP 475): se sondea para poder salir con SIGTERM
+        while self.running:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                time.sleep(0.2)
+                continue
+            
+            slot = self._children.pop(pid, None)
+            if slot is None or not self.running:
+                continue
             
+            self.logger.warning(f"Proceso {slot} (pid {pid}) terminó inesperadamente (estado {status}), reiniciándolo")
+            # Pausa breve para no entrar en un bucle de reinicios si el hijo falla al arrancar
+            time.sleep(1.0)
+            self._spawn_child(slot)
+    
+    def _stop_children(self):
+        for pid in list(self._children):
             try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self._children.pop(pid, None)
+        
+        deadline = time.time() + self.drain_timeout
+        while self._children and time.time() < deadline:
+            for pid in list(self._children):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    self._children.pop(pid, None)
+            time.sleep(0.05)
+        
+        for pid in list(self._children):
+            self.logger.warning(f"Proceso {pid} no terminó de drenar a tiempo, forzando su cierre")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self._children.clear()
+    
+    def _listen_unix(self):
+        uds_path = SOAProtocol.uds_path(f"{self.service_name}-{self.port}")
+        if uds_path is None:
+            return
+        try:
+            self.uds_socket = SOAProtocol.listen_unix(uds_path, self.backlog)
+            self.uds_path = uds_path
+            self.logger.info(f"Escuchando también en el socket Unix {uds_path}")
+        except OSError as e:
+            self.logger.warning(f"No se pudo abrir el socket Unix {uds_path}, solo TCP: {e}")
+    
+    def _start_workers(self):
+        self._request_queue = queue.Queue(maxsize=self.queue_size)
+        self._reject_queue = queue.Queue(maxsize=self.queue_size)
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ, None)
+        
+        self._poller_thread = threading.Thread(target=self._poll_connections, daemon=True)
+        self._poller_thread.start()
+        # Los rechazos leen la petición del cliente antes de contestar BUSY; se hacen fuera del poller para no frenarlo
+        threading.Thread(target=self._reject_loop, daemon=True).start()
+        
+        self._worker_threads = []
+        for _ in range(self.workers):
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            worker.start()
+            self._worker_threads.append(worker)
+    
+    def _stop_workers(self):
+        if self._request_queue is None:
+            return
+        
+        # El poller entrega al salir las peticiones ya recibidas: las señales de parada tienen que ir detrás
+        self._wake_poller()
+        if self._poller_thread is not None and self._poller_thread is not threading.current_thread():
+            self._poller_thread.join(timeout=2.0)
+            self._hand_off_connections(list(self._pending_connections))
+            self._pending_connections.clear()
+        
+        for _ in self._worker_threads:
+            try:
+                self._request_queue.put_nowait(None)
+            except queue.Full:
+                break
+        try:
+            self._reject_queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._wake_poller()
+    
+    def _watch_connection(self, conn: ServiceConnection):
+        # Con el servicio deteniéndose nadie vigilaría la conexión: se cierra para no dejar al cliente esperando
+        if not self.running:
+            conn.close()
+            return
+        # Las conexiones se registran en el selector desde su propio hilo, así que se encolan y se le avisa
+        self._pending_connections.append(conn)
+        self._wake_poller()
+    
+    def _wake_poller(self):
+        try:
+            self._wakeup_writer.send(b"\0")
+        except (OSError, AttributeError):
+            pass
+    
+    def _poll_connections(self):
+        """Vigila las conexiones inactivas y pasa a la cola de workers las que tienen una petición lista"""
+        last_sweep = time.time()
+        while self.running:
+            for key, _ in self._selector.select(timeout=1.0):
+                if key.data is None:
+                    try:
+                        while self._wakeup_reader.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
                 
-                message_str = data.decode('utf-8')
-                self.logger.info(f"Mensaje raw recibido: {message_str}")
-                
-                
-                request = SOAProtocol.parse_request(message_str)
-                self.logger.info(f"Petición parseada: {request}")
-                
-                
-                response = self._process_request(request)
-                
-                
-                if response.get('status') == 'success':
-                    result_str = str(response.get('result', ''))
-                    
-                    if request.get('method') in ['add', 'subtract', 'multiply', 'divide']:
-                        params_str = request.get('params', '')
-                        if params_str and ' ' in params_str:
-                            parts = params_str.split()
-                            if len(parts) >= 2:
-                                operation_symbols = {
-                                    'add': '+',
-                                    'subtract': '-', 
-                                    'multiply': '*',
-                                    'divide': '/'
-                                }
-                                symbol = operation_symbols.get(request.get('method'), '?')
-                                result_str = f"{parts[0]} {symbol} {parts[1]} = {response.get('result')}"
-                    
-                    response_msg = SOAProtocol.create_response(self.service_name, True, result_str)
-                else:
-                    error_msg = response.get('message', 'Error desconocido')
-                    response_msg = SOAProtocol.create_response(self.service_name, False, error_msg=error_msg)
-                
-                self.logger.info(f"Enviando respuesta: {response_msg}")
-                client_socket.send(response_msg.encode('utf-8'))
-                
-            except Exception as e:
-                self.logger.error(f"Error procesando petición: {e}")
-                error_response = SOAProtocol.create_response(self.service_name, False, error_msg=f"Error del servicio: {str(e)}")
-                client_socket.send(error_response.encode('utf-8'))
-                
+                conn = key.data
+                self._selector.unregister(conn.sock)
+                self._dispatch(conn)
+            
+            while self._pending_connections:
+                conn = self._pending_connections.popleft()
+                conn.last_activity = time.time()
+                try:
+                    self._selector.register(conn.sock, selectors.EVENT_READ, conn)
+                except (ValueError, OSError):
+                    conn.close()
+            
+            now = time.time()
+            if now - last_sweep >= 1.0:
+                last_sweep = now
+                for key in list(self._selector.get_map().values()):
+                    conn = key.data
+                    if conn is not None and now - conn.last_activity > self.keep_alive_timeout:
+                        self.logger.info(f"Conexión con {conn.address} inactiva, cerrando")
+                        self._selector.unregister(conn.sock)
+                        conn.close()
+        
+        connections = [key.data for key in self._selector.get_map().values() if key.data is not None]
+        while self._pending_connections:
+            connections.append(self._pending_connections.popleft())
+        self._selector.close()
+        self._hand_off_connections(connections)
+    
+    def _hand_off_connections(self, connections):
+        """Al parar, las conexiones que ya traen una petición pasan a los workers, que drenan la cola; el resto se cierra"""
+        if not connections:
+            return
+        with selectors.DefaultSelector() as selector:
+            for conn in connections:
+                try:
+                    selector.register(conn.sock, selectors.EVENT_READ, conn)
+                except (OSError, ValueError):
+                    conn.close()
+            # Una conexión recién aceptada puede no haber recibido aún su petición: se le da un instante
+            fresh = any(not conn.keep_alive for conn in connections)
+            ready = {key.data for key, _ in selector.select(timeout=0.1 if fresh else 0)}
+        
+        for conn in connections:
+            if conn in ready:
+                try:
+                    self._request_queue.put_nowait(conn)
+                    continue
+                except queue.Full:
+                    pass
+            conn.close()
+    
+    def _dispatch(self, conn: ServiceConnection):
+        # También durante la parada: _stop_workers espera a que salga el poller antes de mandar las señales de parada
+        conn.ready_at = time.time()
+        try:
+            self._request_queue.put_nowait(conn)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected_requests += 1
+            self.logger.warning(f"Cola de peticiones llena, rechazando petición de {conn.address}")
+            try:
+                self._reject_queue.put_nowait(conn)
+            except queue.Full:
+                # Ni siquiera hay sitio para contestar BUSY: se corta la conexión y el cliente reintentará
+                conn.close()
+    
+    def _reject_loop(self):
+        while True:
+            conn = self._reject_queue.get()
+            if conn is None:
+                break
+            self._reject_busy(conn)
+    
+    def _reject_busy(self, conn: ServiceConnection):
+        try:
+            conn.sock.settimeout(self.retry_after)
+            if conn.byte_mode:
+                raw_message = SOAProtocol.recv_frame(conn.sock)
+            else:
+                raw_message = SOAProtocol.recv_message(conn.sock)
+            if raw_message is None:
+                conn.close()
+                return
+            
+            # El BUSY lleva el id de la petición para que un cliente con varias en vuelo sepa a cuál responde
+            call = SOAProtocol.peek_call(SOAProtocol.to_wire(raw_message, byte_mode=True))
+            busy_response = SOAProtocol.create_busy_response(self.service_name, self.retry_after,
+                                                             request_id=call.get('request_id') if call else None)
+            SOAProtocol.send_message(conn.sock, busy_response, conn.byte_mode)
         except Exception as e:
-            self.logger.error(f"Error manejando cliente {address}: {e}")
+            self.logger.error(f"Error rechazando petición de {conn.address}: {e}")
+            conn.close()
+            return
+        
+        if conn.keep_alive:
+            self._watch_connection(conn)
+        else:
+            conn.close()
+    
+    def _worker_loop(self):
+        while True:
+            conn = self._request_queue.get()
+            if conn is None:
+                break
+            
+            with self._stats_lock:
+                self.active_requests += 1
+            try:
+                keep_open = self._handle_frame(conn)
+            finally:
+                with self._stats_lock:
+                    self.active_requests -= 1
+                    self.completed_requests += 1
+            
+            if keep_open and self.running:
+                self._watch_connection(conn)
+            else:
+                conn.close()
+    
+    def get_load_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queued": self._request_queue.qsize() if self._request_queue else 0,
+                "active": self.active_requests,
+                "rejected": self.rejected_requests,
+                "completed": self.completed_requests,
+                "expired": self.expired_requests
+            }
+    
+    def _handle_frame(self, conn: ServiceConnection) -> bool:
+        """Atiende un frame de la conexión. Devuelve True si la conexión debe seguir abierta."""
+        client_socket = conn.sock
+        try:
+            client_socket.settimeout(self.keep_alive_timeout)
+            if conn.byte_mode:
+                raw_message = SOAProtocol.recv_frame(client_socket)
+            else:
+                raw_message = SOAProtocol.recv_message(client_socket)
+        except socket.timeout:
+            self.logger.info(f"Conexión con {conn.address} sin datos completos, cerrando")
+            return False
+        except Exception as e:
+            self.logger.error(f"Error manejando cliente {conn.address}: {e}")
+            return False
+        if raw_message is None:
+            return False
+        
+        action = None
+        try:
+            self.logger.info(f"Mensaje raw recibido: {raw_message}")
+            
+            
+            request = SOAProtocol.parse_request(raw_message)
+            self.logger.info(f"Petición parseada: {request}")
+            action = request.get('action')
+            
+            if action == 'keep_alive':
+                conn.keep_alive = True
+                requested = request.get('timeout')
+                timeout = min(requested, self.keep_alive_timeout) if requested else self.keep_alive_timeout
+                response_msg = SOAProtocol.create_response(self.service_name, True, f"keep-alive {timeout}")
+            elif action == 'byte_mode':
+                response_msg = SOAProtocol.create_response(self.service_name, True, "byte-mode")
+            else:
+                response_msg = self._respond_within_deadline(request, conn.ready_at, conn.address)
+            
+            self.logger.info(f"Enviando respuesta: {response_msg}")
+            
+        except Exception as e:
+            self.logger.error(f"Error procesando petición: {e}")
+            response_msg = SOAProtocol.create_response(self.service_name, False, error_msg=f"Error del servicio: {str(e)}")
+        
+        try:
+            SOAProtocol.send_message(client_socket, response_msg, conn.byte_mode)
+        except Exception as e:
+            self.logger.error(f"Error manejando cliente {conn.address}: {e}")
+            return False
+        
+        # La confirmación de bmode viaja aún en modo texto; a partir de aquí todo va en bytes
+        if action == 'byte_mode':
+            conn.byte_mode = True
+        
+        # Los frames de control no consumen la única petición de una conexión sin keep-alive
+        return conn.keep_alive or action in ('keep_alive', 'byte_mode')
+    
+    def handle_frame(self, raw_message: Union[str, bytes, bytearray]) -> str:
+        """Atiende un frame entregado en memoria por el bus (transporte en proceso) y devuelve el frame de respuesta"""
+        with self._stats_lock:
+            self.active_requests += 1
+        try:
+            request = SOAProtocol.parse_request(raw_message)
+            return self._respond_within_deadline(request, time.time(), "inproc")
+        except Exception as e:
+            self.logger.error(f"Error procesando petición: {e}")
+            return SOAProtocol.create_response(self.service_name, False, error_msg=f"Error del servicio: {str(e)}")
+        finally:
+            with self._stats_lock:
+                self.active_requests -= 1
+                self.completed_requests += 1
+    
+    def _respond_within_deadline(self, request: Dict[str, Any], ready_at: float, address) -> str:
+        timeout_ms = request.get('timeout_ms')
+        deadline = ready_at + timeout_ms / 1000.0 if timeout_ms is not None else None
+        
+        # Si el plazo venció mientras esperaba en cola, el llamante ya abandonó: no se gasta trabajo en responder
+        if deadline is not None and time.time() >= deadline:
+            with self._stats_lock:
+                self.expired_requests += 1
+            self.logger.warning(f"Petición de {address} descartada: plazo de {timeout_ms} ms agotado en cola")
+            return SOAProtocol.create_response(self.service_name, False,
+                                               error_msg="DEADLINE Plazo agotado antes de procesar la petición",
+                                               request_id=request.get('request_id'))
+        
+        self._request_context.deadline = deadline
+        try:
+            return self._build_response_message(request)
         finally:
-            client_socket.close()
+            self._request_context.deadline = None
+    
+    def time_remaining(self) -> Optional[float]:
+        """Segundos que quedan del plazo de la petición en curso, o None si no tiene plazo"""
+        deadline = getattr(self._request_context, 'deadline', None)
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.time())
+    
+    def _handle_event(self, request: Dict[str, Any]) -> str:
+        topic, event_id = request.get('topic'), request.get('request_id')
+        handler = self.event_handlers.get(topic)
+        if handler is None:
+            return SOAProtocol.create_response(self.service_name, False, error_msg=f"Sin suscripción a {topic}",
+                                               request_id=event_id)
+        
+        with self._events_lock:
+            duplicate = event_id is not None and event_id in self._handled_events
+        if duplicate:
+            return SOAProtocol.create_response(self.service_name, True, "duplicate", request_id=event_id)
+        
+        try:
+            payload = json.loads(request.get('payload') or "{}")
+            handled = handler(payload, event_id) is not False
+        except Exception as e:
+            self.logger.error(f"Error procesando evento {topic} ({event_id}): {e}")
+            handled = False
+        if not handled:
+            return SOAProtocol.create_response(self.service_name, False, error_msg=f"Evento {topic} no procesado",
+                                               request_id=event_id)
+        
+        if event_id is not None:
+            with self._events_lock:
+                self._handled_events[event_id] = True
+                while len(self._handled_events) > 1024:
+                    self._handled_events.popitem(last=False)
+        return SOAProtocol.create_response(self.service_name, True, "processed", request_id=event_id)
+    
+    def _build_response_message(self, request: Dict[str, Any]) -> str:
+        if request.get('action') == 'event':
+            return self._handle_event(request)
+        
+        response = self._process_request(request)
+        request_id = request.get('request_id')
+        
+        
+        if response.get('status') == 'success':
+            result_str = str(response.get('result', ''))
+            
+            if request.get('method') in ['add', 'subtract', 'multiply', 'divide']:
+                params_str = request.get('params', '')
+                if params_str and ' ' in params_str:
+                    parts = params_str.split()
+                    if len(parts) >= 2:
+                        operation_symbols = {
+                            'add': '+',
+                            'subtract': '-', 
+                            'multiply': '*',
+                            'divide': '/'
+                        }
+                        symbol = operation_symbols.get(request.get('method'), '?')
+                        result_str = f"{parts[0]} {symbol} {parts[1]} = {response.get('result')}"
+            
+            return SOAProtocol.create_response(self.service_name, True, result_str, request_id=request_id)
+        
+        error_msg = response.get('message', 'Error desconocido')
+        return SOAProtocol.create_response(self.service_name, False, error_msg=error_msg, request_id=request_id)
     
     def _process_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
         method_name = request.get('method')
@@ -244,45 +855,58 @@ class SOAServiceBase(ABC):
                 "message": f"Error executing method '{method_name}': {str(e)}"
             }
     
+    def _get_bus_pool(self) -> ServiceConnectionPool:
+        with self._bus_pool_lock:
+            if self._bus_pool is None:
+                self._bus_pool = ServiceConnectionPool(self.soa_server_host, self.soa_server_port, max_size=4,
+                                                       uds_path=SOAProtocol.uds_path(f"soa_bus-{self.soa_server_port}"))
+            return self._bus_pool
+    
+    def _close_bus_pool(self):
+        with self._bus_pool_lock:
+            if self._bus_pool is not None:
+                self._bus_pool.close()
+                self._bus_pool = None
+    
+    def _send_to_soa_server(self, message: str) -> Dict[str, Any]:
+        response_str = self._get_bus_pool().request(message)
+        return SOAProtocol.parse_response(response_str or "")
+    
     def _register_with_soa_server(self) -> bool:
         try:
-            soa_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            soa_socket.connect((self.soa_server_host, self.soa_server_port))
-            
-            
-            registration_data = f"{self.host}:{self.port}:{self.service_name}:{self.description}"
-            registration_msg = SOAProtocol.encode_message("rgstr", registration_data)
-            
-            soa_socket.send(registration_msg.encode('utf-8'))
-            
-            response_data = soa_socket.recv(4096)
-            response_str = response_data.decode('utf-8')
-            response = SOAProtocol.parse_response(response_str)
-            
-            soa_socket.close()
+            registration_msg = SOAProtocol.create_register_request(self.service_name, self.host, self.port,
+                                                                   self.description, sorted(self.methods),
+                                                                   self.uds_path, sorted(self.event_handlers))
+            response = self._send_to_soa_server(registration_msg)
             
+            if response.get('publish_key'):
+                self._publish_key = response['publish_key']
             return response.get('status') == 'success'
             
         except Exception as e:
             self.logger.error(f"Error registrándose con servidor SOA: {e}")
             return False
     
+    def _fetch_publish_key(self) -> bool:
+        """Pide al bus la clave de publicación de esta instancia; solo se vuelve a registrar si el bus no la conoce"""
+        try:
+            request = SOAProtocol.create_publish_key_request(self.service_name, self.host, self.port)
+            response = self._send_to_soa_server(request)
+        except Exception as e:
+            self.logger.error(f"Error pidiendo la clave de publicación al servidor SOA: {e}")
+            return False
+        
+        if response.get('publish_key'):
+            self._publish_key = response['publish_key']
+            return True
+        # Bus reiniciado o instancia expulsada: el registro devuelve también la clave
+        return self._register_with_soa_server()
+    
     def _unregister_from_soa_server(self) -> bool:
         try:
-            soa_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            soa_socket.connect((self.soa_server_host, self.soa_server_port))
-            
-            
-            unregistration_data = f"unregister:{self.service_name}"
-            unregistration_msg = SOAProtocol.encode_message("unrgs", unregistration_data)
-            
-            soa_socket.send(unregistration_msg.encode('utf-8'))
-            
-            response_data = soa_socket.recv(4096)
-            response_str = response_data.decode('utf-8')
-            response = SOAProtocol.parse_response(response_str)
-            
-            soa_socket.close()
+            # Solo se da de baja esta instancia; otras réplicas del mismo servicio siguen registradas
+            unregistration_msg = SOAProtocol.create_unregister_request(self.service_name, f"{self.host}:{self.port}")
+            response = self._send_to_soa_server(unregistration_msg)
             
             return response.get('status') == 'success'
             
@@ -290,14 +914,38 @@ class SOAServiceBase(ABC):
             self.logger.error(f"Error desregistrándose del servidor SOA: {e}")
             return False
     
+    def _heartbeat_loop(self):
+        heartbeat_msg = SOAProtocol.create_heartbeat_request(self.service_name, self.host, self.port)
+        
+        while not self._heartbeat_stop.wait(self.heartbeat_interval):
+            try:
+                response = self._send_to_soa_server(heartbeat_msg)
+            except Exception as e:
+                # Bus caído: se sigue intentando; al volver responderá que no conoce la instancia
+                self.logger.warning(f"No se pudo enviar heartbeat al servidor SOA: {e}")
+                continue
+            
+            if response.get('status') != 'success':
+                self.logger.info(f"El servidor SOA no reconoce la instancia ({response.get('message')}), re-registrando")
+                if self._register_with_soa_server():
+                    self.logger.info("Servicio re-registrado en el servidor SOA")
+    
     def stop_service(self):
         self.running = False
+        self._heartbeat_stop.set()
+        self._stop_workers()
         
+        # Primero se sale del bus para que no lleguen peticiones nuevas y luego drenan los procesos hijos
         if self._unregister_from_soa_server():
             self.logger.info("Servicio desregistrado exitosamente del servidor SOA")
+        self._close_bus_pool()
+        self._stop_children()
         
         if self.socket:
             self.socket.close()
+        if self.uds_socket:
+            self.uds_socket.close()
+            SOAProtocol.unlink_unix(self.uds_path)
         
         self.logger.info(f"Servicio '{self.service_name}' detenido")
     
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Arranque en un solo proceso: el bus y todos los servicios habilitados en ServicesConfig comparten proceso y las
+llamadas del bus a los servicios viajan en memoria (mismos frames, sin sockets ni esperas de registro).
+Pensado para despliegues de un solo nodo, pruebas y para medir cuánto cuesta la capa de red.
+
+Los clientes (gateway, soa_client.py) siguen conectándose al bus por TCP como siempre.
+"""
+
+import importlib
+import logging
+import sys
+from typing import List
+from services_config import ServicesConfig
+from soa_server import create_server
+from soa_service_base import SOAServiceBase
+
+logger = logging.getLogger('SOA_InProcess')
+
+def load_services(config: ServicesConfig) -> List[SOAServiceBase]:
+    """Instancia las clases de servicio de la configuración, en orden de dependencias"""
+    services = []
+    for service_id in config.get_startup_order():
+        if service_id == 'soa_server':
+            continue
+
+        service_config = config.get_service(service_id)
+        module_name, class_name = service_config.get('module'), service_config.get('class')
+        if not module_name or not class_name:
+            logger.warning(f"Servicio {service_id} sin 'module'/'class' en la configuración, se omite")
+            continue
+
+        try:
+            service_class = getattr(importlib.import_module(module_name), class_name)
+            services.append(service_class(host=service_config.get('host', 'localhost'),
+                                          port=service_config.get('port', 0)))
+        except Exception as e:
+            logger.error(f"Error cargando {service_id} ({module_name}.{class_name}): {e}")
+    return services
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    threaded = True if '--threaded' in sys.argv else None
+
+    config = ServicesConfig()
+    soa_server = config.get_service('soa_server')
+    server = create_server(host=soa_server.get('host', 'localhost'), port=soa_server.get('port', 8000),
+                           threaded=threaded)
+
+    for service in load_services(config):
+        result = server.attach_local_service(service)
+        if result.get('status') != 'success':
+            logger.error(f"No se pudo registrar {service.service_name}: {result.get('message')}")
+
+    print(f"🚀 Bus SOA en {server.host}:{server.port} con {len(server.services_registry)} servicios en proceso")
+    try:
+        server.start_server()
+    except KeyboardInterrupt:
+        print("\n👋 Deteniendo...")
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,9 @@ from typing import List
 class SOALauncher:
     def __init__(self):
         self.processes: List[subprocess.Popen] = []
+        # Todos los procesos corren en esta máquina: bus y servicios se hablan también por sockets Unix
+        if os.name != 'nt':
+            os.environ.setdefault('SOA_UDS_DIR', '/tmp/soa_uds')
 
     def start_server(self):
         print("🚀 Iniciando servidor SOA principal...")